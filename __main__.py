@@ -7,6 +7,11 @@ import argparse
 
 from memory_analyses.retrieval_model import main as mle_main
 from config.retrieval import config as mle_config
+from memory_analyses.benchmark import main as benchmark_main
+from config.benchmark import config as benchmark_config
+from memory_analyses.simulate import main as simulate_main
+from memory_analyses.server import main as serve_main
+from config.simulate import config as simulate_config
 
 from memory_analyses.utilities.logging import initialise_logger
 
@@ -17,9 +22,46 @@ def parse_args():
     subparsers = parser.add_subparsers(dest='command')
    
     group1 = subparsers.add_parser('fit', help='Fit the retrieval model comparisons to the experimental data')
-    group1.add_argument('condition', choices=['all', 'collapse', 'first'], help='Which dataset would you like to perform the model comaprison for?')
+    group1.add_argument('condition', nargs='?', choices=['all', 'collapse', 'first'], help='Which dataset would you like to perform the model comaprison for?')
+    group1.add_argument('--conditions', default=None, help='Comma-separated conditions to compare models for in one run, sharing the loaded data (e.g. all,collapse,first)')
+    group1.add_argument('--jobs', type=int, default=1, help='Number of processes to fit participants with')
+    group1.add_argument('--no-cache', action='store_true', help='Parse the transition table without reading or writing its binary cache')
+    group1.add_argument('--no-store', action='store_true', help='Refit every participant, without reading or writing stored fit results')
+    group1.add_argument('--warm-start', action='store_true', help='Start each model from the best fit of the smaller models nested within it')
+    group1.add_argument('--starts', type=int, default=1, help='Run the optimiser from this many of the best points on a coarse grid of starting weights')
+    group1.add_argument('--input', choices=['table', 'matrices'], default='table', help='Fit to the transition table, or to raw sequences using similarity matrices')
+    group1.add_argument('--representations', default=None, help='Comma-separated representations to compare (default: as in config/retrieval.py), or discover to compare every representation in the data')
+    group1.add_argument('--search', choices=['exhaustive', 'forward', 'bic'], default='exhaustive', help='How to search over subsets of the representations')
+    group1.add_argument('--max-size', type=int, default=None, help='The largest number of representations to combine in a model')
+    group1.add_argument('--engine', choices=['segment', 'logspace', 'loop', 'topk', 'compact'], default='segment', help='How to evaluate retrieval strengths (logspace avoids underflow, topk approximates large remaining sets, compact stores float32)')
+    group1.add_argument('--compact', action='store_true', help='Store similarities as float32, shared between the processes through memory-mapped files')
+    group1.add_argument('--cv', action='store_true', help='Also score each model on held-out lists, leaving out one list of each participant at a time')
+    group1.add_argument('--export-strengths', action='store_true', help='Export the log retrieval strength of every transition under each fitted model')
+    group1.add_argument('--bootstrap', choices=['participants', 'transitions'], default=None, help='Bootstrap confidence intervals by resampling participants, or the transitions within each participant')
+    group1.add_argument('--resamples', type=int, default=None, help='With --bootstrap, the number of resamples (default: as in config/retrieval.py)')
+    group1.add_argument('--bootstrap-output', default=None, help='With --bootstrap, the CSV to write the confidence intervals to (default: as in config/retrieval.py)')
+    group1.add_argument('--top-k', type=int, default=None, help='With --engine topk, the number of most similar remaining items to sum exactly')
+    group1.add_argument('--fit-log', default=None, help='Write the timings and optimiser diagnostics of every new fit to this CSV (e.g. data/fit_log.csv)')
+
+    group2 = subparsers.add_parser('benchmark', help='Time the model fitting pipeline on synthetic data')
+    group2.add_argument('--sizes', default=None, help='Comma-separated names of the sizes to run (default: all sizes in config/benchmark.py)')
+   
+    group3 = subparsers.add_parser('simulate', help='Simulate retrieval sequences from the model with known attention weights')
+    group3.add_argument('--participants', type=int, default=None, help='The number of participants to simulate (default: as in config/simulate.py)')
+    group3.add_argument('--seed', type=int, default=None, help='Random seed')
    
+    group4 = subparsers.add_parser('serve', help='Keep the data loaded and the fitting workers running, and fit models on request over localhost HTTP')
+    group4.add_argument('--port', type=int, default=None, help='The localhost port to listen on (default: as in config/retrieval.py)')
+    group4.add_argument('--jobs', type=int, default=1, help='Number of processes to fit participants with')
+    group4.add_argument('--no-store', action='store_true', help='Refit every participant, without reading or writing stored fit results')
+    group4.add_argument('--compact', action='store_true', help='Store similarities as float32, shared between the processes through memory-mapped files')
+    group4.add_argument('--input', choices=['table', 'matrices'], default='table', help='Fit to the transition table, or to raw sequences using similarity matrices')
+    group4.add_argument('--fit-log', default=None, help='Write the timings and optimiser diagnostics of every new fit to this CSV (e.g. data/fit_log.csv)')
+
     args = parser.parse_args()
+
+    if args.command == 'fit' and args.condition is None and args.conditions is None:
+        group1.error('give a condition, or several with --conditions')
    
     return args
 
@@ -28,7 +70,59 @@ def determine_test(test, args):
    
     if test == 'fit':
         mle_config['condition'] = args.condition
+        if args.conditions is not None:
+            mle_config['conditions'] = args.conditions.split(',')
+        mle_config['jobs'] = args.jobs
+        mle_config['cache'] = not args.no_cache
+        mle_config['warm_start'] = args.warm_start
+        mle_config['engine'] = args.engine
+        if args.representations is not None:
+            mle_config['representations'] = 'discover' if args.representations == 'discover' else args.representations.split(',')
+        mle_config['search'] = args.search
+        mle_config['max_size'] = args.max_size
+        if args.top_k is not None:
+            mle_config['engine_args'] = dict(mle_config.get('engine_args') or {}, top_k=args.top_k)
+        mle_config['input'] = args.input
+        mle_config['cv'] = args.cv
+        mle_config['export_strengths'] = args.export_strengths
+        mle_config['compact'] = args.compact
+        if args.bootstrap is not None:
+            mle_config['bootstrap'] = dict(mle_config.get('bootstrap') or {}, method=args.bootstrap)
+            if args.resamples is not None:
+                mle_config['bootstrap']['n_resamples'] = args.resamples
+            if args.bootstrap_output is not None:
+                mle_config['bootstrap']['output'] = args.bootstrap_output
+        if args.starts > 1:
+            mle_config['multi_start'] = {'n_starts': args.starts}
+        if args.no_store:
+            mle_config['fit_store'] = None
+        if args.fit_log is not None:
+            mle_config['fit_log'] = args.fit_log
         mle_main(mle_config)
+
+    elif test == 'benchmark':
+        if args.sizes:
+            benchmark_config['run_sizes'] = args.sizes.split(',')
+        benchmark_main(benchmark_config)
+
+    elif test == 'simulate':
+        if args.participants is not None:
+            simulate_config['n_participants'] = args.participants
+        if args.seed is not None:
+            simulate_config['seed'] = args.seed
+        simulate_main(simulate_config)
+
+    elif test == 'serve':
+        mle_config['jobs'] = args.jobs
+        mle_config['compact'] = args.compact
+        mle_config['input'] = args.input
+        if args.port is not None:
+            mle_config['serve_port'] = args.port
+        if args.no_store:
+            mle_config['fit_store'] = None
+        if args.fit_log is not None:
+            mle_config['fit_log'] = args.fit_log
+        serve_main(mle_config)
    
     else:
         raise NotImplementedError
@@ -0,0 +1,27 @@
+config = {
+
+    # benchmark results are appended to this log, and compared against the last run of each size
+    'results_log': 'data/benchmarks.csv',
+
+    # the quicker stages are repeated, keeping the fastest time
+    'repeats': 3,
+    'n_evaluations': 100,
+
+    # synthetic transition tables to benchmark (see memory_analyses.data.synthetic.generate_transition_table)
+    'sizes': {
+        'small': {
+            'table': {'n_participants': 10, 'n_lists': 2, 'list_length': 15, 'n_representations': 3},
+        },
+        'medium': {
+            'table': {'n_participants': 50, 'n_lists': 3, 'list_length': 30, 'n_representations': 3},
+        },
+        'large_remaining': {
+            'table': {'n_participants': 10, 'n_lists': 2, 'list_length': 30, 'remaining_size': 500, 'n_representations': 3},
+        },
+        'many_representations': {
+            'table': {'n_participants': 10, 'n_lists': 2, 'list_length': 15, 'n_representations': 8},
+            'comparison': False,
+        },
+    },
+
+}
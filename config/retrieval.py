@@ -1,5 +1,62 @@
 config = {
    
     'transition_table': 'data/transition_probs.csv',
+
+    # alternatively ('input': 'matrices'), build the transitions from raw retrieval sequences and look up
+    # similarities from memory-mapped item-by-item matrices (see memory_analyses.data.sequences)
+    'input': 'table',
+    'sequences': 'data/sequences.csv',
+    'similarity_matrices': {
+        'cooc': 'data/representations/cooc.npy',
+        'w2v': 'data/representations/w2v.npy',
+        'hier': 'data/representations/hier.npy',
+    },
+
+    # the representations to compare, in the order of the comparison table ('discover' for every representation with
+    # similarities in the data), and how to search over subsets of them: 'exhaustive', 'forward' (stepwise) or 'bic'
+    # (see memory_analyses.models.search)
+    'representations': ['cooc', 'w2v', 'hier'],
+    'search': 'exhaustive',
+    'max_size': None,
+
+    # with --warm-start, the number of participants of each warm-started model that are also fitted from a cold
+    # start, to report the iterations and evaluations saved
+    'warm_start_check': 5,
+
+    # store the similarities as float32, with a single copy shared by the fitting processes (see memory_analyses.data.shared)
+    'compact': False,
+
+    # cache the parsed transition table next to the CSV (see memory_analyses.data.transitions)
+    'cache': True,
+
+    # store each participant's fit as it finishes, so that runs can be resumed (None to disable)
+    'fit_store': 'data/fit_results.sqlite',
+
+    # leave-one-list-out cross-validation within each participant, and where to write the held-out loss of each fold
+    'cv': False,
+    'cv_results': 'data/cv_results.csv',
+
+    # export the log retrieval strength of every transition under each fitted model and the baseline model, as
+    # memory-mappable columns aligned with the input rows (see memory_analyses.data.strengths)
+    'export_strengths': False,
+    'strengths_output': 'data/retrieval_strengths',
+
+    # bootstrap confidence intervals for the BIC improvement and mean weights of each model, with the method set by
+    # --bootstrap (None to disable): resample 'participants' (reusing their fits) or the 'transitions' of each
+    # participant (refitting every model). The intervals are logged, and written to output (unless it is None)
+    'bootstrap': {
+        'method': None,
+        'n_resamples': 1000,
+        'confidence': 0.95,
+        'seed': 0,
+        'output': 'data/bootstrap_results.csv',
+    },
+
+    # the localhost port of the fitting service (see memory_analyses.server)
+    'serve_port': 8765,
+
+    # where to write the timings, evaluation counts and optimiser diagnostics of each fit (e.g. 'data/fit_log.csv', as
+    # set by --fit-log), or None for no fit log
+    'fit_log': None,
    
 }
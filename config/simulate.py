@@ -0,0 +1,23 @@
+config = {
+
+    # the item-by-item similarity matrices to simulate from (None for random matrices, which are saved to
+    # the matrices_dir so that the sequences can be fitted with the matrices input)
+    'similarity_matrices': None,
+    'n_items': 200,
+    'matrices_dir': 'data/simulated/representations',
+
+    # the true attention weight of each representation
+    'weights': {'cooc': 0.5, 'w2v': 2., 'hier': 1.},
+
+    # the simulated participants (see memory_analyses.data.synthetic.simulate_sequences)
+    'n_participants': 1000,
+    'n_lists': 2,
+    'list_length': 15,
+    'seed': 0,
+
+    # the simulated sequences, and (None to skip) a transition table in the format of transition_probs.csv,
+    # written with its binary cache so that it is never parsed
+    'sequences': 'data/simulated/sequences.csv',
+    'transition_table': 'data/simulated/transition_probs.csv',
+
+}
@@ -0,0 +1,182 @@
+"""
+Benchmark the model fitting pipeline on synthetic transition tables, recording the timings so that
+changes can be checked for regressions
+"""
+
+import io
+import os
+import json
+import time
+import shutil
+import logging
+import platform
+import tempfile
+import contextlib
+import datetime
+
+import numpy as np
+import pandas as pd
+import scipy
+
+from memory_analyses.data.blocks import group_participants
+from memory_analyses.data.synthetic import generate_transition_table
+from memory_analyses.data.transitions import read_transition_table
+from memory_analyses.models.loss import negative_log_likelihood
+from memory_analyses.models.optimise import ScipyMinimiser
+from memory_analyses.models.sam import MultiProbeRetrievalModel
+from memory_analyses.models.fitting import run_model
+from memory_analyses.retrieval_model import main as retrieval_main
+from memory_analyses.utilities.logging import ResultsLogger
+
+# the timed stages of each benchmark (the other results describe the data and the fits)
+STAGES = ('parse', 'load_cached', 'prepare', 'evaluate', 'fit_participant', 'comparison')
+
+def _time(func, repeats=1):
+    """
+    Time a function, keeping the fastest of several repeats
+
+    Returns:
+        (float): The fastest time, in seconds
+        (object): The function's result (from the last repeat)
+    """
+
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+def _environment():
+    """Describe the environment the benchmarks are run in"""
+
+    return json.dumps({
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'scipy': scipy.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+    })
+
+def _previous_results(filepath, size_name):
+    """Find the most recent timings recorded for a benchmark size (or None)"""
+
+    if not os.path.isfile(filepath):
+        return None
+
+    log = pd.read_csv(filepath)
+    log = log[(log['Analysis'] == 'benchmark') & (log['Model Name'] == size_name)]
+
+    if log.shape[0] == 0:
+        return None
+
+    return json.loads(log['Results'].iloc[-1])
+
+def benchmark_size(size, workdir, repeats=3, n_evaluations=100, comparison=True):
+    """
+    Time each stage of the fitting pipeline on a synthetic transition table
+
+    Arguments:
+        size (dict): Arguments for generate_transition_table (e.g. n_participants, list_length)
+        workdir (str): A directory to write the synthetic table to
+        repeats (int): The number of times to repeat the quicker stages (the fastest is kept)
+        n_evaluations (int): The number of objective evaluations to average over
+        comparison (bool): Whether or not to time the full model comparison (every subset of the representations)
+
+    Returns:
+        (dict): The time of each stage in seconds, the size of the table, and the mean absolute error of the
+            recovered attention weights
+    """
+
+    table, weights = generate_transition_table(**size)
+    representations = list(weights)
+
+    path = os.path.join(workdir, 'transition_probs.csv')
+    table.to_csv(path, index=False)
+
+    results = {'transitions': table.shape[0]}
+
+    # loading: parsing the CSV, and reading the binary cache once it has been written
+    results['parse'], (data, remaining) = _time(lambda: read_transition_table(path, cache=False), repeats)
+    read_transition_table(path)
+    results['load_cached'], _ = _time(lambda: read_transition_table(path), repeats)
+
+    data['participant'] = data['id'] + '_' + data['listnum'].astype(str)
+    order, blocks = group_participants(data['participant'].values)
+    data = data.iloc[order].reset_index(drop=True)
+    remaining = {rep: sims.take(order) for rep, sims in remaining.items()}
+    results['remaining_items'] = int(remaining[representations[0]].values.shape[0])
+
+    # a single evaluation of the objective at the true weights, over every transition
+    k = len(representations)
+    model = MultiProbeRetrievalModel(
+        probe_configs=None,
+        optimiser=ScipyMinimiser({'method': 'SLSQP', 'x0': [0] * k, 'bounds': [(0, None)] * k}),
+        loss_func=negative_log_likelihood,
+        learn_weights=True,
+    )
+    current_sims = [data[f'{rep}_similarity'].values for rep in representations]
+    subs_sims = [remaining[rep] for rep in representations]
+
+    results['prepare'], prepared = _time(lambda: model.prepare(current_sims, subs_sims), repeats)
+
+    true_weights = np.array([weights[rep] for rep in representations])
+    evaluations, _ = _time(
+        lambda: [model._fit_and_evaluate(true_weights, prepared) for _ in range(n_evaluations)], repeats)
+    results['evaluate'] = evaluations / n_evaluations
+
+    # fitting the full model to each participant
+    fit_time, fits = _time(lambda: run_model(data, representations, remaining, blocks))
+    results['fit_participant'] = fit_time / len(blocks)
+    results['weight_error'] = float(np.abs(fits[representations].values.astype(float) - true_weights).mean())
+
+    # the full model comparison, as run by retrieval_model.main
+    if comparison:
+        config = {
+            'transition_table': path, 'condition': 'all', 'representations': representations, 'cache': True,
+            'fit_store': None,
+        }
+        with contextlib.redirect_stdout(io.StringIO()):
+            results['comparison'], _ = _time(lambda: retrieval_main(config))
+
+    return results
+
+def main(config):
+    """Main entrypoint to script"""
+
+    results_logger = ResultsLogger(config['results_log'])
+    results_logger.create_if_not_exists()
+
+    environment = _environment()
+
+    for name, settings in config['sizes'].items():
+
+        if config.get('run_sizes') and name not in config['run_sizes']:
+            continue
+
+        logging.info('*** BENCHMARK {0}: {1} ***'.format(name, settings))
+
+        workdir = tempfile.mkdtemp(prefix='benchmark_')
+        try:
+            results = benchmark_size(
+                settings['table'], workdir, repeats=config.get('repeats', 3),
+                n_evaluations=config.get('n_evaluations', 100), comparison=settings.get('comparison', True),
+            )
+        finally:
+            shutil.rmtree(workdir)
+
+        # compare against the last recorded run of the same size
+        previous = _previous_results(config['results_log'], name)
+
+        for stage, seconds in results.items():
+            message = '{0}: {1:.6g}'.format(stage, seconds)
+            if stage in STAGES and previous is not None and previous.get(stage):
+                message += ' ({0:.2f}x the previous run)'.format(seconds / previous[stage])
+            logging.info(message)
+
+        results_logger.add(
+            datetime.datetime.now().isoformat(), 'benchmark', name, 'MultiProbeRetrievalModel',
+            json.dumps(settings), environment, json.dumps(results), '',
+        )
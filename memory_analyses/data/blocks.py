@@ -0,0 +1,127 @@
+"""Contiguous blocks of transitions for each participant"""
+
+import numpy as np
+import pandas as pd
+
+# the ways that transitions can be grouped into participants (see condition_blocks)
+CONDITIONS = ('all', 'collapse', 'first')
+
+class ParticipantBlocks(object):
+    """
+    The transitions of each participant, stored as contiguous [start, stop) ranges of rows.
+    Iterating over the blocks yields (participant, start, stop) tuples
+
+    Arguments:
+        participants (np.ndarray): The participant of each block
+        starts (np.ndarray): The first row of each block
+        stops (np.ndarray): One past the last row of each block
+    """
+
+    def __init__(self, participants, starts, stops):
+        super(ParticipantBlocks, self).__init__()
+        self.participants = np.asarray(participants)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.stops = np.asarray(stops, dtype=np.int64)
+
+    def __len__(self):
+        return self.participants.shape[0]
+
+    def __iter__(self):
+        return zip(self.participants, self.starts, self.stops)
+
+    @property
+    def sizes(self):
+        """The number of transitions in each block"""
+
+        return self.stops - self.starts
+
+def group_participants(participants):
+    """
+    Group transitions into a contiguous block for each participant, in order of first appearance.
+    The order of transitions within each participant is preserved
+
+    Arguments:
+        participants (np.ndarray): The participant of each transition
+
+    Returns:
+        (np.ndarray): An ordering of the transitions which makes each participant's transitions contiguous
+        (ParticipantBlocks): The participant blocks, as rows of the reordered transitions
+    """
+
+    codes, labels = pd.factorize(participants)
+
+    order = np.argsort(codes, kind='stable')
+
+    sizes = np.bincount(codes, minlength=len(labels))
+    stops = np.cumsum(sizes)
+    starts = stops - sizes
+
+    return order, ParticipantBlocks(np.asarray(labels), starts, stops)
+
+def sort_by_list(ids, listnums):
+    """
+    Order transitions by participant (in order of first appearance) and then by list, preserving the
+    order of transitions within each list. After this ordering, the participants of every condition
+    (see condition_blocks) are contiguous ranges of rows
+
+    Arguments:
+        ids (np.ndarray): The participant id of each transition
+        listnums (np.ndarray): The list number of each transition
+
+    Returns:
+        (np.ndarray): The ordering of the transitions
+    """
+
+    codes, _ = pd.factorize(ids)
+
+    return np.lexsort((listnums, codes))
+
+def condition_blocks(ids, listnums, condition):
+    """
+    Group transitions that have been ordered by sort_by_list into participant blocks for a condition,
+    without copying or reordering them
+
+    Arguments:
+        ids (np.ndarray): The participant id of each (ordered) transition
+        listnums (np.ndarray): The list number of each (ordered) transition
+        condition (str): 'all' (each list is a participant), 'collapse' (each id is a participant, over
+            all of their lists) or 'first' (each id is a participant, using their first list only)
+
+    Returns:
+        (ParticipantBlocks): The participant blocks
+    """
+
+    ids = np.asarray(ids)
+    listnums = np.asarray(listnums)
+    n = ids.shape[0]
+
+    # the first transition of each id, and of each list
+    new_id = np.ones(n, dtype=bool)
+    new_id[1:] = ids[1:] != ids[:-1]
+    new_list = new_id.copy()
+    new_list[1:] |= listnums[1:] != listnums[:-1]
+
+    id_starts = np.flatnonzero(new_id)
+    list_starts = np.flatnonzero(new_list)
+
+    if condition == 'all':
+        starts = list_starts
+        stops = np.append(list_starts[1:], n)
+        participants = (pd.Series(ids[starts]) + '_' + pd.Series(listnums[starts]).astype(str)).values
+
+    elif condition == 'collapse':
+        starts = id_starts
+        stops = np.append(id_starts[1:], n)
+        participants = ids[starts]
+
+    elif condition == 'first':
+        starts = id_starts
+        # each id's first list ends where its second list (or the next id) starts
+        following = np.searchsorted(list_starts, starts, side='right')
+        stops = np.append(list_starts, n)[following]
+        participants = ids[starts]
+
+    else:
+        raise NotImplementedError
+
+    return ParticipantBlocks(participants, starts, stops)
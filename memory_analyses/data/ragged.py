@@ -0,0 +1,178 @@
+"""Ragged arrays for storing the similarities between each retrieval and the remaining items"""
+
+import hashlib
+
+import numpy as np
+
+class RaggedArray(object):
+    """
+    A ragged array of floats, stored as a flat array of values plus row offsets.
+    Row i holds values[offsets[i]:offsets[i + 1]]. Values are stored as float64, unless they are
+    already floats of another precision (e.g. compact float32 similarities)
+
+    Arguments:
+        values (np.ndarray): A flat array holding the values for every row
+        offsets (np.ndarray): Row offsets into values (one longer than the number of rows)
+        digests (np.ndarray): Optionally, the digest of each row's values (see row_digests), which
+            subsets of the rows keep
+    """
+
+    def __init__(self, values, offsets, digests=None):
+        super(RaggedArray, self).__init__()
+        self.values = np.asarray(values)
+        if self.values.dtype.kind != 'f':
+            self.values = self.values.astype(float)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.digests = digests
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    @property
+    def lengths(self):
+        """The number of values in each row"""
+
+        return np.diff(self.offsets)
+
+    def row(self, i):
+        """Get the values for a single row"""
+
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    def slice(self, start, stop):
+        """
+        Get a contiguous range of rows, without copying the values
+
+        Arguments:
+            start (int): The first row
+            stop (int): One past the last row
+
+        Returns:
+            (RaggedArray): The rows [start, stop), as a view onto this array
+        """
+
+        offsets = self.offsets[start:stop + 1]
+        digests = None if self.digests is None else self.digests[start:stop]
+
+        return RaggedArray(self.values[offsets[0]:offsets[-1]], offsets - offsets[0], digests)
+
+    def take(self, rows):
+        """
+        Gather a subset of rows into a new RaggedArray
+
+        Arguments:
+            rows (np.ndarray): Positional indices of the rows to take
+
+        Returns:
+            (RaggedArray): The requested rows (a view if the rows are contiguous, otherwise a copy)
+        """
+
+        rows = np.asarray(rows, dtype=np.int64)
+
+        # a contiguous range of rows can be returned as a view
+        if rows.shape[0] > 0 and rows[-1] - rows[0] == rows.shape[0] - 1 and (np.diff(rows) == 1).all():
+            return self.slice(rows[0], rows[-1] + 1)
+
+        positions, offsets = take_positions(self.offsets, rows)
+        digests = None if self.digests is None else self.digests[rows]
+
+        return RaggedArray(self.values[positions], offsets, digests)
+
+def row_digests(sims):
+    """
+    Hash the values of each row of a ragged array once (e.g. when a transition table is parsed), so that
+    later digests of a range of rows only need to hash these rather than every value
+
+    Arguments:
+        sims (RaggedArray): The ragged array
+
+    Returns:
+        (np.ndarray): The SHA1 digest of each row, as a (rows, 20) array of bytes
+    """
+
+    values = memoryview(np.ascontiguousarray(sims.values, dtype=float)).cast('B')
+    bounds = sims.offsets * np.dtype(float).itemsize
+
+    digests = b''.join(
+        hashlib.sha1(values[start:stop]).digest() for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist())
+    )
+
+    return np.frombuffer(digests, dtype=np.uint8).reshape(len(sims), hashlib.sha1().digest_size)
+
+def take_positions(offsets, rows):
+    """
+    Find the values that make up a subset of the rows of a ragged array
+
+    Arguments:
+        offsets (np.ndarray): Row offsets of the ragged array
+        rows (np.ndarray): Positional indices of the rows to take
+
+    Returns:
+        (np.ndarray): The position of each value of the new rows within the old values
+        (np.ndarray): Row offsets of the new rows
+    """
+
+    lengths = np.diff(offsets)[rows]
+
+    new_offsets = np.zeros(rows.shape[0] + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+
+    # position of every value in the new array, mapped back to the old array
+    shift = np.repeat(offsets[:-1][rows] - new_offsets[:-1], lengths)
+
+    return np.arange(new_offsets[-1]) + shift, new_offsets
+
+def _tokenise(value):
+    """Split a space-separated similarity string (e.g. '[0.1 0.2\n 0.3]') into tokens"""
+
+    # missing entries are treated as a single remaining item with 0 similarity
+    if not isinstance(value, str):
+        return ['0.0']
+
+    tokens = value.replace('[', ' ').replace(']', ' ').split()
+
+    if len(tokens) == 0:
+        return ['0.0']
+
+    return tokens
+
+def parse_remaining_similarities(column):
+    """
+    Parse a column of space-separated similarity strings (e.g. rem_cooc) into a RaggedArray, with the
+    digest of each row. Missing and blank entries become a single remaining item with a similarity of 0
+
+    Arguments:
+        column (pd.Series): A column of similarity strings, one per transition
+
+    Returns:
+        (RaggedArray): The parsed similarities
+    """
+
+    tokens = [_tokenise(x) for x in column]
+
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum([len(t) for t in tokens], out=offsets[1:])
+
+    values = np.array([v for t in tokens for v in t], dtype=float)
+
+    sims = RaggedArray(values, offsets)
+    sims.digests = row_digests(sims)
+
+    return sims
+
+def parse_remaining_columns(data, prefix='rem_'):
+    """
+    Parse every remaining-similarity column within a transition table
+
+    Arguments:
+        data (pd.DataFrame): The transition table
+        prefix (str): The prefix used for the remaining-similarity columns
+
+    Returns:
+        (dict): A RaggedArray for each representation (e.g. {'cooc': RaggedArray}), aligned to the rows of data
+    """
+
+    return {
+        col[len(prefix):]: parse_remaining_similarities(data[col])
+        for col in data.columns if col.startswith(prefix)
+    }
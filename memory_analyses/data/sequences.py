@@ -0,0 +1,161 @@
+"""Build transitions from raw retrieval sequences, looking up similarities from item-by-item matrices"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from memory_analyses.data.ragged import RaggedArray, take_positions
+
+class IndexedRemaining(object):
+    """
+    The similarities between the current item of each transition and its remaining items, looked up
+    from an item-by-item similarity matrix when they are needed. This stores an index per remaining
+    item rather than a similarity string, and can be used in place of a RaggedArray (see lookup)
+
+    Arguments:
+        matrix (np.ndarray): (items x items) similarities, usually memory-mapped
+        current (np.ndarray): The index of the current item of each transition
+        items (np.ndarray): A flat array of the indices of the remaining items of every transition
+        offsets (np.ndarray): Offsets of each transition's remaining items within items
+    """
+
+    def __init__(self, matrix, current, items, offsets):
+        super(IndexedRemaining, self).__init__()
+        self.matrix = matrix
+        self.current = np.asarray(current, dtype=np.int64)
+        self.items = np.asarray(items, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    @property
+    def lengths(self):
+        """The number of remaining items for each transition"""
+
+        return np.diff(self.offsets)
+
+    @property
+    def values(self):
+        """The remaining similarities of every transition, as a flat array"""
+
+        return np.asarray(self.matrix[np.repeat(self.current, self.lengths), self.items], dtype=float)
+
+    def row(self, i):
+        """Get the remaining similarities for a single transition"""
+
+        return np.asarray(self.matrix[self.current[i], self.items[self.offsets[i]:self.offsets[i + 1]]], dtype=float)
+
+    def slice(self, start, stop):
+        """Get a contiguous range of transitions, without copying the item indices"""
+
+        offsets = self.offsets[start:stop + 1]
+
+        return IndexedRemaining(
+            self.matrix, self.current[start:stop], self.items[offsets[0]:offsets[-1]], offsets - offsets[0]
+        )
+
+    def take(self, rows):
+        """Gather a subset of transitions into a new IndexedRemaining"""
+
+        rows = np.asarray(rows, dtype=np.int64)
+        positions, offsets = take_positions(self.offsets, rows)
+
+        return IndexedRemaining(self.matrix, self.current[rows], self.items[positions], offsets)
+
+    def lookup(self):
+        """
+        Look up the remaining similarities
+
+        Returns:
+            (RaggedArray): The remaining similarities of each transition
+        """
+
+        return RaggedArray(self.values, self.offsets)
+
+def load_similarity_matrices(paths):
+    """
+    Memory-map an item-by-item similarity matrix for each representation
+
+    Arguments:
+        paths (dict): The path to a .npy matrix for each representation (e.g. {'cooc': 'cooc.npy'})
+
+    Returns:
+        (dict): The (items x items) matrix for each representation
+    """
+
+    matrices = {rep: np.load(path, mmap_mode='r') for rep, path in paths.items()}
+
+    shapes = set(matrix.shape for matrix in matrices.values())
+    if len(shapes) != 1 or len(list(shapes)[0]) != 2 or list(shapes)[0][0] != list(shapes)[0][1]:
+        raise ValueError('Similarity matrices must be square and the same size, got {0}'.format(
+            {rep: matrix.shape for rep, matrix in matrices.items()}))
+
+    return matrices
+
+def read_sequences(path):
+    """
+    Read raw retrieval sequences. Each row is a single retrieval, given by the participant (id), the
+    list (listnum) and the index of the item within the similarity matrices (item). The retrievals of
+    each list should be in the order they were made
+
+    Arguments:
+        path (str): Path to the sequences CSV
+
+    Returns:
+        (pd.DataFrame): The retrievals
+    """
+
+    return pd.read_csv(path, dtype={'id': str})
+
+def build_transitions(sequences, matrices):
+    """
+    Build the transitions between sequential retrievals. The remaining items of each transition are the
+    items of the list that have not yet been retrieved (including the item retrieved next)
+
+    Arguments:
+        sequences (pd.DataFrame): The retrievals (see read_sequences)
+        matrices (dict): The (items x items) similarity matrix for each representation
+
+    Returns:
+        (pd.DataFrame): A transition table, with the id, listnum, current and retrieved items and a
+            <rep>_similarity column for each representation
+        (dict): An IndexedRemaining of remaining similarities for each representation, aligned to the table
+    """
+
+    items = sequences['item'].values.astype(np.int64)
+
+    n_items = list(matrices.values())[0].shape[0]
+    if items.shape[0] > 0 and (items.min() < 0 or items.max() >= n_items):
+        raise ValueError('Item indices must be between 0 and {0}'.format(n_items - 1))
+
+    # keep the retrievals of each list together, in the order they were made
+    lists = sequences.groupby(['id', 'listnum'], sort=False).ngroup().values
+    order = np.argsort(lists, kind='stable')
+    items = items[order]
+
+    sizes = np.bincount(lists)
+    ends = np.repeat(np.cumsum(sizes), sizes)
+
+    # every retrieval but the last of each list starts a transition
+    rows = np.flatnonzero(np.arange(items.shape[0]) < ends - 1)
+
+    offsets = np.zeros(rows.shape[0] + 1, dtype=np.int64)
+    np.cumsum(ends[rows] - rows - 1, out=offsets[1:])
+
+    # the remaining items run from the next retrieval to the end of the list
+    remaining_items = items[np.arange(offsets[-1]) + np.repeat(rows + 1 - offsets[:-1], np.diff(offsets))]
+
+    table = sequences[['id', 'listnum']].iloc[order[rows]].reset_index(drop=True)
+    table['current_item'] = items[rows]
+    table['retrieved_item'] = items[rows + 1]
+
+    remaining = {}
+    for rep, matrix in matrices.items():
+        table[f'{rep}_similarity'] = np.asarray(matrix[items[rows], items[rows + 1]], dtype=float)
+        remaining[rep] = IndexedRemaining(matrix, items[rows], remaining_items, offsets)
+
+    logging.info('Built {0} transitions from {1} lists'.format(table.shape[0], sizes.shape[0]))
+
+    return table, remaining
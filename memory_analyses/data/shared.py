@@ -0,0 +1,159 @@
+"""Compact similarity storage, shared between processes through memory-mapped files"""
+
+import os
+import mmap
+import shutil
+import tempfile
+
+import numpy as np
+
+from memory_analyses.data.ragged import RaggedArray
+from memory_analyses.data.sequences import IndexedRemaining
+
+# memory-backed files, where the system has them
+SHARED_MEMORY_DIR = '/dev/shm'
+
+def compact_sims(sims, dtype=np.float32):
+    """
+    Store similarities at a lower precision
+
+    Arguments:
+        sims (dict): The similarities of each representation (arrays, or RaggedArrays of remaining
+            similarities; IndexedRemaining are left to look up from their matrices)
+        dtype (np.dtype): The precision to store them at
+
+    Returns:
+        (dict): The similarities of each representation
+    """
+
+    compacted = {}
+    for rep, values in sims.items():
+        if isinstance(values, RaggedArray):
+            compacted[rep] = RaggedArray(values.values.astype(dtype), values.offsets, values.digests)
+        elif isinstance(values, IndexedRemaining):
+            compacted[rep] = values
+        else:
+            compacted[rep] = np.asarray(values).astype(dtype)
+
+    return compacted
+
+class SharedArray(object):
+    """
+    A reference to an array in a file (e.g. in shared memory), which any process can memory-map (see SharedArrays)
+
+    Arguments:
+        path (str): The file
+        dtype (str): The type of the array
+        shape (tuple): The shape of the array
+        offset (int): Where the array starts within the file (e.g. after the header of a .npy file)
+    """
+
+    def __init__(self, path, dtype, shape, offset=0):
+        super(SharedArray, self).__init__()
+        self.path = path
+        self.dtype = dtype
+        self.shape = shape
+        self.offset = offset
+
+    def open(self):
+        """Memory-map the array (read-only)"""
+
+        if 0 in self.shape:
+            return np.empty(self.shape, dtype=self.dtype)
+
+        return np.memmap(self.path, dtype=self.dtype, mode='r', offset=self.offset, shape=self.shape)
+
+class SharedContainer(object):
+    """A reference to a RaggedArray or IndexedRemaining whose arrays are in shared files"""
+
+    def __init__(self, cls, arrays):
+        super(SharedContainer, self).__init__()
+        self.cls = cls
+        self.arrays = arrays
+
+    def open(self):
+        """Memory-map the arrays, and rebuild the container around them"""
+
+        return self.cls(*[array.open() for array in self.arrays])
+
+class SharedArrays(object):
+    """
+    Copy arrays into files in shared memory (/dev/shm, or the temporary directory where that is not
+    available), so that every worker process memory-maps a single copy rather than holding its own.
+    References to the arrays (see share) are sent to the workers in place of the arrays themselves.
+    The files are removed on close
+
+    Arguments:
+        directory (str): Optionally, where to create the files
+    """
+
+    def __init__(self, directory=None):
+        super(SharedArrays, self).__init__()
+
+        if directory is None and os.path.isdir(SHARED_MEMORY_DIR):
+            directory = SHARED_MEMORY_DIR
+
+        self.directory = tempfile.mkdtemp(prefix='memory_analyses_', dir=directory)
+        self.n_arrays = 0
+
+    def _share_array(self, array):
+        """
+        Copy a single array into a shared file. Arrays that are already memory-mapped from a file in full
+        (e.g. similarity matrices, or a transition table's cache) are shared by referring to that file instead
+        """
+
+        if (isinstance(array, np.memmap) and isinstance(array.base, mmap.mmap) and array.mode == 'r'
+                and array.flags.c_contiguous):
+            return SharedArray(array.filename, array.dtype.str, array.shape, array.offset)
+
+        array = np.asarray(array)
+
+        path = os.path.join(self.directory, 'array{0}.npy'.format(self.n_arrays))
+        self.n_arrays += 1
+
+        shared = np.lib.format.open_memmap(path, mode='w+', dtype=array.dtype, shape=array.shape)
+        shared[...] = array
+        shared.flush()
+        offset = shared.offset
+        del shared
+
+        return SharedArray(path, array.dtype.str, array.shape, offset)
+
+    def share(self, sims):
+        """
+        Copy the similarities of each representation into shared files
+
+        Arguments:
+            sims (dict): The similarities of each representation (arrays, RaggedArrays or IndexedRemaining)
+
+        Returns:
+            (dict): A reference to the similarities of each representation, to open with open_shared
+        """
+
+        shared = {}
+        for rep, values in sims.items():
+            if isinstance(values, RaggedArray):
+                shared[rep] = SharedContainer(
+                    RaggedArray, [self._share_array(values.values), self._share_array(values.offsets)])
+            elif isinstance(values, IndexedRemaining):
+                shared[rep] = SharedContainer(IndexedRemaining, [
+                    self._share_array(values.matrix), self._share_array(values.current),
+                    self._share_array(values.items), self._share_array(values.offsets),
+                ])
+            else:
+                shared[rep] = self._share_array(values)
+
+        return shared
+
+    def close(self):
+        """Remove the shared files (processes that have mapped them keep their mappings)"""
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def open_shared(sims):
+    """Open any shared references among the similarities of each representation (others are returned as they are)"""
+
+    return {
+        rep: values.open() if isinstance(values, (SharedArray, SharedContainer)) else values
+        for rep, values in sims.items()
+    }
@@ -0,0 +1,156 @@
+"""Per-transition retrieval strengths, exported as memory-mappable columns aligned with the input transitions"""
+
+import os
+import json
+import logging
+
+import numpy as np
+
+STRENGTHS_VERSION = 1
+
+# every column is a raw array of little-endian float64s, so it can be extended by appending to its file
+DTYPE = np.dtype('<f8')
+
+def _extend_column(path, n_rows, chunk_size=1 << 20):
+    """Extend a column's file to n_rows with missing values (creating it if needed)"""
+
+    size = os.path.getsize(path) // DTYPE.itemsize if os.path.isfile(path) else 0
+
+    if size > n_rows:
+        with open(path, 'r+b') as fp:
+            fp.truncate(n_rows * DTYPE.itemsize)
+        return
+
+    with open(path, 'ab') as fp:
+        for first in range(size, n_rows, chunk_size):
+            np.full(min(chunk_size, n_rows - first), np.nan, dtype=DTYPE).tofile(fp)
+
+class StrengthsExport(object):
+    """
+    A directory of columns with one value for each transition, in the order of the input rows (e.g. the
+    rows of transition_probs.csv), such as the log retrieval strengths of each fitted model. Rows that
+    have not been written are missing (nan). Columns from earlier exports are kept, and extended when
+    rows have been appended to the input
+
+    Arguments:
+        directory (str): The directory of the export (created if it does not exist). An existing directory
+            must be empty or an earlier export
+        n_rows (int): The number of input transitions
+    """
+
+    def __init__(self, directory, n_rows):
+        super(StrengthsExport, self).__init__()
+        self.directory = directory
+        self.n_rows = n_rows
+        self.columns = []
+        self._mapped = {}
+
+        meta = _read_meta(directory)
+
+        # never write into (or remove files from) a directory that holds anything else
+        if meta is None and os.path.isdir(directory) and len(os.listdir(directory)) > 0:
+            raise ValueError('{0} exists and is not a retrieval strength export'.format(directory))
+
+        # an export of a larger (i.e. a different) input cannot be aligned with this one, so its columns
+        # (only the files listed in its metadata) are removed
+        if meta is not None and meta['n_rows'] > n_rows:
+            logging.warning('{0} has {1} rows, but the input has {2}; starting a new export'.format(
+                directory, meta['n_rows'], n_rows))
+            for column in meta['columns']:
+                path = os.path.join(directory, column['file'])
+                if os.path.isfile(path):
+                    os.remove(path)
+            meta = None
+
+        os.makedirs(directory, exist_ok=True)
+
+        if meta is not None:
+            self.columns = meta['columns']
+            for column in self.columns:
+                _extend_column(os.path.join(directory, column['file']), n_rows)
+
+        self._write_meta()
+
+    def _write_meta(self):
+        """Write the metadata, replacing the old metadata in one step"""
+
+        path = os.path.join(self.directory, 'meta.json')
+
+        with open(path + '.tmp', 'w') as fp:
+            json.dump({'version': STRENGTHS_VERSION, 'n_rows': self.n_rows, 'columns': self.columns}, fp)
+
+        os.replace(path + '.tmp', path)
+
+    def _column(self, name):
+        """Memory-map a column for writing, creating it (with every row missing) if it does not exist"""
+
+        if name not in self._mapped:
+
+            files = {column['name']: column['file'] for column in self.columns}
+            if name not in files:
+                files[name] = 'col{0}.f8'.format(len(self.columns))
+
+                # a new column starts empty, even if an interrupted export left its file behind
+                path = os.path.join(self.directory, files[name])
+                open(path, 'wb').close()
+                _extend_column(path, self.n_rows)
+                self.columns.append({'name': name, 'file': files[name], 'dtype': DTYPE.str})
+                self._write_meta()
+
+            self._mapped[name] = np.memmap(
+                os.path.join(self.directory, files[name]), dtype=DTYPE, mode='r+', shape=(self.n_rows,))
+
+        return self._mapped[name]
+
+    def clear(self, name):
+        """Set every row of a column to missing (creating it if it does not exist), before rewriting it"""
+
+        self._column(name)[:] = np.nan
+
+    def write(self, name, rows, values):
+        """Write the values of a column at some input rows"""
+
+        self._column(name)[rows] = values
+
+    def close(self):
+        """Flush the written columns to disk"""
+
+        for values in self._mapped.values():
+            values.flush()
+
+        self._mapped = {}
+
+def _read_meta(directory):
+    """Read the metadata of an export (or None if there is no valid export)"""
+
+    try:
+        with open(os.path.join(directory, 'meta.json')) as fp:
+            meta = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if meta.get('version') != STRENGTHS_VERSION:
+        return None
+
+    return meta
+
+def read_strengths(directory):
+    """
+    Memory-map the columns of an export (see StrengthsExport)
+
+    Arguments:
+        directory (str): The directory of the export
+
+    Returns:
+        (dict): The values of each column (read-only), one for each input transition
+    """
+
+    meta = _read_meta(directory)
+    if meta is None:
+        raise ValueError('{0} is not a retrieval strength export'.format(directory))
+
+    return {
+        column['name']: np.memmap(
+            os.path.join(directory, column['file']), dtype=np.dtype(column['dtype']), mode='r', shape=(meta['n_rows'],))
+        for column in meta['columns']
+    }
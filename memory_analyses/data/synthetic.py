@@ -0,0 +1,199 @@
+"""Generate synthetic transition tables from the SAM retrieval model, with known attention weights"""
+
+import numpy as np
+import pandas as pd
+
+def _format_similarities(values):
+    """Format the remaining similarities of a transition as a space-separated string (as in transition_probs.csv)"""
+
+    return '[' + ' '.join('{0:.8g}'.format(v) for v in values) + ']'
+
+def _item_similarities(n_items, n_dims, random_state):
+    """Similarities in [0, 1] between random item embeddings (a rescaled cosine similarity)"""
+
+    embeddings = random_state.normal(size=(n_items, n_dims))
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    return (1. + embeddings @ embeddings.T) / 2.
+
+def generate_transition_table(n_participants=10, n_lists=2, list_length=15, remaining_size=None,
+                              n_representations=3, representations=None, weights=None, n_dims=10, seed=0):
+    """
+    Simulate sequential retrievals from the SAM retrieval model and build a transition table from them,
+    in the format of transition_probs.csv. Each list draws its items from a pool of remaining_size + 1
+    items, with independent random similarities for each representation. Retrievals are made with
+    probability proportional to the product of the weighted similarities to the current item
+
+    Arguments:
+        n_participants (int): The number of participants (id)
+        n_lists (int): The number of lists for each participant (listnum)
+        list_length (int): The number of retrievals in each list
+        remaining_size (int): The number of remaining items at the first transition of each list (at
+            least list_length - 1, the default). Items that are never retrieved remain until the end
+        n_representations (int): The number of representations, if representations is not given
+        representations (list): The names of the representations (default rep0, rep1, ...)
+        weights (dict): The attention weight of each representation (default uniform on [0, 2])
+        n_dims (int): The dimension of the random item embeddings
+        seed (int): Random seed
+
+    Returns:
+        (pd.DataFrame): The transition table, with id, listnum, <rep>_similarity and rem_<rep> columns
+        (dict): The attention weight of each representation
+    """
+
+    random_state = np.random.RandomState(seed)
+
+    if representations is None:
+        representations = ['rep{0}'.format(i) for i in range(n_representations)]
+
+    if weights is None:
+        weights = {rep: random_state.uniform(0., 2.) for rep in representations}
+
+    if remaining_size is None:
+        remaining_size = list_length - 1
+
+    if remaining_size < list_length - 1:
+        raise ValueError('remaining_size must be at least list_length - 1')
+
+    w = np.array([weights[rep] for rep in representations])
+
+    columns = {'id': [], 'listnum': []}
+    for rep in representations:
+        columns[f'{rep}_similarity'] = []
+        columns[f'rem_{rep}'] = []
+
+    for participant in range(n_participants):
+        for listnum in range(1, n_lists + 1):
+
+            # (representations x items x items) similarities between the items available to this list
+            sims = np.stack([_item_similarities(remaining_size + 1, n_dims, random_state) for _ in representations])
+
+            current = 0
+            remaining = np.arange(1, remaining_size + 1)
+
+            for _ in range(list_length - 1):
+
+                # retrieval strengths of the remaining items
+                strengths = np.power(sims[:, current, remaining].T, w).prod(axis=1)
+                retrieved = random_state.choice(remaining.shape[0], p=strengths / strengths.sum())
+
+                columns['id'].append('S{0:04d}'.format(participant))
+                columns['listnum'].append(listnum)
+                for i, rep in enumerate(representations):
+                    columns[f'{rep}_similarity'].append(sims[i, current, remaining[retrieved]])
+                    columns[f'rem_{rep}'].append(_format_similarities(sims[i, current, remaining]))
+
+                current = remaining[retrieved]
+                remaining = np.delete(remaining, retrieved)
+
+    return pd.DataFrame(columns), weights
+
+def random_similarity_matrices(n_items, representations, n_dims=10, seed=0):
+    """
+    Create a random (items x items) similarity matrix for each representation, from random item embeddings
+
+    Arguments:
+        n_items (int): The number of items
+        representations (list): The names of the representations
+        n_dims (int): The dimension of the random item embeddings
+        seed (int): Random seed
+
+    Returns:
+        (dict): The similarity matrix of each representation
+    """
+
+    random_state = np.random.RandomState(seed)
+
+    return {rep: _item_similarities(n_items, n_dims, random_state) for rep in representations}
+
+def _simulate_batch(matrices, weights, n_lists, list_length, jitter_val, random_state):
+    """Simulate the retrieval order of a batch of lists, one retrieval at a time for every list at once"""
+
+    n_items = list(matrices.values())[0].shape[0]
+
+    # a random set of items for each list (the smallest of a random key for each item)
+    items = np.argpartition(random_state.random_sample((n_lists, n_items)), list_length - 1, axis=1)[:, :list_length]
+
+    # (lists x items x items) log retrieval strengths between the items of each list, as in the model:
+    # the product of the jittered similarities raised to their attention weights
+    log_strengths = np.zeros((n_lists, list_length, list_length))
+    for rep, matrix in matrices.items():
+        sims = np.asarray(matrix[items[:, :, None], items[:, None, :]], dtype=float)
+        if weights[rep] != 0:
+            log_strengths += weights[rep] * np.log(sims + jitter_val)
+
+    lists = np.arange(n_lists)
+    order = np.empty((n_lists, list_length), dtype=np.int64)
+    available = np.ones((n_lists, list_length), dtype=bool)
+
+    # the first retrieval is uniformly random
+    current = random_state.randint(0, list_length, n_lists)
+
+    for position in range(list_length):
+
+        order[:, position] = current
+        available[lists, current] = False
+
+        if position == list_length - 1:
+            break
+
+        # sample the next retrieval of every list, with probability proportional to its retrieval strength
+        # (the largest Gumbel-perturbed log strength)
+        scores = log_strengths[lists, current] + random_state.gumbel(size=(n_lists, list_length))
+        scores[~available] = -np.inf
+        current = scores.argmax(axis=1)
+
+    return items[lists[:, None], order]
+
+def simulate_sequences(matrices, weights, n_participants=1000, n_lists=1, list_length=15, batch_size=10000,
+                       jitter_val=1.0e-7, seed=0):
+    """
+    Simulate retrieval sequences from the SAM retrieval model, with known attention weights (the generative
+    counterpart of the model's retrieval strengths). Each list retrieves a random set of list_length items,
+    starting from a random item. Each later retrieval is sampled from the list's remaining items, with
+    probability proportional to the product of their weighted similarities to the current item. Lists are
+    simulated in batches, with every list in a batch sampled at once
+
+    Arguments:
+        matrices (dict): The (items x items) similarity matrix for each representation (see
+            load_similarity_matrices or random_similarity_matrices)
+        weights (dict): The attention weight of each representation
+        n_participants (int): The number of participants (id)
+        n_lists (int): The number of lists for each participant (listnum)
+        list_length (int): The number of retrievals in each list
+        batch_size (int): The number of lists to simulate at once
+        jitter_val (float): As in the model, a small number added to every similarity
+        seed (int): Random seed
+
+    Returns:
+        (pd.DataFrame): The retrievals, in the order they were made, with id, listnum and item columns
+            (see read_sequences), ready for build_transitions
+    """
+
+    n_items = list(matrices.values())[0].shape[0]
+
+    if list_length > n_items:
+        raise ValueError('list_length must be at most the number of items ({0})'.format(n_items))
+
+    for rep, matrix in matrices.items():
+        if rep not in weights:
+            raise ValueError('No attention weight given for {0}'.format(rep))
+        if np.asarray(matrix).min() < 0:
+            raise ValueError('The similarities of {0} must be non-negative'.format(rep))
+
+    random_state = np.random.RandomState(seed)
+
+    n_total = n_participants * n_lists
+    sequences = np.concatenate([
+        _simulate_batch(matrices, weights, min(batch_size, n_total - first), list_length, jitter_val, random_state)
+        for first in range(0, n_total, batch_size)
+    ]) if n_total > 0 else np.empty((0, list_length), dtype=np.int64)
+
+    # the participant and list of each retrieval
+    list_ids = np.repeat(np.arange(n_total), list_length)
+
+    return pd.DataFrame({
+        'id': np.char.add('S', np.char.zfill((list_ids // n_lists).astype(str), 4)),
+        'listnum': list_ids % n_lists + 1,
+        'item': sequences.ravel(),
+    })
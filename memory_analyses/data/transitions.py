@@ -0,0 +1,534 @@
+"""Load transition tables, using a binary columnar cache to avoid re-parsing the CSV"""
+
+import io
+import os
+import json
+import shutil
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+
+from memory_analyses.data.blocks import sort_by_list
+from memory_analyses.data.ragged import RaggedArray, parse_remaining_columns, row_digests
+from memory_analyses.data.sequences import build_transitions, load_similarity_matrices, read_sequences
+
+CACHE_VERSION = 3
+
+# how much of the end of a CSV must be unchanged for the rows after it to be treated as appended rows
+TAIL_SIZE = 1 << 16
+
+# the baseline model's number of remaining items for each transition, counted from the rem_hier strings
+# as in the original analysis (see count_baseline_items)
+BASELINE_ITEMS = 'baseline_items'
+BASELINE_COLUMN = 'rem_hier'
+
+def _segment_hash(path, start, stop, chunk_size=1 << 20):
+    """Calculate the SHA1 hash of the bytes [start, stop) of a file"""
+
+    digest = hashlib.sha1()
+
+    with open(path, 'rb') as fp:
+        fp.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = fp.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+
+    return digest.hexdigest()
+
+def _tail_hash(path, size):
+    """
+    Calculate the SHA1 hash of the last TAIL_SIZE bytes of the first size bytes of a file, which rows
+    appended to the file must follow unchanged (None if these bytes do not end a line)
+    """
+
+    with open(path, 'rb') as fp:
+        fp.seek(max(size - TAIL_SIZE, 0))
+        tail = fp.read(min(size, TAIL_SIZE))
+
+    if len(tail) != min(size, TAIL_SIZE) or not tail.endswith(b'\n'):
+        return None
+
+    return hashlib.sha1(tail).hexdigest()
+
+def _segments_match(path, segments):
+    """Check that each segment (stop, hash) of a file, written one after the other, still has the same hash"""
+
+    start = 0
+    for stop, digest in segments:
+        if _segment_hash(path, start, stop) != digest:
+            return False
+        start = stop
+
+    return True
+
+def count_baseline_items(column):
+    """
+    Count the remaining items of each transition as the baseline model always has: the number of pieces
+    of its similarity string when split on single spaces. Padded strings (e.g. '[0.         0.5]') count
+    each extra space as an item, so this can be more than the number of parsed similarities
+
+    Arguments:
+        column (pd.Series): A column of similarity strings (e.g. rem_hier), one per transition
+
+    Returns:
+        (np.ndarray): The number of items of each transition
+    """
+
+    return column.astype(str).str.count(' ').values + 1
+
+def baseline_items(table, remaining):
+    """
+    The baseline model's number of remaining items for each transition: the count from the rem_hier
+    strings when the table was parsed, or otherwise (e.g. for transitions built from sequences) the
+    number of remaining similarities
+
+    Arguments:
+        table (pd.DataFrame): The transition table
+        remaining (dict): The remaining similarities for each representation, aligned to the table
+
+    Returns:
+        (np.ndarray): The number of remaining items of each transition
+    """
+
+    if BASELINE_ITEMS in table.columns:
+        return table[BASELINE_ITEMS].values
+
+    return next(iter(remaining.values())).lengths
+
+def _split_remaining(data, prefix='rem_'):
+    """Split a transition table into its other columns and its parsed remaining similarities"""
+
+    remaining = parse_remaining_columns(data, prefix)
+
+    table = data.drop(columns=[prefix + rep for rep in remaining])
+    if BASELINE_COLUMN in data.columns:
+        table[BASELINE_ITEMS] = count_baseline_items(data[BASELINE_COLUMN])
+
+    return table, remaining
+
+def _array_file(cache_dir, entry):
+    """The file of an array in a cache directory, which is named after its type so it is replaced when that widens"""
+
+    return os.path.join(cache_dir, '{0}.{1}'.format(entry['name'], np.dtype(entry['dtype']).str.lstrip('<>|=')))
+
+def _save_array(cache_dir, name, values):
+    """Write an array to a cache directory as raw bytes, returning its entry (name, type and shape) for the metadata"""
+
+    values = np.ascontiguousarray(values)
+    entry = {'name': name, 'dtype': values.dtype.str, 'shape': list(values.shape)}
+    values.tofile(_array_file(cache_dir, entry))
+
+    return entry
+
+def _append_array(cache_dir, entry, values):
+    """
+    Append values to an array in a cache directory, in place unless they need a wider type (e.g. longer
+    strings), and return its new entry. Any bytes after the array (e.g. from an interrupted append) are dropped
+    """
+
+    dtype = np.dtype(entry['dtype'])
+    wider = np.promote_types(dtype, values.dtype)
+
+    if wider != dtype:
+        stored = _load_array(cache_dir, entry)
+        return _save_array(cache_dir, entry['name'], np.concatenate([stored.astype(wider), values.astype(wider)]))
+
+    with open(_array_file(cache_dir, entry), 'r+b') as fp:
+        fp.truncate(int(np.prod(entry['shape'])) * dtype.itemsize)
+        fp.seek(0, os.SEEK_END)
+        fp.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+    return dict(entry, shape=[entry['shape'][0] + values.shape[0]] + entry['shape'][1:])
+
+def _load_array(cache_dir, entry):
+    """Memory-map an array in a cache directory"""
+
+    shape = tuple(entry['shape'])
+    if 0 in shape:
+        return np.empty(shape, dtype=entry['dtype'])
+
+    return np.memmap(_array_file(cache_dir, entry), dtype=entry['dtype'], mode='r', shape=shape)
+
+def _text_values(values):
+    """A text column as fixed-width strings (missing values are blank) and a mask of its missing values"""
+
+    return values.fillna('').astype(str).values.astype('U'), values.isna().values
+
+def _write_meta(cache_dir, meta):
+    """Replace the metadata of a cache directory in one step, so readers see either the old or the new cache"""
+
+    tmp_path = os.path.join(cache_dir, 'meta.json.tmp{0}'.format(os.getpid()))
+
+    with open(tmp_path, 'w') as fp:
+        json.dump(meta, fp)
+
+    os.replace(tmp_path, os.path.join(cache_dir, 'meta.json'))
+
+def _write_cache(cache_dir, segments, tail, table, remaining):
+    """
+    Write a table and its remaining similarities (with the digest of each row) to a cache directory,
+    as one file of raw bytes per array
+
+    Arguments:
+        cache_dir (str): The cache directory
+        segments (list): The (stop, hash) of each part of the CSV that the cache was parsed from
+        tail (str): The hash of the end of the CSV (see _tail_hash)
+        table (pd.DataFrame): The transition table
+        remaining (dict): The remaining similarities (RaggedArray) for each representation
+    """
+
+    tmp_dir = cache_dir + '.tmp{0}'.format(os.getpid())
+    os.makedirs(tmp_dir)
+
+    columns = []
+    for i, col in enumerate(table.columns):
+
+        values = table[col]
+        name = 'col{0}'.format(i)
+
+        if pd.api.types.is_numeric_dtype(values):
+            columns.append({'name': col, 'kind': 'numeric', 'data': _save_array(tmp_dir, name, values.values)})
+
+        # other columns (e.g. participant ids) are stored as strings, with a mask of missing values
+        else:
+            text, missing = _text_values(values)
+            columns.append({
+                'name': col, 'kind': 'text', 'data': _save_array(tmp_dir, name, text),
+                'missing': _save_array(tmp_dir, 'missing_' + name, missing),
+            })
+
+    reps = []
+    for i, (rep, sims) in enumerate(remaining.items()):
+        digests = row_digests(sims) if sims.digests is None else sims.digests
+        reps.append({
+            'name': rep,
+            'values': _save_array(tmp_dir, 'rem{0}_values'.format(i), sims.values),
+            'offsets': _save_array(tmp_dir, 'rem{0}_offsets'.format(i), sims.offsets),
+            'digests': _save_array(tmp_dir, 'rem{0}_digests'.format(i), digests),
+        })
+
+    _write_meta(tmp_dir, {
+        'version': CACHE_VERSION, 'size': segments[-1][0], 'segments': segments, 'tail': tail,
+        'columns': columns, 'remaining': reps,
+    })
+
+    # swap in the new cache in one step, so readers never see a partially written cache
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
+    os.rename(tmp_dir, cache_dir)
+
+def _meta_arrays(meta):
+    """The entries of every array in a cache's metadata"""
+
+    entries = []
+    for col in meta['columns']:
+        entries += [col[key] for key in ('data', 'missing') if key in col]
+    for rep in meta['remaining']:
+        entries += [rep['values'], rep['offsets'], rep['digests']]
+
+    return entries
+
+def _append_cache(path, cache_dir, meta, size):
+    """
+    Parse the rows of a CSV after the part that a cache was written from, and append them to the cache's
+    files. Only the new rows are read and hashed; the arrays are extended in place, so only those that
+    need a wider type are rewritten
+
+    Returns:
+        (dict): The cache's new metadata (None if the new rows do not have the same columns, so the
+            cache must be rebuilt)
+    """
+
+    with open(path, 'rb') as fp:
+        header = fp.readline()
+        fp.seek(meta['size'])
+        appended = fp.read(size - meta['size'])
+
+    table, remaining = _split_remaining(pd.read_csv(io.BytesIO(header + appended)))
+
+    kinds = ['numeric' if pd.api.types.is_numeric_dtype(table[col]) else 'text' for col in table.columns]
+    if ([col['name'] for col in meta['columns']] != list(table.columns) or
+            [col['kind'] for col in meta['columns']] != kinds or
+            [rep['name'] for rep in meta['remaining']] != list(remaining)):
+        return None
+
+    logging.info('Parsing {0} rows appended to {1} and appending them to cache {2}'.format(
+        table.shape[0], path, cache_dir))
+
+    columns = []
+    for col in meta['columns']:
+
+        values = table[col['name']]
+
+        if col['kind'] == 'numeric':
+            columns.append(dict(col, data=_append_array(cache_dir, col['data'], values.values)))
+        else:
+            text, missing = _text_values(values)
+            columns.append(dict(
+                col, data=_append_array(cache_dir, col['data'], text),
+                missing=_append_array(cache_dir, col['missing'], missing),
+            ))
+
+    reps = []
+    for rep in meta['remaining']:
+        sims = remaining[rep['name']]
+        reps.append(dict(
+            rep, values=_append_array(cache_dir, rep['values'], sims.values),
+            offsets=_append_array(cache_dir, rep['offsets'], sims.offsets[1:] + rep['values']['shape'][0]),
+            digests=_append_array(cache_dir, rep['digests'], sims.digests),
+        ))
+
+    new_meta = dict(
+        meta, size=size, segments=meta['segments'] + [[size, hashlib.sha1(appended).hexdigest()]],
+        tail=_tail_hash(path, size), columns=columns, remaining=reps,
+    )
+    _write_meta(cache_dir, new_meta)
+
+    # remove the files of any arrays that were rewritten with a wider type
+    files = {'meta.json'} | {os.path.basename(_array_file(cache_dir, entry)) for entry in _meta_arrays(new_meta)}
+    for filename in os.listdir(cache_dir):
+        if filename not in files:
+            os.remove(os.path.join(cache_dir, filename))
+
+    return new_meta
+
+def _read_meta(cache_dir):
+    """Read the metadata of a cache directory (or None if there is no valid cache)"""
+
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as fp:
+            meta = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if meta.get('version') != CACHE_VERSION:
+        return None
+
+    return meta
+
+def _read_cache(cache_dir, meta):
+    """Read a table from a cache directory, memory-mapping the remaining similarities"""
+
+    table = {}
+    for col in meta['columns']:
+
+        values = _load_array(cache_dir, col['data'])
+
+        if col['kind'] == 'text':
+            values = values.astype(object)
+            values[np.asarray(_load_array(cache_dir, col['missing']))] = np.nan
+
+        table[col['name']] = values
+
+    # the remaining similarities are the bulk of the data; these stay on disk and are shared
+    # between any processes that read them
+    remaining = {
+        rep['name']: RaggedArray(
+            _load_array(cache_dir, rep['values']), _load_array(cache_dir, rep['offsets']),
+            _load_array(cache_dir, rep['digests']),
+        )
+        for rep in meta['remaining']
+    }
+
+    return pd.DataFrame(table, columns=[col['name'] for col in meta['columns']]), remaining
+
+def read_transition_table(path, cache=True):
+    """
+    Read a transition table (e.g. transition_probs.csv) and parse its remaining similarities.
+    The first read writes a binary cache next to the CSV (path + '.cache'), which later reads
+    memory-map instead of parsing the CSV. The cache is rebuilt whenever the CSV's contents change,
+    except when rows have only been appended to the CSV (after an unchanged end of its earlier rows):
+    then just the new rows are hashed, parsed and appended to the cache
+
+    Arguments:
+        path (str): Path to the transition table CSV
+        cache (bool): Whether or not to use (and create) the cache
+
+    Returns:
+        (pd.DataFrame): The transition table, without the remaining similarity (rem_*) columns
+        (dict): A RaggedArray of remaining similarities for each representation (with the digest
+            of each row), aligned to the table
+    """
+
+    if not cache:
+        return _split_remaining(pd.read_csv(path))
+
+    cache_dir = path + '.cache'
+    meta = _read_meta(cache_dir)
+    size = os.path.getsize(path)
+
+    if meta is not None and meta['size'] == size and _segments_match(path, meta['segments']):
+
+        logging.info('Reading {0} from cache {1}'.format(path, cache_dir))
+
+        return _read_cache(cache_dir, meta)
+
+    # the CSV may have grown by appending rows since the cache was written
+    appended = meta is not None and meta['size'] < size and meta['tail'] is not None
+    if appended and _tail_hash(path, meta['size']) == meta['tail']:
+
+        appended = _append_cache(path, cache_dir, meta, size)
+        if appended is not None:
+            return _read_cache(cache_dir, appended)
+
+    logging.info('Parsing {0} and writing cache to {1}'.format(path, cache_dir))
+
+    digest = _segment_hash(path, 0, size)
+    table, remaining = _split_remaining(pd.read_csv(path))
+    _write_cache(cache_dir, [[size, digest]], _tail_hash(path, size), table, remaining)
+
+    return table, remaining
+
+def load_transitions(config):
+    """
+    Load the transitions (from a transition table, or from raw sequences and similarity matrices), ordered
+    by participant and list, so that the participants of every condition are contiguous blocks of the same
+    rows (see condition_blocks)
+
+    Returns:
+        (pd.DataFrame): The transition table, indexed by the row of each transition in the input
+        (dict): The remaining similarities for each representation, aligned to the table
+    """
+
+    if config.get('input', 'table') == 'matrices':
+
+        # build the transitions from the raw retrieval sequences
+        # the remaining similarities are looked up from the (memory-mapped) similarity matrices by the model
+        all_data, remaining = build_transitions(
+            read_sequences(config['sequences']), load_similarity_matrices(config['similarity_matrices'])
+        )
+
+    else:
+
+        # import the sequential transition data
+        # the remaining similarities are parsed once (and cached to disk), rather than on every evaluation of the model
+        all_data, remaining = read_transition_table(config['transition_table'], cache=config.get('cache', True))
+
+    # order the transitions by participant and list once, for every condition
+    # (the index keeps each transition's row in the input, e.g. for exports aligned with the input rows)
+    rows = sort_by_list(all_data['id'].values, all_data['listnum'].values)
+    all_data = all_data.iloc[rows]
+    remaining = {rep: sims.take(rows) for rep, sims in remaining.items()}
+
+    return all_data, remaining
+
+def validate_transitions(table, remaining, representations, jitter_val=1.0e-7, chunk_size=2 ** 20):
+    """
+    Check the similarities of a transition table once, when it is loaded, rather than checking the
+    retrieval strengths on every evaluation of the model. Problems that the model tolerates (e.g.
+    missing similarities) are logged rather than raised
+
+    Arguments:
+        table (pd.DataFrame): The transition table, with a <rep>_similarity column for each representation
+        remaining (dict): The remaining similarities (RaggedArray) for each representation
+        representations (list): The representations to check
+        jitter_val (float): The constant the model adds to every similarity
+        chunk_size (int): The (approximate) number of remaining similarities to check at once
+
+    Returns:
+        (dict): The number of transitions or similarities affected by each problem
+    """
+
+    offsets = remaining[representations[0]].offsets
+    for rep in representations[1:]:
+        if not np.array_equal(remaining[rep].offsets, offsets):
+            raise ValueError('{0} does not have the same number of remaining items as {1}'.format(
+                rep, representations[0]))
+
+    current = np.column_stack([table[f'{rep}_similarity'].values.astype(float) for rep in representations])
+    jitter = 0. if jitter_val is None else jitter_val
+
+    found = np.zeros(current.shape[0], dtype=bool)
+    missing_remaining = np.zeros(current.shape[0], dtype=bool)
+    non_positive = int((current + jitter <= 0).sum())
+
+    # check the remaining similarities a chunk of transitions at a time, one representation at a time, so
+    # that the temporary arrays stay small however many similarities there are
+    bounds = np.searchsorted(offsets, np.arange(0, offsets[-1], chunk_size), side='right') - 1
+    bounds = np.unique(np.append(bounds, current.shape[0]))
+
+    for first, last in zip(bounds[:-1], bounds[1:]):
+
+        row_ids = np.repeat(np.arange(first, last), np.diff(offsets[first:last + 1]))
+        matches = np.ones(row_ids.shape[0], dtype=bool)
+        missing = np.zeros(row_ids.shape[0], dtype=bool)
+
+        for i, rep in enumerate(representations):
+            rem = np.asarray(remaining[rep].values[offsets[first]:offsets[last]], dtype=float)
+
+            # the retrieved item should be one of the remaining items, so that its retrieval strength is at most 1
+            matches &= np.isclose(rem, current[row_ids, i], rtol=1e-5, atol=1e-6)
+            missing |= np.isnan(rem)
+            non_positive += int((rem + jitter <= 0).sum())
+
+        found[first:last] = np.bincount(row_ids - first, weights=matches, minlength=last - first) > 0
+        missing_remaining[first:last] = np.bincount(row_ids - first, weights=missing, minlength=last - first) > 0
+
+    missing = np.isnan(current).any(axis=1)
+
+    summary = {
+        'transitions': current.shape[0],
+        'missing_similarity': int(missing.sum()),
+        'retrieved_not_remaining': int((~found & ~missing).sum()),
+        'missing_remaining': int(missing_remaining.sum()),
+        'non_positive': non_positive,
+    }
+
+    if summary['retrieved_not_remaining'] > 0:
+        logging.warning('{0} transitions have a retrieved item that is not one of their remaining items, '
+                        'so their retrieval strengths may exceed 1'.format(summary['retrieved_not_remaining']))
+
+    if summary['missing_similarity'] > 0 or summary['missing_remaining'] > 0:
+        logging.info('{0} transitions have a missing similarity and {1} have a missing remaining similarity; '
+                     'these are given the minimum likelihood'.format(
+                         summary['missing_similarity'], summary['missing_remaining']))
+
+    if summary['non_positive'] > 0:
+        logging.info('{0} similarities are not positive (after adding jitter)'.format(summary['non_positive']))
+
+    return summary
+
+def _format_remaining(sims):
+    """Format each row of remaining similarities as a space-separated string, as in transition_probs.csv"""
+
+    # format every value at once (with enough digits to be parsed back exactly), then join each row
+    values = np.char.mod('%.17g', np.asarray(sims.values, dtype=float))
+    offsets = sims.offsets
+
+    return ['[' + ' '.join(values[offsets[i]:offsets[i + 1]]) + ']' for i in range(len(sims))]
+
+def write_transition_table(path, table, remaining, cache=True):
+    """
+    Write a transition table in the format of transition_probs.csv, e.g. for transitions built from simulated
+    sequences (see build_transitions). The binary cache (see read_transition_table) is written at the same
+    time from the remaining similarities that are already parsed, so the CSV never needs to be parsed
+
+    Arguments:
+        path (str): Path to write the transition table CSV to
+        table (pd.DataFrame): The transition table, without remaining similarity columns
+        remaining (dict): The remaining similarities for each representation (RaggedArray or
+            IndexedRemaining), aligned to the table
+        cache (bool): Whether or not to write the cache
+    """
+
+    remaining = {rep: sims.lookup() if hasattr(sims, 'lookup') else sims for rep, sims in remaining.items()}
+
+    data = table.copy()
+    for rep, sims in remaining.items():
+        data['rem_' + rep] = _format_remaining(sims)
+
+    data.to_csv(path, index=False)
+
+    if cache:
+        # read the other columns back, so the cached table has the same types as a parsed CSV
+        parsed = pd.read_csv(path, usecols=list(table.columns))[list(table.columns)]
+        if BASELINE_COLUMN in data.columns:
+            parsed[BASELINE_ITEMS] = count_baseline_items(data[BASELINE_COLUMN])
+        size = os.path.getsize(path)
+        _write_cache(path + '.cache', [[size, _segment_hash(path, 0, size)]], _tail_hash(path, size), parsed, remaining)
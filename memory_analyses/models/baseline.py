@@ -0,0 +1,48 @@
+"""The baseline model, where each remaining item is equally likely to be retrieved"""
+
+import numpy as np
+import pandas as pd
+
+def baseline_transition_loss(n_remaining, replace_zero_with=0.00000001):
+    """The negative log-likelihood of each transition under the baseline model (see run_baseline)"""
+
+    # a transition with no remaining items is certain
+    n_remaining = np.asarray(n_remaining, dtype=float)
+    loss = np.zeros(n_remaining.shape[0])
+    loss[n_remaining > 0] = np.log(n_remaining[n_remaining > 0])
+
+    return np.minimum(loss, -np.log(replace_zero_with))
+
+def run_baseline(n_remaining, blocks, replace_zero_with=0.00000001):
+    """
+    Evaluate the baseline model, where each remaining item has an equal probability of being retrieved.
+    The baseline has no free parameters, so its log-likelihood is calculated directly from the number of
+    remaining items for each transition (a retrieval strength of 1 / n_remaining)
+
+    Arguments:
+        n_remaining (np.ndarray): The number of remaining items for each transition
+        blocks (iterable): The (participant, start, stop) rows of each participant
+        replace_zero_with (float): As in negative_log_likelihood, the smallest likelihood allowed
+
+    Returns:
+        (pd.DataFrame): A DataFrame of model fit statistics per participant, as from fitting.run_model
+    """
+
+    participants, starts, stops = [np.array(x) for x in zip(*blocks)]
+
+    loss = baseline_transition_loss(n_remaining, replace_zero_with)
+
+    # sum over each participant's transitions
+    cumulative = np.concatenate([[0.], np.cumsum(loss)])
+    all_loss = cumulative[stops] - cumulative[starts]
+    all_nrows = stops - starts
+
+    results_df = pd.DataFrame([participants, all_loss, [True] * len(participants), all_nrows]).T
+    results_df.columns = ['participant', 'loss', 'converged', 'nrows']
+    results_df['dummy'] = 0.
+    results_df['model'] = str(['dummy'])
+    results_df['k'] = 0
+    results_df['nit'] = 0
+    results_df['nfev'] = 0
+
+    return results_df
@@ -0,0 +1,318 @@
+"""Bootstrap confidence intervals for the model comparison statistics, aggregated over a stream of resamples"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from memory_analyses.models.baseline import baseline_transition_loss
+from memory_analyses.models.fitting import build_model, fit_participant, map_tasks
+from memory_analyses.utilities.stats import QuantileSketch, bic
+
+# resample participants (reusing their fits), or the transitions within each participant (refitting each model)
+METHODS = ('participants', 'transitions')
+
+def comparison_statistics(loss, nrows, k, baseline_loss, mean_weights):
+    """
+    Calculate the model comparison statistics of a model (as in the model comparison summary) for each
+    of a set of resamples
+
+    Arguments:
+        loss (np.ndarray): The total negative log-likelihood of the model in each resample
+        nrows (np.ndarray): The number of transitions in each resample
+        k (int): The number of free parameters of the model
+        baseline_loss (np.ndarray): The total negative log-likelihood of the baseline model in each resample
+        mean_weights (dict): The mean attention weight of each representation in each resample
+
+    Returns:
+        (dict): The BIC improvement over the baseline (bic_improvement) and the mean weight of each
+            representation, for each resample
+    """
+
+    model_bic = bic(-loss, nrows, k)
+    baseline_bic = bic(-baseline_loss, nrows, 0)
+
+    statistics = {'bic_improvement': ((baseline_bic - model_bic) / model_bic) * 100}
+    statistics.update(mean_weights)
+
+    return statistics
+
+def resample_transitions(start, stop, seed, resample, block):
+    """
+    Resample the transitions of a participant with replacement. The resample is determined by the seed,
+    the resample number and the participant's block number, so every model is fitted to the same resample
+
+    Returns:
+        (np.ndarray): The resampled rows
+    """
+
+    random_state = np.random.default_rng([seed, resample, block])
+
+    return start + random_state.integers(0, stop - start, stop - start)
+
+def _model_arrays(fitted, participants):
+    """The loss and weights of each fitted model, aligned to the participants"""
+
+    models = []
+    for representations, results in fitted.items():
+        results = results.set_index('participant').reindex(participants)
+        models.append((
+            list(representations),
+            results['loss'].values.astype(float),
+            results[list(representations)].values.astype(float),
+        ))
+
+    return models
+
+def _weighted_statistics(counts, representations, loss, weights, baseline_loss, nrows):
+    """
+    The comparison statistics of a model for resamples of its participants, given the number of times
+    each participant is drawn in each resample (resamples x participants). As in the model comparison
+    summary, missing losses and weights are left out of the sums and means
+    """
+
+    mean_weights = {
+        rep: (counts @ np.nan_to_num(weights[:, i])) / (counts @ ~np.isnan(weights[:, i]))
+        for i, rep in enumerate(representations)
+    }
+
+    return comparison_statistics(
+        counts @ np.nan_to_num(loss), counts @ nrows, len(representations), counts @ baseline_loss, mean_weights,
+    )
+
+class BootstrapSummary(object):
+    """
+    Aggregate the statistics of each bootstrap resample into streaming quantile sketches (see
+    QuantileSketch), so that the replicates are never all kept in memory
+
+    Arguments:
+        confidence (float): The confidence interval [0, 1]
+        capacity (int): The capacity of each quantile sketch
+        seed (int): Random seed for the quantile sketches
+    """
+
+    def __init__(self, confidence=0.95, capacity=256, seed=0):
+        super(BootstrapSummary, self).__init__()
+        self.confidence = confidence
+        self.capacity = capacity
+        self.seed = seed
+        self.estimates = {}
+        self.sketches = {}
+
+    def set_estimates(self, fitted, baseline_df):
+        """Calculate the statistics of each model on the full data (see ModelSearch.fitted and baseline.run_baseline)"""
+
+        participants = baseline_df['participant'].values
+        ones = np.ones((1, participants.shape[0]))
+
+        for representations, loss, weights in _model_arrays(fitted, participants):
+            statistics = _weighted_statistics(
+                ones, representations, loss, weights,
+                baseline_df['loss'].values.astype(float), baseline_df['nrows'].values.astype(float),
+            )
+            for statistic, values in statistics.items():
+                self.estimates[(str(representations), statistic)] = float(values[0])
+
+    def update(self, model, statistics):
+        """Add the statistics (a dict of values for each resample) of a model to the summary"""
+
+        for statistic, values in statistics.items():
+            key = (model, statistic)
+            if key not in self.sketches:
+                self.sketches[key] = QuantileSketch(self.capacity, self.seed)
+            self.sketches[key].update(values)
+
+    def summary(self):
+        """
+        Returns:
+            (pd.DataFrame): The estimate, the bootstrap confidence interval (lower, upper), the median and the
+                number of resamples of each statistic of each model
+        """
+
+        alpha = (1. - self.confidence) / 2.
+
+        rows = []
+        for (model, statistic), sketch in self.sketches.items():
+            lower, median, upper = sketch.quantile([alpha, 0.5, 1. - alpha])
+            rows.append([
+                model, statistic, self.estimates.get((model, statistic), np.nan), lower, median, upper, sketch.count,
+            ])
+
+        return pd.DataFrame(rows, columns=['model', 'statistic', 'estimate', 'lower', 'median', 'upper', 'n_resamples'])
+
+def bootstrap_participants(fitted, baseline_df, summary, n_resamples=1000, chunk_size=100, seed=0):
+    """
+    Bootstrap the model comparison statistics by resampling participants with replacement. Participants
+    are fitted independently, so no model is refitted: each chunk of resamples is a matrix of the number
+    of times each participant is drawn, and the statistics of every resample in the chunk are
+    calculated from their existing fits at once
+
+    Arguments:
+        fitted (dict): Results of each model (see ModelSearch.fitted), for the participants of baseline_df
+        baseline_df (pd.DataFrame): Results of the baseline model (see baseline.run_baseline)
+        summary (BootstrapSummary): The summary to add the statistics of each resample to
+        n_resamples (int): The number of resamples
+        chunk_size (int): The number of resamples to calculate at once
+        seed (int): Random seed
+    """
+
+    random_state = np.random.default_rng(seed)
+
+    participants = baseline_df['participant'].values
+    n_participants = participants.shape[0]
+    baseline_loss = baseline_df['loss'].values.astype(float)
+    nrows = baseline_df['nrows'].values.astype(float)
+
+    models = _model_arrays(fitted, participants)
+
+    for first in range(0, n_resamples, chunk_size):
+
+        size = min(chunk_size, n_resamples - first)
+        counts = random_state.multinomial(n_participants, np.full(n_participants, 1. / n_participants), size=size)
+        counts = counts.astype(float)
+
+        for representations, loss, weights in models:
+            summary.update(
+                str(representations),
+                _weighted_statistics(counts, representations, loss, weights, baseline_loss, nrows),
+            )
+
+def _fit_resampled_task(current_sims, subs_sims, task):
+    """
+    Fit a (model, representations, (block, x0), (seed, resample, block number)) task to a resample of the
+    block's transitions (see resample_transitions)
+    """
+
+    model, representations, ((participant, start, stop), x0), key = task
+
+    rows = resample_transitions(start, stop, *key)
+
+    return fit_participant(
+        model,
+        [current_sims[rep][rows] for rep in representations],
+        [subs_sims[rep].take(rows) for rep in representations],
+        ((participant, 0, rows.shape[0]), x0),
+    )
+
+def bootstrap_transitions(current_sims, subs_sims, n_remaining, blocks, fitted, summary, n_resamples=1000, seed=0,
+                          pool=None, jobs=1, multi_start=None, engine='segment', engine_args=None):
+    """
+    Bootstrap the model comparison statistics by resampling the transitions within each participant,
+    refitting every model to each resample. Each fit starts from the participant's weights on the full
+    data. The resamples are fitted in windows across the pool, and the statistics of each resample are
+    added to the summary as soon as its window has finished
+
+    Arguments:
+        current_sims (dict): The numerator similarities of every transition, for each representation
+        subs_sims (dict): The remaining similarities of every transition, for each representation
+        n_remaining (np.ndarray): The number of remaining items for each transition (for the baseline model)
+        blocks (ParticipantBlocks): The participant blocks that the models were fitted to
+        fitted (dict): Results of each model for the blocks (see ModelSearch.fitted)
+        summary (BootstrapSummary): The summary to add the statistics of each resample to
+        n_resamples (int): The number of resamples
+        seed (int): Random seed
+        pool (multiprocessing.Pool): Optionally, a pool of workers holding the same data (see worker_pool)
+        jobs (int): The number of processes in the pool
+    """
+
+    blocks = list(blocks)
+    nrows = float(sum(stop - start for _, start, stop in blocks))
+
+    models = [
+        (list(subset), build_model(len(subset), multi_start, engine, engine_args),
+         np.nan_to_num(results[list(subset)].values.astype(float)))
+        for subset, results in fitted.items()
+    ]
+
+    window = max(jobs, 1) * 4
+
+    for first in range(0, n_resamples, window):
+
+        resamples = list(range(first, min(first + window, n_resamples)))
+
+        tasks = [
+            (model, representations, (block, x0s[i]), (seed, resample, i))
+            for resample in resamples
+            for representations, model, x0s in models
+            for i, block in enumerate(blocks)
+        ]
+
+        fits = list(map_tasks(_fit_resampled_task, current_sims, subs_sims, tasks, pool=pool, jobs=jobs))
+
+        # (resamples x models x participants) losses, in the order of the tasks
+        losses = np.array([fit[1] for fit in fits], dtype=float).reshape(len(resamples), len(models), len(blocks))
+        weights = [fit[2] for fit in fits]
+
+        for r, resample in enumerate(resamples):
+
+            baseline_loss = sum(
+                baseline_transition_loss(n_remaining[resample_transitions(start, stop, seed, resample, i)]).sum()
+                for i, (_, start, stop) in enumerate(blocks)
+            )
+
+            for m, (representations, _, _) in enumerate(models):
+
+                offset = (r * len(models) + m) * len(blocks)
+                model_weights = np.array(weights[offset:offset + len(blocks)], dtype=float).reshape(len(blocks), -1)
+
+                summary.update(str(representations), comparison_statistics(
+                    np.array([np.nansum(losses[r, m])]), np.array([nrows]), len(representations),
+                    np.array([baseline_loss]),
+                    {rep: np.array([np.nanmean(model_weights[:, i])]) for i, rep in enumerate(representations)},
+                ))
+
+def bootstrap_conditions(settings, current_sims, subs_sims, n_remaining, blocks, searches, baselines, pool=None,
+                         jobs=1, multi_start=None, engine='segment', engine_args=None):
+    """
+    Bootstrap confidence intervals for the comparison statistics of every fitted model of each condition, and
+    log them (and write them to the output CSV, if one is given)
+
+    Arguments:
+        settings (dict): The bootstrap settings (see config/retrieval.py): the method (one of METHODS),
+            n_resamples, confidence, seed and output
+        current_sims (dict): The numerator similarities of every transition, for each representation
+        subs_sims (dict): The remaining similarities of every transition, for each representation
+        n_remaining (np.ndarray): The number of remaining items for each transition (for the baseline model)
+        blocks (dict): The participant blocks of each condition
+        searches (dict): The ModelSearch of each condition, with its fitted models
+        baselines (dict): The results of the baseline model for each condition (see run_baseline)
+        pool (multiprocessing.Pool): Optionally, a pool of workers holding the same data (see worker_pool)
+        jobs (int): The number of processes in the pool
+
+    Returns:
+        (pd.DataFrame): The confidence intervals of each condition (see BootstrapSummary.summary)
+    """
+
+    method = settings.get('method', 'participants')
+    n_resamples = settings.get('n_resamples', 1000)
+    seed = settings.get('seed', 0)
+
+    results = []
+
+    for condition, search in searches.items():
+        logging.info('Bootstrapping {0} ({1} resamples of {2})'.format(condition, n_resamples, method))
+
+        summary = BootstrapSummary(confidence=settings.get('confidence', 0.95), seed=seed)
+        summary.set_estimates(search.fitted, baselines[condition])
+
+        if method == 'participants':
+            bootstrap_participants(search.fitted, baselines[condition], summary, n_resamples=n_resamples, seed=seed)
+        else:
+            bootstrap_transitions(
+                current_sims, subs_sims, n_remaining, blocks[condition], search.fitted, summary,
+                n_resamples=n_resamples, seed=seed, pool=pool, jobs=jobs, multi_start=multi_start, engine=engine,
+                engine_args=engine_args,
+            )
+
+        bootstrap_df = summary.summary()
+        bootstrap_df.insert(0, 'condition', condition)
+        results.append(bootstrap_df)
+
+        logging.info('*** BOOTSTRAP CONFIDENCE INTERVALS ({0}) ***'.format(condition))
+        logging.info('\n' + bootstrap_df.to_string(index=False))
+
+    results = pd.concat(results)
+    if settings.get('output'):
+        results.to_csv(settings['output'], index=False)
+
+    return results
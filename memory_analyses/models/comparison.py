@@ -0,0 +1,145 @@
+"""Model comparison statistics for any number of models and representations, kept separate from their display"""
+
+import ast
+
+import numpy as np
+import pandas as pd
+from scipy.stats import t
+
+from memory_analyses.utilities.stats import aic, bic
+
+# the columns of the numeric summary (see comparison_summary), before the representation columns
+SUMMARY_COLUMNS = [
+    'k', 'loss', 'aic', 'bic', 'baseline_aic', 'baseline_bic', 'aic_improvement', 'bic_improvement', 'baseline_loss',
+]
+
+def model_representations(models):
+    """
+    Find the representations of a set of models from their names (e.g. "['cooc', 'w2v']", as in the model
+    column of the fit results), in the order they first appear. The baseline model (['dummy']) is skipped
+
+    Arguments:
+        models (iterable): The model names
+
+    Returns:
+        (list): The representations
+    """
+
+    representations = []
+    for model in pd.unique(pd.Series(list(models), dtype=object)):
+        for rep in ast.literal_eval(model):
+            if rep != 'dummy' and rep not in representations:
+                representations.append(rep)
+
+    return representations
+
+def comparison_summary(model_results, baseline_df, representations=None, confidence=0.95):
+    """
+    Calculate the model comparison statistics of each model: its total log-likelihood, AIC and BIC, their
+    improvement over the baseline model (as a percentage), and the mean attention weight of each
+    representation with the half-width of its confidence interval (as in mean_confidence_interval). Every
+    statistic is calculated for all of the models at once, from a single grouping of the results
+
+    Arguments:
+        model_results (pd.DataFrame): The fit results of each model for each participant (see fitting.run_model),
+            with a column of weights for each representation
+        baseline_df (pd.DataFrame): The results of the baseline model (see baseline.run_baseline)
+        representations (list): The representation columns (by default, every representation in the
+            model names, see model_representations)
+        confidence (float): The confidence interval [0, 1]
+
+    Returns:
+        (pd.DataFrame): The statistics of each model (indexed by model, in the order of their names), with
+            a column for the mean weight of each representation (<rep>) and its confidence interval (<rep>_ci).
+            Weights of representations that are not in a model are missing
+    """
+
+    if representations is None:
+        representations = model_representations(model_results['model'])
+    representations = list(representations)
+
+    grouped = model_results.groupby('model')
+
+    totals = grouped.agg({'loss': 'sum', 'nrows': 'sum', 'k': 'max'})
+    ll = -totals['loss'].values.astype(float)
+    n = totals['nrows'].values.astype(float)
+    k = totals['k'].values.astype(float)
+
+    # the baseline model has no parameters
+    baseline_ll = -float(baseline_df['loss'].sum())
+    baseline_n = float(baseline_df['nrows'].sum())
+    baseline_aic, baseline_bic = aic(baseline_ll, baseline_n, 0), bic(baseline_ll, baseline_n, 0)
+
+    model_aic, model_bic = aic(ll, n, k), bic(ll, n, k)
+
+    summary = pd.DataFrame({
+        'k': totals['k'].values,
+        'loss': ll,
+        'aic': model_aic,
+        'bic': model_bic,
+        'baseline_aic': baseline_aic,
+        'baseline_bic': baseline_bic,
+        'aic_improvement': ((baseline_aic - model_aic) / model_aic) * 100,
+        'bic_improvement': ((baseline_bic - model_bic) / model_bic) * 100,
+        'baseline_loss': baseline_ll,
+    }, index=totals.index, columns=SUMMARY_COLUMNS)
+
+    # the mean weight of each representation (over the participants with a weight), and its confidence
+    # interval, which is missing if any participant is missing a weight (or there are too few of them)
+    weights = model_results.reindex(columns=representations).astype(float).groupby(model_results['model'].values)
+
+    means = weights.mean()
+    size = weights.size().values[:, np.newaxis]
+    present = weights.count().values
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        half_width = weights.std().values / np.sqrt(size) * t.ppf((1 + confidence) / 2., size - 1)
+    half_width[present < size] = np.nan
+
+    for i, rep in enumerate(representations):
+        summary[rep] = means[rep].values
+        summary[rep + '_ci'] = half_width[:, i]
+
+    return summary
+
+def format_weights(summary, representations, decimals=3):
+    """
+    Format the mean weight of each representation with its confidence interval, as "mean (ci)", for display
+
+    Arguments:
+        summary (pd.DataFrame): The model comparison statistics (see comparison_summary)
+        representations (list): The representations to format
+        decimals (int): The number of decimals to round the weights to
+
+    Returns:
+        (pd.DataFrame): The statistics, with a formatted column for each representation in place of its mean
+            and confidence interval (missing where neither is known)
+    """
+
+    formatted = summary[SUMMARY_COLUMNS].copy()
+
+    for rep in representations:
+        mean = summary[rep].round(decimals).astype(str)
+        ci = summary[rep + '_ci'].round(decimals).astype(str)
+
+        formatted[rep] = (mean + ' (' + ci + ')').where(summary[rep].notna() | summary[rep + '_ci'].notna())
+
+    return formatted
+
+def _model_comparison_summary(model_results, baseline_df, representations=None):
+    """
+    Calculate model comparison statistics for each model, such as AIC and BIC (see comparison_summary), with
+    the mean attention weights formatted for display
+    """
+
+    if representations is None:
+        representations = model_representations(model_results['model'])
+
+    return format_weights(comparison_summary(model_results, baseline_df, representations), representations)
+
+def comparison_table(model_results, baseline_df, representations):
+    """The model comparison statistics of each model (see _model_comparison_summary), ordered for the paper"""
+
+    model_fw = _model_comparison_summary(model_results, baseline_df, representations)
+
+    return model_fw.sort_values(['k', 'bic_improvement'])
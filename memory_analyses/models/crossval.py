@@ -0,0 +1,179 @@
+"""Leave-one-list-out cross-validation of the fitted models, within each participant"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from memory_analyses.models.baseline import baseline_transition_loss
+from memory_analyses.models.fitting import build_model, fit_participant, map_tasks
+
+def _cv_folds(blocks, listnums):
+    """
+    The leave-one-list-out folds of each participant with more than one list
+
+    Arguments:
+        blocks (ParticipantBlocks): The participant blocks, ordered by list within each participant
+            (see condition_blocks)
+        listnums (np.ndarray): The list number of each transition
+
+    Returns:
+        (list): The (block number, held-out list number, (start, stop) of the held-out list) of each fold
+    """
+
+    folds = []
+    for i, (_, start, stop) in enumerate(blocks):
+
+        lists = listnums[start:stop]
+        starts = start + np.flatnonzero(np.concatenate([[True], lists[1:] != lists[:-1]]))
+
+        if starts.shape[0] < 2:
+            continue
+
+        stops = np.append(starts[1:], stop)
+        folds.extend((i, listnums[a], (a, b)) for a, b in zip(starts, stops))
+
+    return folds
+
+def _fit_fold_task(current_sims, subs_sims, task):
+    """
+    Fit a (model, representations, (block, x0), (start, stop) of a held-out list) task to the participant's
+    other lists, and score the fitted model on the held-out list
+    """
+
+    model, representations, ((participant, start, stop), x0), (held_start, held_stop) = task
+
+    train = np.concatenate([np.arange(start, held_start), np.arange(held_stop, stop)])
+
+    fit = fit_participant(
+        model,
+        [current_sims[rep][train] for rep in representations],
+        [subs_sims[rep].take(train) for rep in representations],
+        ((participant, 0, train.shape[0]), x0),
+    )
+
+    held_out_loss = model.score(
+        [current_sims[rep][held_start:held_stop] for rep in representations],
+        [subs_sims[rep].slice(held_start, held_stop) for rep in representations],
+        fit[2],
+    )
+
+    return fit + (held_out_loss,)
+
+def cross_validate(current_sims, subs_sims, n_remaining, listnums, blocks, fitted, pool=None, jobs=1,
+                   multi_start=None, engine='segment', engine_args=None):
+    """
+    Leave-one-list-out cross-validation within each participant: each model is fitted to all but one of a
+    participant's lists, and scored on the held-out list. Each fold starts from the participant's fit to
+    all of their lists, and the folds of every model are fitted as one set of tasks
+
+    Arguments:
+        current_sims (dict): The numerator similarities of every transition, for each representation
+        subs_sims (dict): The remaining similarities of every transition, for each representation
+        n_remaining (np.ndarray): The number of remaining items for each transition (for the baseline model)
+        listnums (np.ndarray): The list number of each transition
+        blocks (ParticipantBlocks): The participant blocks that the models were fitted to
+        fitted (dict): Results of each model for the blocks (see ModelSearch.fitted)
+        pool (multiprocessing.Pool): Optionally, a pool of workers holding the same data (see worker_pool)
+        jobs (int): The number of processes in the pool
+
+    Returns:
+        (pd.DataFrame): The weights, training loss and held-out loss of each model for each fold, with the
+            held-out loss of the baseline model
+    """
+
+    blocks = list(blocks)
+    folds = _cv_folds(blocks, listnums)
+
+    tasks = []
+    for subset, results in fitted.items():
+        model = build_model(len(subset), multi_start, engine, engine_args)
+        x0s = np.nan_to_num(results[list(subset)].values.astype(float))
+        tasks.extend((model, list(subset), (blocks[i], x0s[i]), held_out) for i, _, held_out in folds)
+
+    logging.info('Cross-validating {0} models over {1} folds'.format(len(fitted), len(folds)))
+
+    fits = map_tasks(_fit_fold_task, current_sims, subs_sims, tasks, pool=pool, jobs=jobs)
+
+    records = []
+    for (_, representations, (_, _), (held_start, held_stop)), fold, fit in zip(tasks, folds * len(fitted), fits):
+
+        participant, loss, weights, success, nrows = fit[:5]
+
+        record = {
+            'model': str(representations),
+            'k': len(representations),
+            'participant': participant,
+            'held_out_list': fold[1],
+            'loss': loss,
+            'converged': success,
+            'nrows': nrows,
+            'held_out_loss': fit[-1],
+            'held_out_nrows': held_stop - held_start,
+            'baseline_held_out_loss': baseline_transition_loss(n_remaining[held_start:held_stop]).sum(),
+        }
+        record.update(zip(representations, weights))
+        records.append(record)
+
+    return pd.DataFrame(records)
+
+def cv_summary(cv_results):
+    """
+    Summarise the held-out loss of each model over every fold, and its improvement over the baseline model
+    (as a percentage, in the same way as the BIC improvement)
+    """
+
+    summary = cv_results.groupby('model', sort=False).agg({
+        'k': 'max', 'held_out_loss': 'sum', 'baseline_held_out_loss': 'sum', 'held_out_nrows': 'sum',
+        'participant': 'nunique',
+    })
+    summary['held_out_improvement'] = (
+        (summary['baseline_held_out_loss'] - summary['held_out_loss']) / summary['held_out_loss']) * 100
+    summary['held_out_loss_per_transition'] = summary['held_out_loss'] / summary['held_out_nrows']
+
+    return summary.sort_values(['k', 'held_out_improvement'])
+
+def cross_validate_conditions(current_sims, subs_sims, n_remaining, listnums, blocks, searches, output=None,
+                              pool=None, jobs=1, multi_start=None, engine='segment', engine_args=None):
+    """
+    Cross-validate the fitted models of each condition (see cross_validate), logging the held-out loss of
+    each model (and writing the loss of every fold to the output CSV, if one is given)
+
+    Arguments:
+        current_sims (dict): The numerator similarities of every transition, for each representation
+        subs_sims (dict): The remaining similarities of every transition, for each representation
+        n_remaining (np.ndarray): The number of remaining items for each transition (for the baseline model)
+        listnums (np.ndarray): The list number of each transition
+        blocks (dict): The participant blocks of each condition
+        searches (dict): The ModelSearch of each condition, with its fitted models
+        output (str): Optionally, the path to write the loss of every fold to
+        pool (multiprocessing.Pool): Optionally, a pool of workers holding the same data (see worker_pool)
+        jobs (int): The number of processes in the pool
+
+    Returns:
+        (list): The results of each condition that could be cross-validated (see cross_validate)
+    """
+
+    cv_results = []
+
+    for condition, search in searches.items():
+        condition_cv = cross_validate(
+            current_sims, subs_sims, n_remaining, listnums, blocks[condition], search.fitted, pool=pool, jobs=jobs,
+            multi_start=multi_start, engine=engine, engine_args=engine_args,
+        )
+
+        if condition_cv.shape[0] == 0:
+            logging.warning('No participant has more than one list in condition {0}, so it cannot be '
+                            'cross-validated'.format(condition))
+            continue
+
+        condition_cv.insert(0, 'condition', condition)
+        cv_results.append(condition_cv)
+
+        logging.info('*** CROSS-VALIDATED MODEL COMPARISON ({0}) ***'.format(condition))
+        logging.info('\n' + cv_summary(condition_cv).to_string())
+
+    if output and len(cv_results) > 0:
+        pd.concat(cv_results).to_csv(output, index=False)
+
+    return cv_results
@@ -0,0 +1,970 @@
+"""Engines for evaluating SAM retrieval strengths"""
+
+import numpy as np
+
+def _stack_current_sims(current_sims):
+    """Stack the numerator similarities into a (transitions x probes) float array"""
+
+    sims = np.column_stack(current_sims)
+
+    # replace any missing entries with 0
+    if sims.dtype.kind in ('O', 'U', 'S'):
+        sims[sims == ""] = "0.0"
+
+    return sims.astype(float)
+
+def _segment_reduce(ufunc, x, offsets, identity=0.):
+    """
+    Reduce the values of each transition's remaining items (e.g. with np.add or np.maximum)
+
+    Arguments:
+        ufunc (np.ufunc): The reduction
+        x (np.ndarray): (remaining items,) or (remaining items x ...) values
+        offsets (np.ndarray): Offsets of each transition's remaining items within x
+        identity (float): The result for transitions without any remaining items
+
+    Returns:
+        (np.ndarray): (transitions,) or (transitions x ...) reduced values
+    """
+
+    lengths = np.diff(offsets)
+    result = np.full((lengths.shape[0],) + x.shape[1:], identity, dtype=np.result_type(x, identity))
+
+    # reduceat reduces from each start to the next, so only the (strictly increasing) starts of
+    # transitions with items are given; empty transitions keep the identity
+    nonempty = lengths > 0
+    if nonempty.any():
+        result[nonempty] = ufunc.reduceat(x[:offsets[-1]], offsets[:-1][nonempty], axis=0)
+
+    return result
+
+def _divide_strengths(num, denom):
+    """
+    Divide the numerators by the denominators of the retrieval strengths. A transition without any remaining
+    items (a 0 denominator) has a strength of 1, or 0 if its numerator is also 0
+
+    Returns:
+        (np.ndarray): Retrieval strengths between 0 and 1 (nan and -inf are 0, inf is 1)
+    """
+
+    num, denom = np.broadcast_arrays(np.asarray(num, dtype=float), np.asarray(denom, dtype=float))
+
+    rs = np.divide(num, denom, out=np.where(num > 0, 1., 0.), where=denom != 0)
+
+    return np.nan_to_num(rs, 0, nan=0, neginf=0, posinf=1)
+
+def _divide_expected(expected, denom):
+    """
+    Divide the (transitions x probes) weighted sums of the log similarities by the denominators, to give the
+    expected log similarities. A transition without any remaining items has none (nan)
+    """
+
+    denom = np.broadcast_to(denom[:, None], expected.shape)
+
+    return np.divide(expected, denom, out=np.full(expected.shape, np.nan), where=denom != 0)
+
+class LoopEngine(object):
+    """
+    Reference engine, which calculates the denominator separately for each transition
+
+    Arguments:
+        jitter_val (float): A small number to add to negative or 0 similarity values
+    """
+
+    def __init__(self, jitter_val=1.0e-7):
+        super(LoopEngine, self).__init__()
+        self.jitter_val = jitter_val
+
+    @property
+    def settings(self):
+        """The settings that can change the engine's results (e.g. to identify a fit in the fit store)"""
+
+        return {'jitter_val': self.jitter_val}
+
+    def prepare(self, current_sims, subs_sims):
+        """Prepare the similarities for repeated evaluation"""
+
+        return current_sims, subs_sims
+
+    def _attention_weighted_probe_product(self, sims, a_weights):
+        """Calculate the model numerator"""
+
+        sims = np.column_stack(sims)
+
+        # replace any missing entries with 0
+        sims[sims == ""] = "0.0"
+
+        sims = sims.astype(float)
+
+        if self.jitter_val is not None:
+            # add a small constant to all probes to ensure that nothing is ever 0
+            sims += self.jitter_val
+
+        # apply the attention weights
+        sims = np.power(sims, a_weights) # np.ma.power(sims, a_weights)  # each weight pertains to a column
+
+        # calculate the product over each probe
+        return sims.prod(axis=1)
+
+    def _calculate_denominator_product_helper(self, probes, a_weights):
+        """Helper function to calculate the probe values from the remaining product sims"""
+
+        # the numerator (product of weighted probes for current basket add)
+        denom = self._attention_weighted_probe_product(probes, a_weights)
+
+        sumprod = denom.sum()  # sum the probe products for the remaining items
+
+        return sumprod
+
+    def retrieval_strengths(self, data, a_weights):
+        """
+        Calculate the retrieval strengths for each item in a sequence
+        (assumes data is already ordered)
+        """
+
+        current_sims, subs_sims = data
+
+        # the numerator (product of weighted probes for current basket add)
+        num = self._attention_weighted_probe_product(
+            current_sims, a_weights
+        )
+
+        # the denominator (product of weighted probes for remaining products to be added)
+        denom = [
+            self._calculate_denominator_product_helper(
+                [probe.row(x) for probe in subs_sims], a_weights
+            )
+            for x in range(len(subs_sims[0]))
+        ]
+
+        # get retrieval strength of current item, given that and remaining items
+        # an array of numbers between 0 and 1 where higher = higher likelihood of current choice
+        return _divide_strengths(num, denom)
+
+class SegmentTransitions(object):
+    """
+    Similarities prepared for the SegmentEngine
+
+    Arguments:
+        current (np.ndarray): (transitions x probes) numerator similarities
+        remaining (np.ndarray): (remaining items x probes) denominator similarities, for all transitions
+        offsets (np.ndarray): Offsets of each transition's remaining items within remaining
+    """
+
+    def __init__(self, current, remaining, offsets):
+        super(SegmentTransitions, self).__init__()
+        self.current = current
+        self.remaining = remaining
+        self.offsets = offsets
+
+        # the transition that each remaining item belongs to
+        self.row_ids = np.repeat(np.arange(len(self)), np.diff(offsets))
+
+        self._log_current = None
+        self._log_remaining = None
+        self._smooth = None
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    @property
+    def n_items(self):
+        """The number of remaining items, over all transitions"""
+
+        return self.remaining.shape[0]
+
+    @property
+    def log_current(self):
+        """Log of the numerator similarities (calculated on first use)"""
+
+        if self._log_current is None:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                self._log_current = np.log(self.current)
+
+        return self._log_current
+
+    @property
+    def log_remaining(self):
+        """Log of the denominator similarities (calculated on first use)"""
+
+        if self._log_remaining is None:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                self._log_remaining = np.log(self.remaining)
+
+        return self._log_remaining
+
+    @property
+    def smooth(self):
+        """
+        Whether or not every similarity is positive and finite. Otherwise the likelihood jumps when an
+        attention weight leaves 0 (e.g. nan ** 0 == 1), which an analytic gradient cannot see
+        """
+
+        if self._smooth is None:
+            self._smooth = bool(
+                np.isfinite(self.log_current).all() and np.isfinite(self.log_remaining).all()
+            )
+
+        return self._smooth
+
+class SegmentEngine(LoopEngine):
+    """
+    Vectorised engine, which weights the remaining items for all transitions in one array operation
+    and sums them for each transition with a segment reduction
+
+    Arguments:
+        jitter_val (float): A small number to add to negative or 0 similarity values
+    """
+
+    def prepare(self, current_sims, subs_sims):
+        """
+        Stack the similarities for all transitions, so that they can be evaluated without any Python loops
+
+        Arguments:
+            current_sims (list): Numerator similarities for each probe
+            subs_sims (list): A RaggedArray of remaining similarities for each probe
+
+        Returns:
+            (SegmentTransitions): The prepared similarities
+        """
+
+        offsets = subs_sims[0].offsets
+        for probe in subs_sims[1:]:
+            if not np.array_equal(probe.offsets, offsets):
+                raise ValueError('Remaining similarities must have the same number of items for each probe')
+
+        current = _stack_current_sims(current_sims)
+        remaining = np.column_stack([probe.values for probe in subs_sims])
+
+        if self.jitter_val is not None:
+            # add a small constant to all probes to ensure that nothing is ever 0
+            current += self.jitter_val
+            remaining = remaining + self.jitter_val
+
+        return SegmentTransitions(current, remaining, offsets)
+
+    def _remaining_products(self, data, a_weights):
+        """
+        Calculate the product of the weighted probes for every remaining item, for a (probes,) set of
+        weights or (remaining items x sets of weights) for a (sets of weights x probes) batch
+        """
+
+        a_weights = np.asarray(a_weights, dtype=float)
+
+        if a_weights.ndim == 1:
+            return np.power(data.remaining, a_weights).prod(axis=1)
+
+        return np.power(data.remaining[:, None, :], a_weights[None, :, :]).prod(axis=2)
+
+    def retrieval_strengths(self, data, a_weights):
+        """
+        Calculate the retrieval strengths for each item in a sequence
+        (assumes data is already ordered)
+        """
+
+        # the numerator (product of weighted probes for current basket add)
+        num = np.power(data.current, a_weights).prod(axis=1)
+
+        # the denominator, summed over the remaining items of each transition
+        denom = np.bincount(
+            data.row_ids,
+            weights=self._remaining_products(data, a_weights),
+            minlength=len(data),
+        )
+
+        # get retrieval strength of current item, given that and remaining items
+        # an array of numbers between 0 and 1 where higher = higher likelihood of current choice
+        return _divide_strengths(num, denom)
+
+    def retrieval_strengths_and_gradient(self, data, a_weights):
+        """
+        Calculate the retrieval strengths and their log-gradients with respect to the attention weights.
+        Each weight is an exponent on a similarity, so the derivative of the log retrieval strength of
+        transition i with respect to weight j is the log numerator similarity minus the expected log
+        similarity over the remaining items (weighted by their retrieval probability)
+
+        The likelihood is only differentiable everywhere when data.smooth is True
+
+        Returns:
+            (np.ndarray): The retrieval strengths
+            (np.ndarray): (transitions x probes) gradients of the log retrieval strengths. Transitions
+                where the gradient is undefined (e.g. a 0 denominator) are given a gradient of 0
+        """
+
+        n = len(data)
+
+        num = np.power(data.current, a_weights).prod(axis=1)
+
+        weighted = self._remaining_products(data, a_weights)
+        denom = np.bincount(data.row_ids, weights=weighted, minlength=n)
+
+        rs = _divide_strengths(num, denom)
+
+        # expected log similarity over the remaining items, for each probe
+        log_remaining = data.log_remaining
+        expected = np.column_stack([
+            np.bincount(data.row_ids, weights=weighted * log_remaining[:, j], minlength=n)
+            for j in range(log_remaining.shape[1])
+        ])
+        expected = _divide_expected(expected, denom)
+
+        gradient = np.nan_to_num(data.log_current - expected, nan=0, neginf=0, posinf=0)
+
+        return rs, gradient
+
+    def batch_retrieval_strengths(self, data, a_weights_batch, max_elements=1 << 24):
+        """
+        Calculate the retrieval strengths for many sets of attention weights at once
+
+        Arguments:
+            data (SegmentTransitions): The prepared similarities
+            a_weights_batch (np.ndarray): (sets of weights x probes) attention weights
+            max_elements (int): The largest intermediate array to create; the weights are
+                evaluated in chunks to stay below this
+
+        Returns:
+            (np.ndarray): (transitions x sets of weights) retrieval strengths
+        """
+
+        a_weights_batch = np.atleast_2d(np.asarray(a_weights_batch, dtype=float))
+        n_weights, k = a_weights_batch.shape
+        n_items = data.n_items
+
+        chunk = max(1, max_elements // max(n_items * k, 1))
+
+        rs = np.empty((len(data), n_weights))
+        for i in range(0, n_weights, chunk):
+            weights = a_weights_batch[i:i + chunk]
+
+            # (transitions/items x weights) products of the weighted probes
+            num = np.power(data.current[:, None, :], weights[None, :, :]).prod(axis=2)
+            weighted = self._remaining_products(data, weights)
+
+            denom = _segment_reduce(np.add, weighted, data.offsets)
+
+            rs[:, i:i + chunk] = _divide_strengths(num, denom)
+
+        return rs
+
+def _weighted_log_sims(log_sims, a_weights):
+    """
+    Weight and sum log similarities, i.e. log_sims @ a_weights.T for (probes,) or (sets x probes) weights.
+    As with sim ** 0 == 1, a weight of 0 ignores the similarity even when its log is nan or -inf.
+    Weights are assumed to be non-negative
+    """
+
+    a_weights = np.asarray(a_weights, dtype=float)
+
+    finite = np.isfinite(log_sims)
+    if finite.all():
+        return log_sims @ a_weights.T
+
+    weighted = np.where(finite, log_sims, 0.) @ a_weights.T
+
+    # any non-finite similarity with a non-zero weight makes the weighted sum non-finite
+    nonzero = (a_weights != 0).astype(float)
+    weighted[np.isneginf(log_sims).astype(float) @ nonzero.T > 0] = -np.inf
+    weighted[np.isnan(log_sims).astype(float) @ nonzero.T > 0] = np.nan
+
+    return weighted
+
+def _segment_logsumexp(x, data):
+    """
+    Calculate the log of the summed exp(x) over each transition's remaining items, without underflow
+
+    Arguments:
+        x (np.ndarray): (remaining items,) or (remaining items x sets of weights) values
+        data (SegmentTransitions): The prepared similarities, giving the transition of each item
+
+    Returns:
+        (np.ndarray): (transitions,) or (transitions x sets of weights) log sums
+    """
+
+    # subtract the largest value of each transition before taking exponents
+    largest = _segment_reduce(np.maximum, x, data.offsets, identity=0.)
+    largest[~np.isfinite(largest)] = 0.
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total = _segment_reduce(np.add, np.exp(x - largest[data.row_ids]), data.offsets)
+        return np.log(total) + largest
+
+class LogSpaceEngine(SegmentEngine):
+    """
+    Vectorised engine that works with log retrieval strengths: the weighted sum of the log numerator
+    similarities minus a logsumexp over the remaining items. This avoids the underflow of products of
+    powered similarities (which would otherwise be clamped by the loss function)
+
+    Arguments:
+        jitter_val (float): A small number to add to negative or 0 similarity values
+    """
+
+    # log_retrieval_strengths can be used in place of retrieval_strengths
+    log_space = True
+
+    def log_retrieval_strengths(self, data, a_weights):
+        """
+        Calculate the log retrieval strengths for each item in a sequence
+        (assumes data is already ordered)
+        """
+
+        num = _weighted_log_sims(data.log_current, a_weights)
+        denom = _segment_logsumexp(_weighted_log_sims(data.log_remaining, a_weights), data)
+
+        with np.errstate(invalid='ignore'):
+            return num - denom
+
+    def retrieval_strengths(self, data, a_weights):
+        """
+        Calculate the retrieval strengths for each item in a sequence
+        (assumes data is already ordered)
+        """
+
+        with np.errstate(over='ignore'):
+            rs = np.exp(self.log_retrieval_strengths(data, a_weights))
+
+        return np.nan_to_num(rs, 0, nan=0, neginf=0, posinf=1)
+
+    def log_retrieval_strengths_and_gradient(self, data, a_weights):
+        """
+        Calculate the log retrieval strengths and their gradients with respect to the attention weights
+        (see SegmentEngine.retrieval_strengths_and_gradient)
+
+        Returns:
+            (np.ndarray): The log retrieval strengths
+            (np.ndarray): (transitions x probes) gradients of the log retrieval strengths
+        """
+
+        num = _weighted_log_sims(data.log_current, a_weights)
+        weighted = _weighted_log_sims(data.log_remaining, a_weights)
+        denom = _segment_logsumexp(weighted, data)
+
+        with np.errstate(invalid='ignore', over='ignore'):
+
+            # the retrieval probability of each remaining item
+            probability = np.exp(weighted - denom[data.row_ids])
+
+            # expected log similarity over the remaining items, for each probe
+            expected = _segment_reduce(np.add, probability[:, None] * data.log_remaining, data.offsets)
+
+            log_rs = num - denom
+
+        gradient = np.nan_to_num(data.log_current - expected, nan=0, neginf=0, posinf=0)
+        gradient[np.diff(data.offsets) == 0] = 0
+
+        return log_rs, gradient
+
+    def retrieval_strengths_and_gradient(self, data, a_weights):
+        """
+        Calculate the retrieval strengths and their log-gradients with respect to the attention weights
+        (see SegmentEngine.retrieval_strengths_and_gradient)
+        """
+
+        log_rs, gradient = self.log_retrieval_strengths_and_gradient(data, a_weights)
+
+        with np.errstate(over='ignore'):
+            rs = np.nan_to_num(np.exp(log_rs), 0, nan=0, neginf=0, posinf=1)
+
+        return rs, gradient
+
+    def batch_log_retrieval_strengths(self, data, a_weights_batch):
+        """
+        Calculate the log retrieval strengths for many sets of attention weights at once
+
+        Arguments:
+            data (SegmentTransitions): The prepared similarities
+            a_weights_batch (np.ndarray): (sets of weights x probes) attention weights
+
+        Returns:
+            (np.ndarray): (transitions x sets of weights) log retrieval strengths
+        """
+
+        a_weights_batch = np.atleast_2d(np.asarray(a_weights_batch, dtype=float))
+
+        num = _weighted_log_sims(data.log_current, a_weights_batch)
+        denom = _segment_logsumexp(_weighted_log_sims(data.log_remaining, a_weights_batch), data)
+
+        with np.errstate(invalid='ignore'):
+            return num - denom
+
+    def batch_retrieval_strengths(self, data, a_weights_batch):
+        """Calculate the retrieval strengths for many sets of attention weights at once"""
+
+        with np.errstate(over='ignore'):
+            rs = np.exp(self.batch_log_retrieval_strengths(data, a_weights_batch))
+
+        return np.nan_to_num(rs, 0, nan=0, neginf=0, posinf=1)
+
+class ApproximateTransitions(SegmentTransitions):
+    """
+    Similarities prepared for the ApproximateEngine. Each transition keeps its most similar remaining
+    items exactly, plus a random sample of its other (tail) items, which are scaled up to stand in
+    for the whole tail
+
+    Arguments:
+        current (np.ndarray): (transitions x probes) numerator similarities
+        remaining (np.ndarray): (kept items x probes) denominator similarities, for all transitions
+        offsets (np.ndarray): Offsets of each transition's kept items within remaining
+        multiplier (np.ndarray): The number of tail items that each kept item stands in for (1 if exact)
+        sampled (np.ndarray): Whether or not each kept item was sampled from the tail
+        n_tail (np.ndarray): The number of tail items of each transition
+        tail_max (np.ndarray): (transitions x probes) largest tail similarity of each transition
+        exact (np.ndarray): Whether or not each transition was kept exactly
+        source (tuple): The numerator and remaining similarities this was prepared from
+        check (tuple): The rows used to check the approximation, and their exactly prepared similarities
+    """
+
+    def __init__(self, current, remaining, offsets, multiplier, sampled, n_tail, tail_max, exact, source, check):
+        super(ApproximateTransitions, self).__init__(current, remaining, offsets)
+        self.multiplier = multiplier
+        self.sampled = sampled
+        self.n_tail = n_tail
+        self.tail_max = tail_max
+        self.exact = exact
+        self.source = source
+        self.check = check
+
+def _rank_within_rows(keys, row_ids, offsets):
+    """Rank items within each row, in lexicographic order of keys (the last key is the primary sort key)"""
+
+    order = np.lexsort(tuple(keys) + (row_ids,))
+
+    rank = np.empty(order.shape[0], dtype=np.int64)
+    rank[order] = np.arange(order.shape[0]) - offsets[row_ids[order]]
+
+    return rank
+
+def _row_blocks(offsets, chunk_size):
+    """Split the rows of a ragged array into contiguous blocks of about chunk_size values (at least one row each)"""
+
+    n, start = offsets.shape[0] - 1, 0
+
+    while start < n:
+        stop = min(max(int(np.searchsorted(offsets, offsets[start] + chunk_size, side='right')) - 1, start + 1), n)
+        yield start, stop
+        start = stop
+
+class ApproximateEngine(SegmentEngine):
+    """
+    Vectorised engine for very large remaining sets (e.g. a whole product vocabulary). The denominator
+    of each transition sums its top_k most similar remaining items (for any probe) exactly, and
+    estimates the sum over the other (tail) items from a random sample of them
+
+    The error of each transition's approximate log-likelihood is bounded using the largest similarities of
+    its tail (see error_bound). After a fit, refine makes any transitions whose bound exceeds max_error exact,
+    and the model is refitted until every transition is within the bound at the fitted weights
+
+    Arguments:
+        jitter_val (float): A small number to add to negative or 0 similarity values
+        top_k (int): The number of most similar remaining items to keep exactly, for each probe
+        tail_samples (int): The number of tail items to sample for each transition
+        max_error (float): The largest error bound allowed on the log-likelihood of a transition
+        check_rows (int): The number of approximated transitions to compare against the exact
+            log-likelihood (see approximation_error)
+        seed (int): Seed for sampling tail items and check rows
+        chunk_size (int): The number of remaining items to select from at a time, when preparing
+    """
+
+    def __init__(self, jitter_val=1.0e-7, top_k=100, tail_samples=100, max_error=0.01, check_rows=20, seed=0,
+                 chunk_size=1 << 20):
+        super(ApproximateEngine, self).__init__(jitter_val)
+        self.top_k = top_k
+        self.tail_samples = tail_samples
+        self.max_error = max_error
+        self.check_rows = check_rows
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+    @property
+    def settings(self):
+        """
+        The settings that can change the engine's results (e.g. to identify a fit in the fit store). The
+        chunk_size only changes how the kept items are selected, not which are kept
+        """
+
+        return dict(
+            super(ApproximateEngine, self).settings, top_k=self.top_k, tail_samples=self.tail_samples,
+            max_error=self.max_error, check_rows=self.check_rows, seed=self.seed,
+        )
+
+    def prepare(self, current_sims, subs_sims, exact=None):
+        """
+        Keep the most similar remaining items of each transition and sample the rest
+
+        Arguments:
+            current_sims (list): Numerator similarities for each probe
+            subs_sims (list): A RaggedArray of remaining similarities for each probe
+            exact (np.ndarray): Optionally, transitions to keep exactly regardless of their size
+
+        Returns:
+            (ApproximateTransitions): The prepared similarities
+        """
+
+        offsets = subs_sims[0].offsets
+        for probe in subs_sims[1:]:
+            if not np.array_equal(probe.offsets, offsets):
+                raise ValueError('Remaining similarities must have the same number of items for each probe')
+
+        current = _stack_current_sims(current_sims)
+        if self.jitter_val is not None:
+            current += self.jitter_val
+
+        n = len(subs_sims[0])
+
+        # only transitions with more remaining items than would be kept are approximated
+        if exact is None:
+            exact = np.zeros(n, dtype=bool)
+        exact = exact | (np.diff(offsets) <= self.top_k + self.tail_samples)
+
+        n_tail = np.zeros(n, dtype=np.int64)
+        n_selected = np.zeros(n, dtype=np.int64)
+        tail_max = np.full((n, len(subs_sims)), -np.inf)
+        selected, multiplier, sampled = [], [], []
+
+        # select from a block of transitions at a time, reading each probe's similarities in place, so
+        # only the selected items are ever copied
+        random_state = np.random.RandomState(self.seed)
+        for start, stop in _row_blocks(offsets, self.chunk_size):
+            first, last = offsets[start], offsets[stop]
+            block_offsets = offsets[start:stop + 1] - first
+            row_ids = np.repeat(np.arange(stop - start), np.diff(block_offsets))
+            values = [probe.values[first:last] for probe in subs_sims]
+
+            # keep the top_k most similar items for each probe
+            keep = exact[start:stop][row_ids]
+            for probe in values:
+                keep |= _rank_within_rows([-probe], row_ids, block_offsets) < self.top_k
+
+            tail = ~keep
+            block_tail = np.bincount(row_ids[tail], minlength=stop - start)
+            n_tail[start:stop] = block_tail
+
+            # sample from the tail of each transition uniformly at random (tail items are ranked first)
+            block_sampled = tail & (
+                _rank_within_rows([random_state.random_sample(tail.shape[0]), keep], row_ids, block_offsets)
+                < self.tail_samples
+            )
+            n_sampled = np.bincount(row_ids[block_sampled], minlength=stop - start)
+
+            # each sampled item stands in for n_tail / n_sampled tail items
+            block_multiplier = np.ones(tail.shape[0])
+            block_multiplier[block_sampled] = (block_tail / np.maximum(n_sampled, 1))[row_ids[block_sampled]]
+
+            for j, probe in enumerate(values):
+                tail_max[start:stop, j] = _segment_reduce(
+                    np.fmax, np.where(tail, probe, -np.inf), block_offsets, -np.inf)
+
+            block_selected = keep | block_sampled
+            n_selected[start:stop] = np.bincount(row_ids[block_selected], minlength=stop - start)
+            selected.append(np.column_stack([probe[block_selected] for probe in values]).astype(float))
+            multiplier.append(block_multiplier[block_selected])
+            sampled.append(block_sampled[block_selected])
+
+        remaining = np.concatenate(selected) if selected else np.empty((0, len(subs_sims)))
+        if self.jitter_val is not None:
+            # add a small constant to all probes to ensure that nothing is ever 0
+            remaining += self.jitter_val
+            tail_max += self.jitter_val
+
+        new_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(n_selected, out=new_offsets[1:])
+
+        # compare a sample of approximated transitions against their exact similarities
+        approximated = np.flatnonzero(~exact)
+        rows = np.sort(random_state.choice(
+            approximated, min(self.check_rows, approximated.shape[0]), replace=False))
+        check = super(ApproximateEngine, self).prepare(
+            [sims[rows] for sims in current_sims], [sims.take(rows) for sims in subs_sims])
+
+        return ApproximateTransitions(
+            current, remaining, new_offsets, np.concatenate(multiplier) if multiplier else np.ones(0),
+            np.concatenate(sampled) if sampled else np.zeros(0, dtype=bool),
+            n_tail, tail_max, exact, (current_sims, subs_sims), (rows, check),
+        )
+
+    def _remaining_products(self, data, a_weights):
+        """Calculate the product of the weighted probes for every remaining item, scaling up sampled tail items"""
+
+        products = super(ApproximateEngine, self)._remaining_products(data, a_weights)
+
+        multiplier = getattr(data, 'multiplier', None)
+        if multiplier is None:
+            return products
+
+        return products * (multiplier if products.ndim == 1 else multiplier[:, None])
+
+    def error_bound(self, data, a_weights):
+        """
+        Bound the error of the approximate log-likelihood of each transition. Every tail item's weighted
+        product is between 0 and the product of the tail's largest similarities, so the exact denominator
+        is between the kept items' sum alone and the kept items plus n_tail items at that product, and the
+        error is at most the larger of the log-ratios of the estimated denominator to these extremes.
+        Attention weights are assumed to be non-negative
+
+        Arguments:
+            data (ApproximateTransitions): The prepared similarities
+            a_weights (np.ndarray): The attention weights
+
+        Returns:
+            (np.ndarray): The error bound of each transition's log-likelihood
+        """
+
+        n = len(data)
+        products = super(ApproximateEngine, self)._remaining_products(data, a_weights)
+        sampled = data.sampled.astype(float)
+
+        kept = np.bincount(data.row_ids, weights=products * (1. - sampled), minlength=n)
+        estimate = np.bincount(data.row_ids, weights=products * data.multiplier * sampled, minlength=n)
+        largest = data.n_tail * np.power(np.maximum(data.tail_max, 0.), a_weights).prod(axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            bound = np.fmax(
+                np.log1p(np.maximum(largest - estimate, 0.) / (kept + estimate)),
+                np.log1p(estimate / kept),
+            )
+
+        bound[data.n_tail == 0] = 0.
+
+        return np.nan_to_num(bound, nan=np.inf)
+
+    def refine(self, data, a_weights):
+        """
+        Make any transitions whose error bound exceeds max_error exact
+
+        Returns:
+            (ApproximateTransitions): The re-prepared similarities, or None if every transition is within the bound
+        """
+
+        coarse = self.error_bound(data, a_weights) > self.max_error
+        if not coarse.any():
+            return None
+
+        return self.prepare(*data.source, exact=data.exact | coarse)
+
+    def make_exact(self, data):
+        """
+        Re-prepare the similarities with every transition exact, e.g. when the check rows show a larger error
+        than max_error
+
+        Returns:
+            (ApproximateTransitions): The re-prepared similarities
+        """
+
+        return self.prepare(*data.source, exact=np.ones(len(data), dtype=bool))
+
+    def approximation_error(self, data, a_weights, replace_zero_with=0.00000001):
+        """
+        Compare the approximate log-likelihood against the exact log-likelihood on the check rows
+
+        Arguments:
+            data (ApproximateTransitions): The prepared similarities
+            a_weights (np.ndarray): The attention weights
+            replace_zero_with (float): As in negative_log_likelihood, the smallest likelihood allowed
+
+        Returns:
+            (dict): The number of approximated transitions, the largest error bound, and the number of
+                rows checked with the mean and largest absolute error of their log-likelihoods
+        """
+
+        rows, check = data.check
+
+        report = {
+            'approximated': int((~data.exact).sum()),
+            'max_bound': float(self.error_bound(data, a_weights).max()) if len(data) > 0 else 0.,
+            'rows_checked': int(rows.shape[0]),
+            'mean_error': 0.,
+            'max_error': 0.,
+        }
+
+        if rows.shape[0] > 0:
+            approximate = np.maximum(self.retrieval_strengths(data, a_weights)[rows], replace_zero_with)
+            exact = np.maximum(self.retrieval_strengths(check, a_weights), replace_zero_with)
+            error = np.abs(np.log(approximate) - np.log(exact))
+            report['mean_error'] = float(error.mean())
+            report['max_error'] = float(error.max())
+
+        return report
+
+class CompactTransitions(object):
+    """
+    Similarities prepared for the CompactEngine. The remaining similarities are stored as float32, one
+    contiguous column per probe, and the working buffers for evaluating them are allocated once and
+    reused by every evaluation. Unlike SegmentTransitions, there is no (remaining items x probes) float64
+    array of the remaining similarities (or of their logs)
+
+    Arguments:
+        current (np.ndarray): (transitions x probes) numerator similarities
+        columns (np.ndarray): (probes x remaining items) float32 denominator similarities
+        offsets (np.ndarray): Offsets of each transition's remaining items within columns
+    """
+
+    def __init__(self, current, columns, offsets):
+        super(CompactTransitions, self).__init__()
+        self.current = current
+        self.columns = columns
+        self.offsets = offsets
+
+        # the transition that each remaining item belongs to, in 32 bits where the indices fit (halving its size)
+        row_ids = np.repeat(np.arange(len(self)), np.diff(offsets))
+        self.row_ids = row_ids.astype(np.int32) if self.n_items < np.iinfo(np.int32).max else row_ids
+
+        # a float64 copy of one column at a time, and the products over the probes
+        self.column = np.empty(self.n_items)
+        self.products = np.empty(self.n_items)
+
+        self._log_current = None
+        self._smooth = None
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    @property
+    def n_items(self):
+        """The number of remaining items, over all transitions"""
+
+        return self.columns.shape[1]
+
+    @property
+    def log_current(self):
+        """Log of the numerator similarities (calculated on first use)"""
+
+        if self._log_current is None:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                self._log_current = np.log(self.current)
+
+        return self._log_current
+
+    @property
+    def smooth(self):
+        """Whether or not every similarity is positive and finite (see SegmentTransitions.smooth)"""
+
+        if self._smooth is None:
+            self._smooth = bool(
+                np.isfinite(self.log_current).all()
+                and all(np.isfinite(column).all() and (column > 0).all() for column in self.columns)
+            )
+
+        return self._smooth
+
+class CompactEngine(SegmentEngine):
+    """
+    Vectorised engine with a compact memory footprint: the remaining similarities are stored as float32,
+    and evaluations work through them one probe at a time in float64 buffers that are reused, rather
+    than creating (remaining items x probes) float64 arrays on every evaluation. Results match the
+    SegmentEngine up to the float32 rounding of the similarities
+
+    Arguments:
+        jitter_val (float): A small number to add to negative or 0 similarity values
+    """
+
+    def prepare(self, current_sims, subs_sims):
+        """
+        Stack the similarities for all transitions, storing the remaining similarities as float32 columns
+
+        Arguments:
+            current_sims (list): Numerator similarities for each probe
+            subs_sims (list): A RaggedArray of remaining similarities for each probe
+
+        Returns:
+            (CompactTransitions): The prepared similarities
+        """
+
+        offsets = subs_sims[0].offsets
+        for probe in subs_sims[1:]:
+            if not np.array_equal(probe.offsets, offsets):
+                raise ValueError('Remaining similarities must have the same number of items for each probe')
+
+        current = _stack_current_sims(current_sims)
+
+        columns = np.empty((len(subs_sims), offsets[-1]), dtype=np.float32)
+        for j, probe in enumerate(subs_sims):
+            columns[j] = probe.values
+
+        if self.jitter_val is not None:
+            # add a small constant to all probes to ensure that nothing is ever 0
+            current += self.jitter_val
+            columns += np.float32(self.jitter_val)
+
+        return CompactTransitions(current, columns, offsets)
+
+    def _remaining_products(self, data, a_weights):
+        """
+        Calculate the product of the weighted probes for every remaining item, for a (probes,) set of
+        weights (into the reused data.products buffer) or (remaining items x sets of weights) for a
+        (sets of weights x probes) batch
+        """
+
+        a_weights = np.asarray(a_weights, dtype=float)
+
+        if a_weights.ndim == 1:
+            products, column = data.products, data.column
+            products.fill(1.)
+
+            for j, weight in enumerate(a_weights):
+                column[:] = data.columns[j]
+                np.power(column, weight, out=column)
+                products *= column
+
+            return products
+
+        products = np.ones((data.n_items, a_weights.shape[0]))
+        for j in range(a_weights.shape[1]):
+            data.column[:] = data.columns[j]
+            products *= np.power(data.column[:, None], a_weights[None, :, j])
+
+        return products
+
+    def retrieval_strengths_and_gradient(self, data, a_weights):
+        """
+        Calculate the retrieval strengths and their log-gradients with respect to the attention weights
+        (see SegmentEngine.retrieval_strengths_and_gradient), one probe at a time
+        """
+
+        n = len(data)
+
+        num = np.power(data.current, a_weights).prod(axis=1)
+
+        weighted = self._remaining_products(data, a_weights)
+        denom = np.bincount(data.row_ids, weights=weighted, minlength=n)
+
+        rs = _divide_strengths(num, denom)
+
+        # expected log similarity over the remaining items, for each probe
+        expected = np.empty(data.current.shape)
+        column = data.column
+        for j in range(data.columns.shape[0]):
+            column[:] = data.columns[j]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                np.log(column, out=column)
+            column *= weighted
+            expected[:, j] = np.bincount(data.row_ids, weights=column, minlength=n)
+        expected = _divide_expected(expected, denom)
+
+        gradient = np.nan_to_num(data.log_current - expected, nan=0, neginf=0, posinf=0)
+
+        return rs, gradient
+
+ENGINES = {
+    'loop': LoopEngine,
+    'segment': SegmentEngine,
+    'logspace': LogSpaceEngine,
+    'topk': ApproximateEngine,
+    'compact': CompactEngine,
+}
+
+def get_engine(engine, jitter_val=1.0e-7, **kwargs):
+    """
+    Get an engine for evaluating retrieval strengths
+
+    Arguments:
+        engine (str or object): The name of an engine in ENGINES, or an engine instance
+        jitter_val (float): A small number to add to negative or 0 similarity values
+        kwargs: Any other arguments for the engine (e.g. top_k for ApproximateEngine)
+
+    Returns:
+        (object): The engine
+    """
+
+    if isinstance(engine, str):
+        return ENGINES[engine](jitter_val=jitter_val, **kwargs)
+
+    return engine
@@ -0,0 +1,91 @@
+"""Exporting the log retrieval strength of every transition under each fitted model"""
+
+import logging
+
+import numpy as np
+
+from memory_analyses.models.baseline import baseline_transition_loss
+from memory_analyses.models.fitting import build_model, map_tasks
+
+def _strengths_task(current_sims, subs_sims, task):
+    """Evaluate the log retrieval strengths of a (model, representations, block, weights) task"""
+
+    model, representations, (_, start, stop), weights = task
+
+    return model.log_retrieval_strengths(
+        [current_sims[rep][start:stop] for rep in representations],
+        [subs_sims[rep].slice(start, stop) for rep in representations],
+        weights,
+    )
+
+def export_strengths(export, condition, current_sims, subs_sims, input_rows, blocks, fitted, pool=None, jobs=1,
+                     engine='segment', engine_args=None):
+    """
+    Evaluate the log retrieval strength of every transition under each fitted model, once for each
+    participant (at their fitted weights), and write them to an export as a column for each model
+    (named <condition>:<representations joined by +>). Each column is rewritten, so the rows of
+    participants without a fit are missing rather than left from an earlier export
+
+    Arguments:
+        export (StrengthsExport): The export to write to
+        condition (str): The condition the models were fitted for
+        current_sims (dict): The numerator similarities of every transition, for each representation
+        subs_sims (dict): The remaining similarities of every transition, for each representation
+        input_rows (np.ndarray): The input row of each transition (e.g. the index of the transition table)
+        blocks (ParticipantBlocks): The participant blocks that the models were fitted to
+        fitted (dict): Results of each model for the blocks (see ModelSearch.fitted)
+        pool (multiprocessing.Pool): Optionally, a pool of workers holding the same data (see worker_pool)
+        jobs (int): The number of processes in the pool
+    """
+
+    blocks = list(blocks)
+
+    tasks = []
+    for subset, results in fitted.items():
+        model = build_model(len(subset), None, engine, engine_args)
+        weights = results[list(subset)].values.astype(float)
+
+        # participants without a fit are missing
+        tasks.extend(
+            (model, list(subset), block, w) for block, w in zip(blocks, weights) if not np.isnan(w).any()
+        )
+
+    logging.info('Exporting the retrieval strengths of {0} models ({1}) to {2}'.format(
+        len(fitted), condition, export.directory))
+
+    for subset in fitted:
+        export.clear('{0}:{1}'.format(condition, '+'.join(subset)))
+
+    strengths = map_tasks(_strengths_task, current_sims, subs_sims, tasks, pool=pool, jobs=jobs)
+
+    # each participant's strengths are written as they arrive, so they are never all held in memory
+    for (_, representations, (_, start, stop), _), log_rs in zip(tasks, strengths):
+        export.write('{0}:{1}'.format(condition, '+'.join(representations)), input_rows[start:stop], log_rs)
+
+def export_conditions(export, current_sims, subs_sims, n_remaining, input_rows, blocks, searches, pool=None, jobs=1,
+                      engine='segment', engine_args=None):
+    """
+    Export the log retrieval strengths of the baseline model and of every fitted model of each condition (see
+    export_strengths), and flush the export
+
+    Arguments:
+        export (StrengthsExport): The export to write to
+        current_sims (dict): The numerator similarities of every transition, for each representation
+        subs_sims (dict): The remaining similarities of every transition, for each representation
+        n_remaining (np.ndarray): The number of remaining items for each transition (for the baseline model)
+        input_rows (np.ndarray): The input row of each transition (e.g. the index of the transition table)
+        blocks (dict): The participant blocks of each condition
+        searches (dict): The ModelSearch of each condition, with its fitted models
+        pool (multiprocessing.Pool): Optionally, a pool of workers holding the same data (see worker_pool)
+        jobs (int): The number of processes in the pool
+    """
+
+    export.write('baseline', input_rows, -baseline_transition_loss(n_remaining))
+
+    for condition, search in searches.items():
+        export_strengths(
+            export, condition, current_sims, subs_sims, input_rows, blocks[condition], search.fitted, pool=pool,
+            jobs=jobs, engine=engine, engine_args=engine_args,
+        )
+
+    export.close()
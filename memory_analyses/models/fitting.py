@@ -0,0 +1,643 @@
+"""Fitting models to the transitions of each participant, in this process or across a pool of worker processes"""
+
+import logging
+import hashlib
+import datetime
+import contextlib
+import multiprocessing
+
+import pandas as pd
+import numpy as np
+
+from memory_analyses.data.shared import SharedArrays, open_shared
+from memory_analyses.models.engines import get_engine
+from memory_analyses.models.sam import MultiProbeRetrievalModel
+from memory_analyses.models.loss import negative_log_likelihood
+from memory_analyses.models.optimise import ScipyMinimiser
+from memory_analyses.utilities.instrumentation import COUNTS, PHASES
+from memory_analyses.utilities.store import data_digest, fit_key
+
+# the fields of the structured fit log (see fit_log_records)
+FIT_LOG_COLUMNS = [
+    'datetime', 'condition', 'model', 'participant', 'nrows', 'loss', 'converged', 'nit', 'nfev', 'njev', 'message',
+] + ['time_' + phase for phase in PHASES] + ['n_' + count for count in COUNTS]
+
+# the version of the fitting code, within the key of every stored fit. Increase it whenever a change to the
+# model, its engines or its optimiser can change the result of a fit, so that earlier fits are not reused
+FIT_VERSION = 3
+
+# data shared with the worker processes of a parallel model fit (see _initialise_worker)
+_worker_data = {}
+
+def _initialise_worker(current_sims, subs_sims):
+    """
+    Store the data for model fits once within each worker process, rather than sending it with every task.
+    Data in shared memory is memory-mapped rather than copied (see SharedArrays)
+    """
+
+    _worker_data['current_sims'] = open_shared(current_sims)
+    _worker_data['subs_sims'] = open_shared(subs_sims)
+
+@contextlib.contextmanager
+def worker_pool(jobs, current_sims, subs_sims, share=False):
+    """
+    Start a pool of worker processes holding the data for model fits, which can be reused for every
+    fit of a run (or None if jobs is 1)
+
+    Arguments:
+        jobs (int): The number of processes
+        current_sims (dict): The numerator similarities of every transition, for each representation
+        subs_sims (dict): The remaining similarities of every transition, for each representation
+        share (bool): Whether to copy the data into shared memory once, for every worker to memory-map,
+            rather than giving each worker its own copy
+    """
+
+    if jobs <= 1:
+        yield None
+        return
+
+    shared = SharedArrays() if share else None
+
+    try:
+        if shared is not None:
+            current_sims, subs_sims = shared.share(current_sims), shared.share(subs_sims)
+
+        with multiprocessing.Pool(jobs, initializer=_initialise_worker, initargs=(current_sims, subs_sims)) as pool:
+            yield pool
+
+    finally:
+        if shared is not None:
+            shared.close()
+
+def fit_participant(model, current_sims, subs_sims, task):
+    """
+    Fit a model to the transitions of a single participant
+
+    Arguments:
+        model (MultiProbeRetrievalModel): The model to fit
+        current_sims (list): The numerator similarities of every transition, for each representation
+        subs_sims (list): The remaining similarities (RaggedArray or IndexedRemaining) of every transition,
+            for each representation
+        task (tuple): The participant's block (participant, start, stop) and the weights to start the
+            optimiser from (None for the optimiser's default)
+
+    Returns:
+        (tuple): The participant, loss, weights, convergence, number of transitions, number of
+            optimiser iterations, number of objective evaluations and diagnostics of the fit (the
+            optimiser's message, and the timings and evaluation counts of model.instrumentation)
+    """
+
+    (participant, start, stop), x0 = task
+
+    loss, weights, success = model.fit(
+        [sims[start:stop] for sims in current_sims],
+        [sims.slice(start, stop) for sims in subs_sims],
+        x0=x0,
+    )
+
+    if model.approximation_report is not None:
+        logging.info('{0}: approximated {1[approximated]} transitions (error bound {1[max_bound]:.4f}); '
+                     'log-likelihood error over {1[rows_checked]} checked transitions: mean {1[mean_error]:.4f}, '
+                     'max {1[max_error]:.4f}'.format(participant, model.approximation_report))
+        if model.approximation_report['exact_fallback']:
+            logging.warning('{0}: the checked error exceeds max_error, so the participant was refitted exactly'.format(
+                participant))
+
+    diagnostics = model.instrumentation.record()
+
+    if model.optimise_result is None:
+        nit, nfev = 0, 1
+        diagnostics.update(njev=0, message='')
+    else:
+        nit, nfev = model.optimise_result.get('nit', 0), model.optimise_result.get('nfev', 0)
+        diagnostics.update(njev=model.optimise_result.get('njev', 0), message=str(model.optimise_result.get('message', '')))
+
+    return participant, loss, weights, success, stop - start, nit, nfev, diagnostics
+
+def _chunksize(blocks, jobs):
+    """Choose how many blocks to send to a worker at a time (as multiprocessing.Pool.map does)"""
+
+    if not hasattr(blocks, '__len__'):
+        return 1
+
+    chunksize, extra = divmod(len(blocks), jobs * 4)
+
+    return chunksize + 1 if extra else max(chunksize, 1)
+
+def _task_worker(func_task):
+    """Run a (function, task) pair within a worker process, on the data held by the worker"""
+
+    func, task = func_task
+
+    return func(_worker_data['current_sims'], _worker_data['subs_sims'], task)
+
+def map_tasks(func, current_sims, subs_sims, tasks, pool=None, jobs=1):
+    """
+    Apply a function to each task, either in this process or across a pool of workers holding the same data
+    (see worker_pool). The function is called as func(current_sims, subs_sims, task), and must be defined
+    at the top level of a module, so that it can be sent to the workers
+
+    Arguments:
+        func (callable): The function to apply
+        current_sims (dict): The numerator similarities of every transition, for each representation
+        subs_sims (dict): The remaining similarities of every transition, for each representation
+        tasks (list): The tasks
+        pool (multiprocessing.Pool): Optionally, a pool of workers holding the same data (see worker_pool)
+        jobs (int): The number of processes in the pool
+
+    Returns:
+        (iterator): The result of each task, in order as they finish
+    """
+
+    if pool is not None:
+        return pool.imap(_task_worker, [(func, task) for task in tasks], chunksize=_chunksize(tasks, jobs))
+
+    return (func(current_sims, subs_sims, task) for task in tasks)
+
+def _block_digest(representations, current_sims, subs_sims, block, digests=None):
+    """
+    Hash the similarities of a single participant for a set of representations. Each representation is
+    hashed once per block and kept in digests (if given), so models that share representations (and
+    later runs over the same loaded data) share the work
+
+    Arguments:
+        representations (list): The representations
+        current_sims (dict): The numerator similarities of every transition, for each representation
+        subs_sims (dict): The remaining similarities of every transition, for each representation
+        block (tuple): The participant's block (participant, start, stop)
+        digests (dict): Optionally, a cache of the digest of each representation of each block
+
+    Returns:
+        (str): A hex digest of the block's similarities
+    """
+
+    _, start, stop = block
+
+    rep_digests = []
+    for rep in representations:
+
+        key = (rep, start, stop)
+        if digests is not None and key in digests:
+            rep_digests.append(digests[key])
+            continue
+
+        # remaining similarities parsed from a transition table carry the digest of each row (see
+        # read_transition_table), so only those need to be hashed rather than every similarity
+        block_sims = subs_sims[rep].slice(start, stop)
+        if getattr(block_sims, 'digests', None) is not None:
+            digest = data_digest([current_sims[rep][start:stop], block_sims.digests])
+        else:
+            digest = data_digest([current_sims[rep][start:stop], block_sims.values, block_sims.offsets])
+
+        if digests is not None:
+            digests[key] = digest
+        rep_digests.append(digest)
+
+    return hashlib.sha1(' '.join(rep_digests).encode()).hexdigest()
+
+def warm_start_weights(representations, fitted):
+    """
+    Choose starting weights for each participant from the best fitting nested sub-model. New
+    representations (that are not in the sub-model) start at 0
+
+    Arguments:
+        representations (list): The representations of the model to be fitted
+        fitted (dict): Results of the models fitted so far (see run_model), keyed by a tuple
+            of their representations. All results must be for the same participant blocks
+
+    Returns:
+        (list): The starting weights for each participant, or None if no sub-models have been fitted
+    """
+
+    subsets = [results for reps, results in fitted.items() if set(reps) < set(representations)]
+
+    if len(subsets) == 0:
+        return None
+
+    # the sub-model with the lowest loss for each participant
+    losses = np.column_stack([results['loss'].values.astype(float) for results in subsets])
+    losses[np.isnan(losses)] = np.inf
+    best = losses.argmin(axis=1)
+
+    # (sub-models x participants x representations) weights, with 0 for missing representations
+    weights = np.stack([
+        results.reindex(columns=representations).fillna(0.).values.astype(float)
+        for results in subsets
+    ])
+
+    return list(weights[best, np.arange(best.shape[0])])
+
+def log_warm_start_savings(model_results):
+    """Log the optimiser iterations and objective evaluations used by each model, and any saved by warm starts"""
+
+    for model, results in model_results.groupby('model', sort=False):
+
+        message = '{0}: {1:.0f} iterations, {2:.0f} objective evaluations'.format(
+            model, results['nit'].sum(), results['nfev'].sum())
+
+        # compare against the same fits from a cold start (sampled in this run, or stored by earlier runs)
+        if 'cold_nit' in results.columns and results['cold_nit'].notna().any():
+            compared = results[results['cold_nit'].notna()]
+            message += ' ({0:.0f} iterations and {1:.0f} objective evaluations saved over {2} cold-start fits)'.format(
+                (compared['cold_nit'] - compared['nit']).sum(),
+                (compared['cold_nfev'] - compared['nfev']).sum(),
+                compared.shape[0],
+            )
+
+        logging.info(message)
+
+def fit_log_records(results_df, condition):
+    """Create a fit log record (see FIT_LOG_COLUMNS) for each new fit in a model's results"""
+
+    if 'time_fit' not in results_df.columns:
+        return []
+
+    fitted = results_df[results_df['time_fit'].notna()]
+    now = datetime.datetime.now().isoformat()
+
+    return [dict(record, datetime=now, condition=condition) for record in fitted.to_dict('records')]
+
+def log_hot_spots(model_results, n_slowest=5):
+    """Log where the time of the new fits went, the slowest fits and any fits that did not converge"""
+
+    if 'time_fit' not in model_results.columns or model_results['time_fit'].notna().sum() == 0:
+        logging.info('No new fits to summarise')
+        return
+
+    fitted = model_results[model_results['time_fit'].notna()]
+    totals = fitted[['time_' + phase for phase in PHASES]].sum()
+    total = totals['time_fit']
+
+    # time in the optimiser itself, outside of evaluating the objective
+    overhead = totals['time_optimise'] - totals['time_objective'] - totals['time_gradient'] - totals['time_batch']
+
+    logging.info('*** FIT HOT SPOTS ***')
+    logging.info(
+        '{0} fits in {1:.2f}s: prepare {2:.1%}, objective {3:.1%} ({4:.0f} calls, {5:.3g}ms each), '
+        'gradient {6:.1%} ({7:.0f} calls), batch {8:.1%} ({9:.0f} points), optimiser {10:.1%}, refine {11:.1%}'.format(
+            fitted.shape[0], total,
+            totals['time_prepare'] / total,
+            totals['time_objective'] / total, fitted['n_objective'].sum(),
+            1000. * totals['time_objective'] / max(fitted['n_objective'].sum(), 1),
+            totals['time_gradient'] / total, fitted['n_gradient'].sum(),
+            totals['time_batch'] / total, fitted['n_batch_points'].sum(),
+            overhead / total,
+            totals['time_refine'] / total,
+        ))
+
+    by_model = fitted.groupby('model', sort=False).agg(
+        {'time_fit': 'sum', 'n_objective': 'sum', 'nit': 'sum', 'nfev': 'sum'})
+    logging.info('\n' + by_model.to_string())
+
+    slowest = fitted.nlargest(n_slowest, 'time_fit')[['model', 'participant', 'time_fit', 'nit', 'nfev', 'message']]
+    logging.info('Slowest fits:\n' + slowest.to_string(index=False))
+
+    failed = fitted[~fitted['converged'].astype(bool)]
+    if failed.shape[0] > 0:
+        logging.info('{0} fits did not converge: {1}'.format(failed.shape[0], dict(failed['message'].value_counts())))
+
+def _fit_task(current_sims, subs_sims, task):
+    """Fit a (model, representations, (block, x0)) task, selecting the similarities of its representations"""
+
+    model, representations, block_task = task
+
+    return fit_participant(
+        model,
+        [current_sims[rep] for rep in representations],
+        [subs_sims[rep] for rep in representations],
+        block_task,
+    )
+
+def _fit_tasks(current_sims, subs_sims, tasks, pool=None, jobs=1):
+    """Fit each (model, representations, (block, x0)) task, yielding the results in order as they finish"""
+
+    return map_tasks(_fit_task, current_sims, subs_sims, tasks, pool=pool, jobs=jobs)
+
+def log_block_changes(store, condition, representations, current_sims, subs_sims, blocks, digests=None):
+    """
+    Compare the participant blocks of a condition with those of the last completed run that used the store,
+    and log how many are new or changed (and so will be fitted) and how many are unchanged (and will be reused)
+
+    Returns:
+        (dict): The digest of each participant's data, to record once their fits are stored (see
+            FitResultStore.update_blocks)
+    """
+
+    block_digests = {
+        participant: _block_digest(representations, current_sims, subs_sims, (participant, start, stop), digests)
+        for participant, start, stop in blocks
+    }
+
+    new, changed, unchanged = store.compare_blocks(condition, block_digests)
+
+    logging.info('{0}: {1} new, {2} changed and {3} unchanged participants since the last run'.format(
+        condition, len(new), len(changed), len(unchanged)))
+
+    return block_digests
+
+def _start_params(params, x0):
+    """The fit settings when the optimiser is started from x0"""
+
+    if x0 is None:
+        return params
+
+    optimiser_args = dict(params['optimiser']['optimiser_args'], x0=[float(w) for w in x0])
+
+    return dict(params, optimiser=dict(params['optimiser'], optimiser_args=optimiser_args))
+
+def _fit_tasks_with_store(current_sims, subs_sims, tasks, params, store, pool=None, jobs=1, digests=None):
+    """
+    Fit each (model, representations, (block, x0)) task, skipping any fits that are already in the store
+    and adding new fits to the store as they finish
+
+    Arguments:
+        params (list): The settings of each task's model (see _model_params)
+        digests (dict): Optionally, a cache of block digests (see _block_digest)
+
+    Returns:
+        (list): The fits for each task (with no diagnostics for fits that were already stored)
+        (list): The (iterations, objective evaluations) of a stored cold-start fit for each warm-started
+            task (None where this is unavailable)
+    """
+
+    block_digests = [
+        _block_digest(reps, current_sims, subs_sims, block, digests) for _, reps, (block, _) in tasks
+    ]
+    keys = [
+        fit_key(digest, _start_params(task_params, x0))
+        for digest, task_params, (_, _, (_, x0)) in zip(block_digests, params, tasks)
+    ]
+
+    stored = store.get_many(keys)
+    todo = [i for i, key in enumerate(keys) if key not in stored]
+
+    logging.info('Fitting {0} participant models ({1} already fitted)'.format(len(todo), len(tasks) - len(todo)))
+
+    fits = _fit_tasks(current_sims, subs_sims, [tasks[i] for i in todo], pool=pool, jobs=jobs)
+
+    diagnostics = {}
+    for i, (participant, loss, weights, success, nrows, nit, nfev, diagnostic) in zip(todo, fits):
+        store.add(keys[i], participant, params[i]['representations'], loss, weights, success, nrows, nit, nfev)
+        stored[keys[i]] = (loss, weights, success, nrows, nit, nfev)
+        diagnostics[keys[i]] = diagnostic
+
+    # look up the cost of the same fits started from the optimiser's default x0
+    cold_keys = [
+        fit_key(digest, task_params) if x0 is not None else None
+        for digest, task_params, (_, _, (_, x0)) in zip(block_digests, params, tasks)
+    ]
+    cold = store.get_many([key for key in cold_keys if key is not None])
+    cold = [cold[key][4:] if key in cold else None for key in cold_keys]
+
+    fits = [
+        (block[0],) + tuple(stored[key]) + (diagnostics.get(key),)
+        for (_, _, (block, _)), key in zip(tasks, keys)
+    ]
+
+    return fits, cold
+
+def build_model(k, multi_start=None, engine='segment', engine_args=None):
+    """Create a model with k attention weights, fitted by SLSQP from 0"""
+
+    bounds = (0, None)
+    optim = ScipyMinimiser(
+        {
+            "method": "SLSQP",
+            "x0": [0] * k,
+            "bounds": [bounds] * k,
+        },
+        **(multi_start or {})
+    )
+
+    jitter_val = 1.0e-7
+
+    return MultiProbeRetrievalModel(
+                probe_configs=None,
+                optimiser=optim,
+                jitter_val=jitter_val,
+                loss_func=negative_log_likelihood,
+                init_probe_weights=None,
+                learn_weights=True,
+                engine=get_engine(engine, jitter_val, **(engine_args or {})),
+            )
+
+def _model_params(model, representations):
+    """Everything that can change the result of a fit, to identify it within the fit store"""
+
+    return {
+        'version': FIT_VERSION,
+        'representations': str(representations),
+        'optimiser': model.optimiser.settings,
+        'jitter_val': model.jitter_val,
+        'engine': type(model.engine).__name__,
+        'engine_settings': model.engine.settings,
+        'loss': model.loss_func.__name__,
+    }
+
+def _results_frame(representations, fits, x0s=None, cold=None):
+    """Collect the fits of a model to each participant into a DataFrame (see run_model)"""
+
+    k = len(representations)
+
+    participants, all_loss, all_weights, all_success, all_nrows, all_nit, all_nfev, all_diagnostics = zip(*fits)
+   
+    results_df = pd.DataFrame([list(participants), all_loss, all_success, all_nrows]).T
+    results_df.columns = ['participant', 'loss', 'converged', 'nrows']
+    results_df[representations] = list(all_weights)
+    results_df['model'] = str(representations)
+    results_df['k'] = k
+    results_df['nit'] = pd.to_numeric(pd.Series(all_nit), errors='coerce').values
+    results_df['nfev'] = pd.to_numeric(pd.Series(all_nfev), errors='coerce').values
+
+    # the timings, evaluation counts and optimiser message of each fit (missing for stored fits)
+    diagnostics = pd.DataFrame([d or {} for d in all_diagnostics], index=results_df.index)
+    for col in diagnostics.columns:
+        results_df[col] = diagnostics[col].values
+
+    if x0s is not None and cold is not None:
+        results_df['cold_nit'] = [np.nan if c is None or c[0] is None else c[0] for c in cold]
+        results_df['cold_nfev'] = [np.nan if c is None or c[1] is None else c[1] for c in cold]
+   
+    return results_df
+
+def run_models(current_sims, remaining, requests, pool=None, jobs=1, store=None, multi_start=None, engine='segment', engine_args=None, digests=None, cold_check=0):
+    """
+    Fit several models, as a single set of tasks. Each request is a model (its representations) to fit to
+    each of a set of participant blocks, e.g. the models of one step of a search over every condition
+
+    Arguments:
+        current_sims (dict): The numerator similarities of every transition, for each representation
+        remaining (dict): The remaining similarities of every transition, for each representation
+        requests (list): (representations, blocks, x0s) for each model to fit (see run_model)
+        pool (multiprocessing.Pool): Optionally, a pool of workers holding the same data (see worker_pool)
+        jobs (int): The number of processes in the pool
+        digests (dict): Optionally, a cache of block digests for the store (see _block_digest)
+        cold_check (int): For each warm-started model, the number of participants to also fit from the
+            optimiser's default x0, so that the cost of a cold start is known (as cold_nit and cold_nfev)
+            whether or not cold-start fits have been stored
+
+    Returns:
+        (list): The results of each request (see run_model)
+    """
+
+    requests = [(list(reps), list(blocks), x0s) for reps, blocks, x0s in requests]
+    models = [build_model(len(reps), multi_start, engine, engine_args) for reps, _, _ in requests]
+
+    # one task per participant, for every model
+    tasks, owners = [], []
+    for i, (reps, blocks, x0s) in enumerate(requests):
+        for block, x0 in zip(blocks, x0s if x0s is not None else [None] * len(blocks)):
+            tasks.append((models[i], reps, (block, x0)))
+            owners.append(i)
+    owners = np.array(owners, dtype=np.int64)
+
+    # cold-start reference fits for an evenly spaced sample of each warm-started model's participants,
+    # fitted alongside the other tasks (and stored, so that later runs reuse them)
+    references, task_owners = {}, list(owners)
+    for i, (reps, _, x0s) in enumerate(requests):
+        positions = np.flatnonzero(owners == i)
+        if x0s is None or cold_check <= 0 or positions.shape[0] == 0:
+            continue
+
+        sample = np.unique(np.linspace(0, positions.shape[0] - 1, min(cold_check, positions.shape[0])).astype(int))
+        for t in positions[sample]:
+            references[t] = len(tasks)
+            tasks.append((models[i], reps, (tasks[t][2][0], None)))
+            task_owners.append(i)
+
+    # fit each participant, either in this process or across a pool of workers
+    if store is None:
+        fits = list(_fit_tasks(current_sims, remaining, tasks, pool=pool, jobs=jobs))
+        cold = [None] * len(tasks)
+
+    else:
+        params = [_model_params(models[i], requests[i][0]) for i in task_owners]
+        fits, cold = _fit_tasks_with_store(
+            current_sims, remaining, tasks, params, store, pool=pool, jobs=jobs, digests=digests)
+
+    for t, reference in references.items():
+        if cold[t] is None:
+            cold[t] = fits[reference][5:7]
+
+    return [
+        _results_frame(
+            reps,
+            [fits[t] for t in np.flatnonzero(owners == i)],
+            x0s,
+            [cold[t] for t in np.flatnonzero(owners == i)],
+        )
+        for i, (reps, _, x0s) in enumerate(requests)
+    ]
+
+def run_model(data: pd.DataFrame, representations: list, remaining: dict, blocks, jobs: int = 1, store=None, x0s=None, multi_start=None, engine='segment', engine_args=None) -> pd.DataFrame: 
+    """
+    Run a model on the data for a given set of representations
+    For exampe, `run_model(data, ['cooc', 'w2v', 'hier'], remaining, blocks) will run the model
+    on the three representations
+   
+    Arguments:
+        data (pd.DataFrame): The sequential retrieval data. Must contain measures of sequential
+            similarity, prefixed with the values given in the representations argument
+       
+        representation (list): A list of representations. These must match the prefixes of the columns
+            within data. For examle, 'cooc' will subset 'cooc_similarity'.
+
+        remaining (dict): The parsed remaining similarities for each representation (see
+            memory_analyses.data.ragged.parse_remaining_columns), or their indices within similarity
+            matrices (see memory_analyses.data.sequences.build_transitions), aligned to the rows of data
+
+        blocks (iterable): The (participant, start, stop) rows of each participant within data, e.g.
+            ParticipantBlocks (see memory_analyses.data.blocks.condition_blocks) or a stream of blocks
+
+        jobs (int): The number of processes to fit participants with. Results are returned in the
+            same order as a serial run
+
+        store (FitResultStore): Optionally, a store of previous fits. Fits already in the store are
+            reused, and new fits are added as they finish
+
+        x0s (list): Optionally, the weights to start the optimiser from for each block (see
+            warm_start_weights). By default, every fit starts from 0
+
+        multi_start (dict): Optionally, arguments for a multi-start optimiser (see ScipyMinimiser),
+            e.g. {'n_starts': 3}
+
+        engine (str): The engine used to evaluate retrieval strengths (see MultiProbeRetrievalModel)
+
+        engine_args (dict): Optionally, any other arguments for the engine, e.g. {'top_k': 50} for the
+            approximate 'topk' engine (see memory_analyses.models.engines)
+           
+    Returns:
+        (pd.DataFrame): A DataFrame of model fit statistics per participant, including the optimiser's
+            iterations (nit) and objective evaluations (nfev). New fits also have the diagnostics of
+            fit_participant (time_<phase>, n_<evaluation>, njev and message)
+    """
+
+    # get the similarities for each representation
+    current_sims = {sim: data[f'{sim}_similarity'].values for sim in representations}
+    subs_sims = {sim: remaining[sim] for sim in representations}
+
+    with worker_pool(jobs, current_sims, subs_sims) as pool:
+        return run_models(
+            current_sims, subs_sims, [(representations, blocks, x0s)], pool=pool, jobs=jobs, store=store,
+            multi_start=multi_start, engine=engine, engine_args=engine_args,
+        )[0]
+
+def run_searches(searches, blocks, current_sims, subs_sims, pool=None, jobs=1, store=None, fit_log=None,
+                  warm_start=False, multi_start=None, engine='segment', engine_args=None, digests=None, cold_check=0):
+    """
+    Step through the model searches of several conditions together, fitting the next models of every
+    condition as one set of tasks
+
+    Arguments:
+        searches (dict): The ModelSearch of each condition
+        blocks (dict): The participant blocks of each condition
+        current_sims (dict): The numerator similarities of every transition, for each representation
+        subs_sims (dict): The remaining similarities of every transition, for each representation
+        pool (multiprocessing.Pool): Optionally, a pool of workers holding the same data (see worker_pool)
+        jobs (int): The number of processes in the pool
+        store (FitResultStore): Optionally, a store of previous fits (see run_model)
+        fit_log (RecordLogger): Optionally, a log of the diagnostics of each new fit
+        warm_start (bool): Whether to start each model from the best fit of the smaller models nested within it
+        digests (dict): Optionally, a cache of block digests for the store (see _block_digest)
+        cold_check (int): When warm starting, the number of participants of each model to also fit from a cold
+            start, to measure the saving (see run_models)
+    """
+
+    steps = {condition: search.steps() for condition, search in searches.items()}
+
+    while len(steps) > 0:
+
+        batches = []
+        for condition in list(steps):
+            try:
+                batches.extend((condition, subset) for subset in next(steps[condition]))
+            except StopIteration:
+                del steps[condition]
+
+        if len(batches) == 0:
+            break
+
+        for condition, subset in batches:
+            logging.info(f'Fitting model for {list(subset)}' + (f' ({condition})' if len(searches) > 1 else ''))
+
+        requests = [
+            (
+                list(subset),
+                blocks[condition],
+                warm_start_weights(list(subset), searches[condition].fitted) if warm_start else None,
+            )
+            for condition, subset in batches
+        ]
+
+        all_fits = run_models(
+            current_sims, subs_sims, requests, pool=pool, jobs=jobs, store=store,
+            multi_start=multi_start, engine=engine, engine_args=engine_args, digests=digests,
+            cold_check=cold_check if warm_start else 0,
+        )
+
+        for (condition, subset), results_df in zip(batches, all_fits):
+            searches[condition].record(subset, results_df)
+
+            if fit_log is not None:
+                for record in fit_log_records(results_df, condition):
+                    fit_log.add(record)
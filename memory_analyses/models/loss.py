@@ -10,11 +10,10 @@ def _assert_values_between_0_and_1(values):
         assert(np.logical_and(np.round(values, 1) >= 0.0, np.round(values, 1) <= 1.1).all())
        
     except AssertionError:
-        print(values)
         logging.info('Values not within 0-1 range: {0}'.format(values))
         raise
 
-def negative_log_likelihood(likelihoods, replace_zero_with=0.00000001):
+def negative_log_likelihood(likelihoods, replace_zero_with=0.00000001, axis=None):
     """
     Calculate the negative log likelihood of an array
    
@@ -22,9 +21,10 @@ def negative_log_likelihood(likelihoods, replace_zero_with=0.00000001):
         likelihoods (list): A list of model likelihoods
         replace_zero_with (float): Replace zero likelihoods with a very small number,
             to ensure that we don't take a log of 0
+        axis (int): The axis to sum over (e.g. 0 for a (likelihoods x models) array)
    
     Returns:
-        (float): The total negative log-likelihood
+        (float): The total negative log-likelihood (an array, if summing over an axis)
     """
 
     # handle instances where 0 has been in the numerator or denominator
@@ -38,6 +38,86 @@ def negative_log_likelihood(likelihoods, replace_zero_with=0.00000001):
    
     # now calculate loss
     ll = np.log(likelihoods)
-    negative_ll = -np.sum(ll)
+    negative_ll = -np.sum(ll, axis=axis)
    
     return negative_ll
+
+def negative_log_likelihood_gradient(likelihoods, log_likelihood_gradients, replace_zero_with=0.00000001):
+    """
+    Calculate the gradient of negative_log_likelihood with respect to the model parameters
+   
+    Args:
+        likelihoods (list): A list of model likelihoods
+        log_likelihood_gradients (np.ndarray): (likelihoods x parameters) gradients of the log of
+            each likelihood
+        replace_zero_with (float): As in negative_log_likelihood. Likelihoods that are replaced
+            with this value do not depend on the parameters
+   
+    Returns:
+        (np.ndarray): The gradient of the total negative log-likelihood
+    """
+
+    likelihoods = np.nan_to_num(likelihoods, replace_zero_with, nan=0, neginf=0, posinf=1)
+
+    if replace_zero_with is not None:
+        free = likelihoods > replace_zero_with
+    else:
+        free = likelihoods > 0
+
+    return -log_likelihood_gradients[free].sum(axis=0)
+
+def log_negative_log_likelihood(log_likelihoods, replace_zero_with=0.00000001, axis=None):
+    """
+    Calculate the negative log likelihood from log likelihoods (e.g. from a log-space model).
+    Unlike negative_log_likelihood, values are not checked here; the data should be validated
+    once when it is loaded (see memory_analyses.data.transitions.validate_transitions)
+   
+    Args:
+        log_likelihoods (list): A list of model log likelihoods
+        replace_zero_with (float): As in negative_log_likelihood, the smallest likelihood allowed
+            (missing log likelihoods are also given this value)
+        axis (int): The axis to sum over (e.g. 0 for a (likelihoods x models) array)
+   
+    Returns:
+        (float): The total negative log-likelihood
+    """
+
+    ll = np.nan_to_num(log_likelihoods, nan=-np.inf, posinf=0)
+
+    if replace_zero_with is not None:
+        ll = np.maximum(ll, np.log(replace_zero_with))
+
+    return -np.sum(ll, axis=axis)
+
+def log_negative_log_likelihood_gradient(log_likelihoods, log_likelihood_gradients, replace_zero_with=0.00000001):
+    """
+    Calculate the gradient of log_negative_log_likelihood with respect to the model parameters
+   
+    Args:
+        log_likelihoods (list): A list of model log likelihoods
+        log_likelihood_gradients (np.ndarray): (likelihoods x parameters) gradients of each log likelihood
+        replace_zero_with (float): As in log_negative_log_likelihood
+   
+    Returns:
+        (np.ndarray): The gradient of the total negative log-likelihood
+    """
+
+    ll = np.nan_to_num(log_likelihoods, nan=-np.inf, posinf=0)
+
+    if replace_zero_with is not None:
+        free = ll > np.log(replace_zero_with)
+    else:
+        free = np.isfinite(ll)
+
+    return -log_likelihood_gradients[free].sum(axis=0)
+
+# analytic gradients of each loss function
+GRADIENTS = {
+    negative_log_likelihood: negative_log_likelihood_gradient,
+    log_negative_log_likelihood: log_negative_log_likelihood_gradient,
+}
+
+# the equivalent of each loss function for log likelihoods
+LOG_LOSSES = {
+    negative_log_likelihood: log_negative_log_likelihood,
+}
@@ -1,6 +1,7 @@
 """Optimisers for model estimations"""
 
-from scipy.optimize import minimize
+import numpy as np
+from scipy.optimize import minimize, approx_fprime
 
 class ScipyMinimiser(object):
     """
@@ -8,19 +9,182 @@ class ScipyMinimiser(object):
 
     :param optimiser_args: A dictionary of arguments to pass to the Scipy optimiser. See
         scipy.optimise.minimise for more information.
+    :param n_starts: The number of starting points to run the optimiser from. The best result is kept.
+        With more than one start, candidate starting points are scored in a single batch and the
+        lowest-loss candidates are used
+    :param grid: Values that each parameter can take in the coarse grid of candidate starting points
+    :param n_random: The number of random candidate starting points (uniform between 0 and max(grid))
+    :param seed: Seed for the random candidate starting points
+    :param max_grid: The largest number of grid points to score. Larger grids (e.g. 5 values for each of
+        many parameters) are sampled instead, as a Latin hypercube over the grid values
     """
 
-    def __init__(self, optimiser_args):
+    def __init__(self, optimiser_args, n_starts=1, grid=(0., 0.5, 1., 2., 5.), n_random=0, seed=0, max_grid=4096):
         super(ScipyMinimiser, self).__init__()
         self.optimiser_args = optimiser_args
+        self.n_starts = n_starts
+        self.grid = grid
+        self.n_random = n_random
+        self.seed = seed
+        self.max_grid = max_grid
 
-    def minimise(self, func, args):
-        """Minimise a function using the scipy minimiser"""
+    @property
+    def settings(self):
+        """
+        The settings that can change the result of a minimisation (e.g. to identify a fit in the fit store)
+
+        :return: The optimiser arguments and the settings of the starting points
+        """
+
+        return {
+            'optimiser_args': self.optimiser_args,
+            'n_starts': self.n_starts,
+            'grid': list(self.grid),
+            'n_random': self.n_random,
+            'seed': self.seed,
+            'max_grid': self.max_grid,
+        }
+
+    def _grid_points(self, k, random_state):
+        """
+        The coarse grid of k parameters, or a sample of max_grid of its points when the full grid is larger.
+        In the sample, each parameter takes every grid value (almost) equally often, in a random order
+
+        :param k: The number of parameters
+        :param random_state: Random state for the sample
+        :return: A (points x parameters) array
+        """
+
+        values = np.asarray(self.grid, dtype=float)
+
+        if values.shape[0] ** k <= self.max_grid:
+            return np.array(np.meshgrid(*[values] * k, indexing='ij')).reshape(k, -1).T
+
+        levels = np.arange(self.max_grid) % values.shape[0]
+
+        return np.column_stack([values[random_state.permutation(levels)] for _ in range(k)])
+
+    def candidates(self, x0):
+        """
+        Create candidate starting points: x0, a coarse grid (sampled when it has more than max_grid points)
+        and any random points, clipped to the bounds
+
+        :param x0: The default starting point
+        :return: A (candidates x parameters) array
+        """
+
+        x0 = np.asarray(x0, dtype=float)
+        k = x0.shape[0]
+
+        random_state = np.random.RandomState(self.seed)
+        grid = self._grid_points(k, random_state)
+        random = random_state.uniform(0, max(self.grid), size=(self.n_random, k))
+
+        candidates = np.vstack([x0[None, :], grid, random])
+
+        bounds = self.optimiser_args.get('bounds')
+        if bounds is not None:
+            lower = np.array([-np.inf if b[0] is None else b[0] for b in bounds])
+            upper = np.array([np.inf if b[1] is None else b[1] for b in bounds])
+            candidates = np.clip(candidates, lower, upper)
+
+        return np.unique(candidates, axis=0)
+
+    def _starting_points(self, func, args, x0, batch_func):
+        """Score the candidate starting points and return the best n_starts of them"""
+
+        candidates = self.candidates(x0)
+
+        if batch_func is not None:
+            losses = batch_func(candidates, *args)
+        else:
+            losses = np.array([func(c, *args) for c in candidates])
+
+        losses = np.where(np.isnan(losses), np.inf, losses)
+
+        return candidates[np.argsort(losses, kind='stable')[:self.n_starts]], candidates.shape[0]
+
+    def _minimise_once(self, func, args, loss_and_grad, optimiser_args):
+        """Run the scipy minimiser from a single starting point"""
+
+        if loss_and_grad is not None and 'jac' not in optimiser_args:
+            return minimize(loss_and_grad,
+                            args=args,
+                            jac=True,
+                            **optimiser_args)
 
         #  minimise that function
         res = minimize(func,
                        args=args,
-                       **self.optimiser_args)
+                       **optimiser_args)
 
         return res
+
+    def minimise(self, func, args, loss_and_grad=None, x0=None, batch_func=None):
+        """
+        Minimise a function using the scipy minimiser
+
+        Arguments:
+            func (callable): The function to minimise
+            args (tuple): Extra arguments passed to func
+            loss_and_grad (callable): Optionally, a function returning both the value of func and its
+                gradient. This is used in place of finite differences, unless a jac has been given
+                in the optimiser arguments
+            x0 (list): Optionally, a starting point to use instead of the x0 in the optimiser arguments
+            batch_func (callable): Optionally, a function evaluating func for a (points x parameters)
+                array in one call. Used to score candidate starting points when n_starts > 1
+
+        Returns:
+            (scipy.optimize.OptimizeResult): The best result. With several starts, nit and nfev are
+                totals over all starts (including the candidates scored) and ncandidates is recorded
+        """
+
+        optimiser_args = dict(self.optimiser_args)
+        if x0 is not None:
+            optimiser_args['x0'] = x0
+
+        if self.n_starts <= 1:
+            return self._minimise_once(func, args, loss_and_grad, optimiser_args)
+
+        starts, n_candidates = self._starting_points(func, args, optimiser_args['x0'], batch_func)
+
+        best = None
+        nit, nfev = 0, n_candidates
+        for start in starts:
+            res = self._minimise_once(func, args, loss_and_grad, dict(optimiser_args, x0=start))
+
+            nit += res.get('nit', 0)
+            nfev += res.get('nfev', 0)
+
+            if best is None or (res.fun < best.fun) or (np.isnan(best.fun) and not np.isnan(res.fun)):
+                best = res
+
+        best.nit = nit
+        best.nfev = nfev
+        best.ncandidates = n_candidates
+
+        return best
+
+def check_gradient(loss_and_grad, x, args=(), epsilon=1.0e-6):
+    """
+    Check an analytic gradient against a finite-difference approximation
+
+    Arguments:
+        loss_and_grad (callable): A function returning a loss and its gradient
+        x (list): The parameters at which to check the gradient
+        args (tuple): Extra arguments passed to loss_and_grad
+        epsilon (float): The step size used for the finite differences
+
+    Returns:
+        (np.ndarray): The analytic gradient
+        (np.ndarray): The finite-difference gradient
+        (float): The largest absolute difference between the two
+    """
+
+    x = np.asarray(x, dtype=float)
+
+    _, analytic = loss_and_grad(x, *args)
+    numeric = approx_fprime(x, lambda w: loss_and_grad(w, *args)[0], epsilon)
+
+    return analytic, numeric, np.max(np.abs(analytic - numeric))
    
@@ -3,6 +3,12 @@
 import pandas as pd
 import numpy as np
 
+from memory_analyses.data.ragged import RaggedArray, parse_remaining_similarities
+from memory_analyses.data.sequences import IndexedRemaining
+from memory_analyses.models.engines import get_engine
+from memory_analyses.models.loss import GRADIENTS, LOG_LOSSES, negative_log_likelihood
+from memory_analyses.utilities.instrumentation import FitInstrumentation
+
 class MultiProbeRetrievalModel(object):
     """
     Fit the SAM/ACT-R model with multiple representations of similarity
@@ -14,6 +20,9 @@ class MultiProbeRetrievalModel(object):
         init_probe_weights (list): Values to initialise the attention weights to (wont change if learn_weights is False)
         learn_weights (bool): Whether or not to learn attention weights for the similarity probes
         jitter_val (float): A small number to add to negative or 0 similarity values
+        engine (str): How to evaluate retrieval strengths; 'segment' (vectorised over all transitions),
+            'logspace' (vectorised, in log space) or 'loop' (one transition at a time). An engine instance
+            may also be given (see memory_analyses.models.engines)
 
     """
 
@@ -25,6 +34,7 @@ class MultiProbeRetrievalModel(object):
         init_probe_weights: list = None,
         learn_weights: bool = False,
         jitter_val: float = 1.0e-7,
+        engine='segment',
     ):
         super(MultiProbeRetrievalModel, self).__init__()
         self.probe_configs = probe_configs
@@ -33,6 +43,12 @@ class MultiProbeRetrievalModel(object):
         self.init_probe_weights = init_probe_weights
         self.learn_weights = learn_weights
         self.jitter_val = jitter_val
+        self.engine = get_engine(engine, jitter_val)
+        self.optimise_result = None
+        self.approximation_report = None
+
+        # timings and evaluation counts of the last fit
+        self.instrumentation = FitInstrumentation()
 
         if not learn_weights:
             assert len(probe_configs) == len(init_probe_weights)
@@ -62,119 +78,281 @@ class MultiProbeRetrievalModel(object):
 
         return self.__dict__
 
-    def _attention_weighted_probe_product(self, sims, a_weights):
-        """Calculate the model numerator"""
+    def prepare(self, current_sims, subs_sims):
+        """
+        Prepare similarities for repeated evaluation by the model's engine
 
-        sims = np.column_stack(sims)
+        Args:
+            current_sims (list): Numerator similarities for each probe
+            subs_sims (list): Denominator similarities for each probe (a RaggedArray, an IndexedRemaining
+                to look up from a similarity matrix, or a column of similarity strings which will be parsed here)
+        Returns:
+            (object): The prepared data
+        """
 
-        # replace any missing entries with 0
-        sims[sims == ""] = "0.0"
+        # look up remaining similarities from their similarity matrices, and parse any that have not
+        # already been parsed at load time
+        subs_sims = [
+            s.lookup() if isinstance(s, IndexedRemaining)
+            else s if isinstance(s, RaggedArray)
+            else parse_remaining_similarities(s)
+            for s in subs_sims
+        ]
 
-        sims = sims.astype(float)
+        return self.engine.prepare(current_sims, subs_sims)
 
-        if self.jitter_val is not None:
-            # add a small constant to all probes to ensure that nothing is ever 0
-            sims += self.jitter_val
+    def _determine_retrieval_strengths(self, data, a_weights):
+        """
+        Calculate the retrieval strengths for each item in a sequence
+        (assumes data is already ordered)
+        """
 
-        # apply the attention weights
-        sims = np.power(sims, a_weights) # np.ma.power(sims, a_weights)  # each weight pertains to a column
+        return self.engine.retrieval_strengths(data, a_weights)
 
-        # calculate the product over each probe
-        return sims.prod(axis=1)
+    @property
+    def log_loss_func(self):
+        """The loss function for log retrieval strengths, if the engine works in log space (otherwise None)"""
 
-    def _calculate_denominator_product_helper(self, cols, a_weights):
-        """Helper function to extract the remaining product sims and calculate the probe values from them"""
+        if getattr(self.engine, 'log_space', False):
+            return LOG_LOSSES.get(self.loss_func)
 
-        # extract the probe values
-        # these are string values, which need to be replaced with floating points
-        probes = [
-            np.array(
-                " ".join(x.replace("[", "").replace("]", "").split()).split(" ")
-            ).astype(float)
-            for x in cols
-        ]
+        return None
 
-        # the numerator (product of weighted probes for current basket add)
-        denom = self._attention_weighted_probe_product(probes, a_weights)
+    def _fit_and_evaluate(self, a_weights, data):
+        """Fit and evaluate a retrieval strength model given a set of weights"""
 
-        sumprod = denom.sum()  # sum the probe products for the remaining items
+        self.instrumentation.count('objective')
 
-        return sumprod
+        with self.instrumentation.phase('objective'):
 
-    def _determine_retrieval_strengths(
-        self, current_sims, subs_sims, a_weights
-    ):
+            if self.log_loss_func is not None:
+                return self.log_loss_func(self.engine.log_retrieval_strengths(data, a_weights))
+
+            rs = self._determine_retrieval_strengths(data, a_weights)
+
+            # feed in the likelihoods and calculate the loss
+            loss = self.loss_func(rs)
+
+        return loss
+
+    def evaluate_batch(self, a_weights_batch, data):
         """
-        Calculate the retrieval strengths for each item in a sequence
-        (assumes data is already ordered)
+        Evaluate the loss for many sets of attention weights in a single pass over the data
+
+        Args:
+            a_weights_batch (np.ndarray): (sets of weights x probes) attention weights
+            data (object): Similarities prepared by MultiProbeRetrievalModel.prepare
+        Returns:
+            (np.ndarray): The loss for each set of weights
         """
 
-        # the numerator (product of weighted probes for current basket add)
-        num = self._attention_weighted_probe_product(
-            current_sims, a_weights
-        )
+        a_weights_batch = np.atleast_2d(np.asarray(a_weights_batch, dtype=float))
 
-        # the denominator (product of weighted probes for remaining products to be added)
-        for x in range(len(subs_sims)):
-            subs_sims[x] = np.nan_to_num(subs_sims[x], "[0.0]")
-            subs_sims[x][subs_sims[x] == " "] = "[0.0]"
+        # engines without a batched evaluation fall back to evaluating one set of weights at a time
+        if not hasattr(self.engine, 'batch_retrieval_strengths'):
+            return np.array([self._fit_and_evaluate(w, data) for w in a_weights_batch])
 
-        denom = [
-            self._calculate_denominator_product_helper(
-                [probe[x] for probe in subs_sims], a_weights
-            )
-            for x in range(subs_sims[0].shape[0])
-        ]
+        self.instrumentation.count('batch')
+        self.instrumentation.count('batch_points', a_weights_batch.shape[0])
 
-        # get retrieval strength of current item, given that and remaining items
-        rs = num / denom
+        with self.instrumentation.phase('batch'):
+            return self._evaluate_batch(a_weights_batch, data)
 
-        # an array of numbers between 0 and 1 where higher = higher likelihood of current choice
-        rs = np.nan_to_num(rs, 0, nan=0, neginf=0, posinf=1)
-       
-        return rs
+    def _evaluate_batch(self, a_weights_batch, data):
+        """Evaluate the loss for many sets of attention weights with the engine's batched evaluation"""
 
-    def _fit_and_evaluate(self, a_weights, current_sims, subs_sims):
-        """Fit and evaluate a retrieval strength model given a set of weights"""
+        if self.log_loss_func is not None:
+            return self.log_loss_func(self.engine.batch_log_retrieval_strengths(data, a_weights_batch), axis=0)
 
-        rs = self._determine_retrieval_strengths(
-            current_sims, subs_sims, a_weights
+        rs = self.engine.batch_retrieval_strengths(data, a_weights_batch)
+
+        if self.loss_func is negative_log_likelihood:
+            return negative_log_likelihood(rs, axis=0)
+
+        return np.array([self.loss_func(rs[:, i]) for i in range(rs.shape[1])])
+
+    @property
+    def has_gradient(self):
+        """Whether or not an analytic gradient is available for this engine and loss function"""
+
+        return (
+            hasattr(self.engine, 'retrieval_strengths_and_gradient')
+            and self.loss_func in GRADIENTS
         )
 
-        # feed in the likelihoods and calculate the loss
-        loss = self.loss_func(rs)
+    def _use_gradient(self, data):
+        """Whether or not to use the analytic gradient when fitting to some prepared data"""
 
-        return loss
+        # fall back to finite differences when the likelihood is discontinuous in the weights
+        return self.has_gradient and getattr(data, 'smooth', False)
 
-    def fit(self, current_sims, subs_sims):
+    def loss_and_gradient(self, a_weights, data):
         """
-        Fit the model to the similarities from a given visit and return the loss
-       
+        Evaluate the loss and its gradient with respect to the attention weights
+
         Args:
-            current_sims (list): A list of similarity cues representing the similarity between the current
-                and next product (i.e. the numerator in the SAM equation)
-            subs_sims (list): A list of similarity cues representing the similarity between the current
-                and remaining products (i.e. the denominator in the SAM equation)
+            a_weights (list): The attention weights
+            data (object): Similarities prepared by MultiProbeRetrievalModel.prepare
         Returns:
             (float): The loss
-            (list): The best fitting attention weights
-            (bool): Whether or not the optimisation converged
+            (np.ndarray): The gradient of the loss
         """
 
+        self.instrumentation.count('gradient')
+
+        with self.instrumentation.phase('gradient'):
+
+            if self.log_loss_func is not None:
+                log_rs, gradient = self.engine.log_retrieval_strengths_and_gradient(data, a_weights)
+                return self.log_loss_func(log_rs), GRADIENTS[self.log_loss_func](log_rs, gradient)
+
+            rs, gradient = self.engine.retrieval_strengths_and_gradient(data, a_weights)
+
+            loss = self.loss_func(rs)
+            loss_gradient = GRADIENTS[self.loss_func](rs, gradient)
+
+        return loss, loss_gradient
+
+    def _fit_prepared(self, data, x0=None):
+        """Fit the model to prepared similarities, returning the loss, weights and convergence"""
+
         # estimate weights using the optimiser
         if self.learn_weights:
             res = self.optimiser.minimise(
-                self._fit_and_evaluate, args=(current_sims, subs_sims)
+                self._fit_and_evaluate,
+                args=(data,),
+                loss_and_grad=self.loss_and_gradient if self._use_gradient(data) else None,
+                x0=x0,
+                batch_func=self.evaluate_batch,
             )
+            self.optimise_result = res
 
             weights = res.x
             loss = res.fun
             success = res.success
 
+            # the optimiser can finish worse than where it started (e.g. after stepping into weights
+            # where the retrieval strengths underflow), in which case keep the starting weights
+            if x0 is not None:
+                x0 = np.asarray(x0, dtype=float)
+                start_loss = self._fit_and_evaluate(x0, data)
+                if start_loss < loss:
+                    weights, loss = x0, start_loss
+
         # otherwise use some default set of attention weights
         else:
             weights = self.init_probe_weights
-            loss = self._fit_and_evaluate(weights, current_sims, subs_sims)
+            loss = self._fit_and_evaluate(weights, data)
             success = True
+            self.optimise_result = None
+
+        return loss, weights, success
+
+    def fit(self, current_sims, subs_sims, x0=None):
+        """
+        Fit the model to the similarities from a given visit and return the loss
+       
+        Args:
+            current_sims (list): A list of similarity cues representing the similarity between the current
+                and next product (i.e. the numerator in the SAM equation)
+            subs_sims (list): A list of similarity cues representing the similarity between the current
+                and remaining products (i.e. the denominator in the SAM equation). Each cue should be a
+                RaggedArray (see memory_analyses.data.ragged) or an IndexedRemaining, which is looked up from
+                a similarity matrix here (see memory_analyses.data.sequences); columns of similarity strings
+                are parsed here
+            x0 (list): Optionally, the attention weights to start the optimiser from (e.g. the weights of
+                a nested model). The optimiser result is kept in self.optimise_result, and engines that
+                approximate the denominator report their error in self.approximation_report. The timings
+                and evaluation counts of the fit are kept in self.instrumentation
+        Returns:
+            (float): The loss
+            (list): The best fitting attention weights
+            (bool): Whether or not the optimisation converged
+        """
+
+        self.instrumentation.reset()
+
+        with self.instrumentation.phase('fit'):
+            return self._fit(current_sims, subs_sims, x0)
+
+    def score(self, current_sims, subs_sims, a_weights):
+        """
+        Evaluate the loss of the model with given attention weights on similarities it was not fitted to
+        (e.g. a held-out list)
+
+        Args:
+            current_sims (list): Numerator similarities for each probe (see fit)
+            subs_sims (list): Denominator similarities for each probe (see fit)
+            a_weights (list): The attention weights
+        Returns:
+            (float): The loss
+        """
+
+        return self._fit_and_evaluate(np.asarray(a_weights, dtype=float), self.prepare(current_sims, subs_sims))
+
+    def log_retrieval_strengths(self, current_sims, subs_sims, a_weights):
+        """
+        Evaluate the log retrieval strength of each transition with given attention weights (e.g. the fitted
+        weights). Unlike the loss, these are not clamped, so a retrieval strength of 0 gives -inf
+
+        Args:
+            current_sims (list): Numerator similarities for each probe (see fit)
+            subs_sims (list): Denominator similarities for each probe (see fit)
+            a_weights (list): The attention weights
+        Returns:
+            (np.ndarray): The log retrieval strength of each transition
+        """
+
+        data = self.prepare(current_sims, subs_sims)
+        a_weights = np.asarray(a_weights, dtype=float)
+
+        if getattr(self.engine, 'log_space', False):
+            return self.engine.log_retrieval_strengths(data, a_weights)
+
+        with np.errstate(divide='ignore'):
+            return np.log(self._determine_retrieval_strengths(data, a_weights))
+
+    def _refit(self, data, weights):
+        """Refit the model to re-prepared similarities from the fitted weights, counting the optimiser's work"""
+
+        first_result = self.optimise_result
+        with self.instrumentation.phase('optimise'):
+            loss, weights, success = self._fit_prepared(data, weights if self.learn_weights else None)
+
+        if first_result is not None:
+            for count in ('nit', 'nfev'):
+                self.optimise_result[count] = self.optimise_result.get(count, 0) + first_result.get(count, 0)
+
+        return loss, weights, success
+
+    def _fit(self, current_sims, subs_sims, x0=None):
+        """Prepare the similarities and fit the model (see fit)"""
+
+        with self.instrumentation.phase('prepare'):
+            data = self.prepare(current_sims, subs_sims)
+
+        with self.instrumentation.phase('optimise'):
+            loss, weights, success = self._fit_prepared(data, x0)
+
+        # approximate engines make any transitions exact where the approximation may be too coarse at
+        # the fitted weights, then refit from those weights, until every transition is within the bound
+        self.approximation_report = None
+        if hasattr(self.engine, 'refine'):
+            while True:
+                with self.instrumentation.phase('refine'):
+                    refined = self.engine.refine(data, weights)
+                if refined is None:
+                    break
+                data = refined
+                loss, weights, success = self._refit(data, weights)
+
+            # if the check rows still show a larger error than allowed, the approximation is not used at all
+            self.approximation_report = self.engine.approximation_error(data, weights)
+            self.approximation_report['exact_fallback'] = self.approximation_report['max_error'] > self.engine.max_error
+
+            if self.approximation_report['exact_fallback']:
+                with self.instrumentation.phase('refine'):
+                    data = self.engine.make_exact(data)
+                loss, weights, success = self._refit(data, weights)
 
         return loss, weights, success
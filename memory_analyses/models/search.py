@@ -0,0 +1,220 @@
+"""Search over subsets of representations for the best fitting retrieval model"""
+
+import logging
+import itertools
+
+from memory_analyses.utilities.stats import bic
+
+STRATEGIES = ('exhaustive', 'forward', 'bic')
+
+def discover_representations(table, remaining):
+    """
+    Find the representations that a transition table has similarities for
+
+    Arguments:
+        table (pd.DataFrame): The transition table, with a <rep>_similarity column for each representation
+        remaining (dict): The remaining similarities for each representation (e.g. from rem_<rep> columns)
+
+    Returns:
+        (list): The representations with both numerator and remaining similarities, in the order of remaining
+    """
+
+    return [rep for rep in remaining if f'{rep}_similarity' in table.columns]
+
+def resolve_representations(representations, table, remaining):
+    """
+    Find the representations to compare: those given, or with 'discover', every representation that the
+    transition table has similarities for (see discover_representations)
+
+    Arguments:
+        representations (list or str): The representations, in the order of the comparison table, or 'discover'
+        table (pd.DataFrame): The transition table, with a <rep>_similarity column for each representation
+        remaining (dict): The remaining similarities for each representation (e.g. from rem_<rep> columns)
+
+    Returns:
+        (list): The representations
+    """
+
+    available = discover_representations(table, remaining)
+
+    if representations == 'discover':
+        return available
+
+    representations = list(representations)
+
+    missing = [rep for rep in representations if rep not in available]
+    if len(missing) > 0:
+        raise ValueError('No similarities for the representations {0}'.format(missing))
+
+    return representations
+
+def model_bic(results):
+    """
+    Calculate the BIC of a model from its per-participant fits (as in the model comparison summary)
+
+    Arguments:
+        results (pd.DataFrame): Fit results for each participant (see fitting.run_model)
+
+    Returns:
+        (float): The BIC of the model
+    """
+
+    return bic(-results['loss'].astype(float).sum(), results['nrows'].sum(), results['k'].max())
+
+class ModelSearch(object):
+    """
+    Search over subsets of representations, fitting each model at most once
+
+    Strategies:
+        exhaustive: fit every subset (up to max_size representations), smallest first
+        forward: starting with no representations, repeatedly add the representation that most improves
+            the BIC, until no addition improves it
+        bic: fit every subset of each size that extends a subset of the previous size whose BIC is within
+            margin of the best at that size (i.e. a beam search that prunes poorly fitting branches)
+
+    The search can be run by itself (run), or driven one batch of models at a time (steps and record),
+    e.g. so that the models of several searches are fitted together
+
+    Arguments:
+        fit_model (callable): Fits a model, given its representations and the models fitted so far
+            (a dict of results keyed by a tuple of their representations), and returns its results
+            (only needed by run)
+        representations (list): The representations to search over
+        strategy (str): One of STRATEGIES
+        max_size (int): The largest number of representations in a model (None for no limit)
+        margin (float): For the bic strategy, how far (in BIC) a subset can be from the best of its
+            size and still be extended
+        by_size (bool): For the exhaustive strategy, whether to fit each size of model in a separate batch,
+            so that smaller models are fitted before the models that contain them (e.g. for warm starts)
+    """
+
+    def __init__(self, fit_model, representations, strategy='exhaustive', max_size=None, margin=10., by_size=True):
+        super(ModelSearch, self).__init__()
+
+        if strategy not in STRATEGIES:
+            raise ValueError('Unknown search strategy {0}, expected one of {1}'.format(strategy, STRATEGIES))
+
+        self.fit_model = fit_model
+        self.representations = list(representations)
+        self.strategy = strategy
+        self.max_size = len(self.representations) if max_size is None else min(max_size, len(self.representations))
+        self.margin = margin
+        self.by_size = by_size
+        self.fitted = {}
+        self.scores = {}
+
+    def _canonical(self, subset):
+        """Order a subset of representations as they are ordered in self.representations"""
+
+        return tuple(rep for rep in self.representations if rep in subset)
+
+    def record(self, subset, results):
+        """Record the results of fitting the model for a subset of representations"""
+
+        subset = self._canonical(subset)
+
+        self.fitted[subset] = results
+        self.scores[subset] = model_bic(results)
+
+    def _batch(self, subsets):
+        """The subsets (in canonical order, without duplicates) that have not been fitted yet"""
+
+        batch = []
+        for subset in subsets:
+            subset = self._canonical(subset)
+            if subset not in self.fitted and subset not in batch:
+                batch.append(subset)
+
+        return batch
+
+    def _exhaustive(self):
+        """Fit every subset, smallest first"""
+
+        sizes = [
+            list(itertools.combinations(self.representations, size)) for size in range(1, self.max_size + 1)
+        ]
+
+        if self.by_size:
+            for subsets in sizes:
+                yield subsets
+        else:
+            yield [subset for subsets in sizes for subset in subsets]
+
+    def _forward(self):
+        """Add one representation at a time, while this improves the BIC"""
+
+        current, current_score = (), float('inf')
+
+        while len(current) < self.max_size:
+
+            candidates = [self._canonical(current + (rep,)) for rep in self.representations if rep not in current]
+            yield candidates
+            scores = [self.scores[subset] for subset in candidates]
+
+            best = min(range(len(candidates)), key=lambda i: scores[i])
+            if scores[best] >= current_score:
+                break
+
+            current, current_score = candidates[best], scores[best]
+
+    def _bic_pruned(self):
+        """Extend the subsets of each size whose BIC is close to the best of that size"""
+
+        level = [(rep,) for rep in self.representations]
+
+        while len(level) > 0:
+
+            yield level
+            scores = [self.scores[subset] for subset in level]
+            best = min(scores)
+
+            kept = [subset for subset, score in zip(level, scores) if score <= best + self.margin]
+
+            if len(level[0]) >= self.max_size:
+                break
+
+            extended = set(
+                self._canonical(subset + (rep,))
+                for subset in kept for rep in self.representations if rep not in subset
+            )
+            level = sorted(extended, key=lambda subset: [self.representations.index(rep) for rep in subset])
+
+    def steps(self):
+        """
+        Step through the search, one batch of models at a time. The results of every model in a batch
+        must be recorded (see record) before the next batch is requested
+
+        Yields:
+            (list): The subsets of representations to fit next (models that have already been fitted are
+                not repeated)
+        """
+
+        strategies = {'exhaustive': self._exhaustive, 'forward': self._forward, 'bic': self._bic_pruned}
+
+        for subsets in strategies[self.strategy]():
+            batch = self._batch(subsets)
+            if len(batch) > 0:
+                yield batch
+
+    def run(self):
+        """
+        Run the search, fitting each model with fit_model
+
+        Returns:
+            (dict): The results of every model fitted, keyed by a tuple of their representations
+        """
+
+        for batch in self.steps():
+            for subset in batch:
+                logging.info(f'Fitting model for {list(subset)}')
+                self.record(subset, self.fit_model(list(subset), self.fitted))
+
+        self.log_summary()
+
+        return self.fitted
+
+    def log_summary(self):
+        """Log the number of models fitted"""
+
+        logging.info('Fitted {0} of {1} possible models'.format(
+            len(self.fitted), 2 ** len(self.representations) - 1))
@@ -8,211 +8,182 @@ Adam Hornsby
 import logging
 
 import pandas as pd
-import numpy as np
-
-from memory_analyses.models.sam import MultiProbeRetrievalModel
-from memory_analyses.models.loss import negative_log_likelihood
-from memory_analyses.models.optimise import ScipyMinimiser
-from memory_analyses.utilities.stats import aic, bic, mean_confidence_interval
-
-def _run_model(data: pd.DataFrame, representations: list) -> pd.DataFrame: 
-    """
-    Run a model on the data for a given set of representations
-    For exampe, `_run_model(data, ['cooc', 'w2v', 'hier']) will run the model
-    on the three representations
-   
-    Arguments:
-        data (pd.DataFrame): The sequential retrieval data. Must contain a participant column
-            and measures of sequential similarity, prefixed with the values given in the representations
-            argument
-       
-        representation (list): A list of representations. These must match the prefixes of the columns
-            within data. For examle, 'cooc' will subset 'cooc_similarity'.
-           
-    Returns:
-        (pd.DataFrame): A DataFrame of model fit statistics per participant.
-    """
-   
-    participants = data['participant'].unique()
-   
-    k = len(representations)
-   
-    bounds = (0, None)
-    optim = ScipyMinimiser(
-        {
-            "method": "SLSQP",
-            "x0": [0] * k,
-            "bounds": [bounds] * k,
-        }
-    )
-
-    model = MultiProbeRetrievalModel(
-                probe_configs=None,
-                optimiser=optim,
-                jitter_val=1.0e-7,
-                loss_func=negative_log_likelihood,
-                init_probe_weights=None,
-                learn_weights=True,
-            )
-   
-    all_loss = []
-    all_weights = []
-    all_success = []
-    all_rows = []
-
-    # loop over each participant
-    for participant in participants:
-
-        # extract transition similarities for this participant
-        p_data = data[data['participant'] == participant]
-
-        # get the current similarities
-        current_sims = []
-        subs_sims = []
-        for sim in representations:
-            current_sims.append(p_data[f'{sim}_similarity'])
-            subs_sims.append(p_data[f'rem_{sim}'])
-
-        # fit the model
-        loss, weights, success = model.fit(current_sims, subs_sims)
-
-        all_loss.append(loss)
-        all_weights.append(weights)
-        all_success.append(success)
-        all_rows.append(p_data.shape[0])
-   
-    results_df = pd.DataFrame([participants, all_loss, all_success, all_rows]).T
-    results_df.columns = ['participant', 'loss', 'converged', 'nrows']
-    results_df[representations] = all_weights
-    results_df['model'] = str(representations)
-    results_df['k'] = k
-   
-    return results_df
-
-def _create_baseline_data(data):
-    """Create data for a baseline model, where we have equal transition probabilities for each stimulus"""
-   
-    # create a baseline model where each transition has an equal probability
-    baseline = data[['participant']]
-    baseline['dummy_similarity'] = 1.
-    baseline['rem_dummy'] = data['rem_hier'].apply(lambda x: ' '.join(np.ones(len(x.split(' '))).astype(str).tolist()))
-   
-    return baseline
-
-def _model_comparison_summary(model_results, baseline_df):
-    """Calculate model comparison statistics for each model, such as AIC and BIC"""
-   
-    # sum loss for each model type
-    model_summary = model_results.groupby('model').agg({'loss': 'sum', 'nrows': 'sum', 'k': 'max'})
-    model_summary['loss'] = -model_summary['loss']
-    model_bic = model_summary.apply(lambda x: bic(*x), axis=1)
-    model_aic = model_summary.apply(lambda x: aic(*x), axis=1)
-   
-    # add on basline information, which will become useful later for comparisons
-    # model has 0 parameters
-    baseline_summary = baseline_df.groupby('model').agg({'loss': 'sum', 'nrows': 'sum', 'k': 'max'})
-    baseline_summary['loss'] = -baseline_summary['loss']
-    baseline_bic = baseline_summary.apply(lambda x: bic(x[0], x[1], 0), axis=1)
-    baseline_aic = baseline_summary.apply(lambda x: aic(x[0], x[1], 0), axis=1)
-   
-    baseline_bic = baseline_bic[0]
-    baseline_aic = baseline_aic[0]
-   
-    # join these comparions together
-    model_fits = pd.concat([model_summary[['k', 'loss']], model_aic, model_bic], axis=1).sort_values(['k', 'loss'], ascending=[True, False])
-    model_fits.columns = ['k', 'loss', 'aic', 'bic']
-    model_fits['baseline_aic'] = baseline_aic
-    model_fits['baseline_bic'] = baseline_bic
-   
-    # calculate the aic and bic improvement (over the baseline) for each model
-    model_fits['aic_improvement'] = ((baseline_aic - model_fits['aic']) / model_fits['aic']) * 100
-    model_fits['bic_improvement'] = ((baseline_bic - model_fits['bic']) / model_fits['bic']) * 100
-    model_fits['baseline_loss'] = baseline_summary['loss'][0]
-   
-    # calculate the mean attention weight for each knowledge representation
-    mean_weights = model_results.groupby('model')[['cooc', 'w2v', 'hier']].mean()
-   
-    # add on the confidence intervals for each attention weight
-    mean_weights = mean_weights.round(3).astype(str)
-    mean_ci = model_results.groupby('model')[['cooc', 'w2v', 'hier']].agg(mean_confidence_interval).round(3).astype(str)
 
-    for col in mean_weights.columns:
-        mean_weights[col] = mean_weights[col] + ' (' + mean_ci[col] + ')'
-   
-    model_fw = pd.concat([model_fits, mean_weights], axis=1)
-   
-    return model_fw
+from memory_analyses.data.blocks import CONDITIONS, condition_blocks
+from memory_analyses.data.shared import compact_sims
+from memory_analyses.data.strengths import StrengthsExport
+from memory_analyses.data.transitions import baseline_items, load_transitions, validate_transitions
+from memory_analyses.models.baseline import run_baseline
+from memory_analyses.models.comparison import comparison_table
+from memory_analyses.models.bootstrap import bootstrap_conditions
+from memory_analyses.models.crossval import cross_validate_conditions
+from memory_analyses.models.export import export_conditions
+from memory_analyses.models.fitting import (
+    FIT_LOG_COLUMNS, log_block_changes, log_hot_spots, log_warm_start_savings, run_searches, worker_pool,
+)
+from memory_analyses.models.search import ModelSearch, resolve_representations
+from memory_analyses.utilities.instrumentation import peak_rss
+from memory_analyses.utilities.logging import RecordLogger
+from memory_analyses.utilities.store import FitResultStore
 
 def main(config):
     """Main entrypoint to script"""
    
-    # import the sequential transition data
-    all_data = pd.read_csv(config['transition_table'])
-   
-    # filter data based on the requested run
-    if config['condition'] == 'all':
-        all_data['participant'] = all_data['id'] + '_' + all_data['listnum'].astype(str)
-       
-    elif config['condition'] == 'collapse':
-        all_data['participant'] = all_data['id']
-       
-    elif config['condition'] == 'first':
-        all_data['listnum'] = all_data.groupby('id')['listnum'].rank("dense")
-        all_data = all_data[all_data['listnum'] == 1]
-        all_data['participant'] = all_data['id']
-       
-    else:
-        raise NotImplementedError
-   
+    # the number of processes to fit participants with
+    jobs = config.get('jobs', 1)
+
+    # how retrieval strengths are evaluated (see memory_analyses.models.engines)
+    engine = config.get('engine', 'segment')
+
+    # fits from previous (possibly interrupted) runs are reused from the store
+    store = FitResultStore(config['fit_store']) if config.get('fit_store') else None
+
+    # the conditions to compare models for, which share the loaded data and a single pool of fits
+    conditions = config.get('conditions') or [config['condition']]
+    for condition in conditions:
+        if condition not in CONDITIONS:
+            raise NotImplementedError
+
+    all_data, remaining = load_transitions(config)
+
+    blocks = {
+        condition: condition_blocks(all_data['id'].values, all_data['listnum'].values, condition)
+        for condition in conditions
+    }
+
+    # the representations to compare (or with 'discover', every representation with similarities in the data)
+    representations = resolve_representations(
+        config.get('representations', ['cooc', 'w2v', 'hier']), all_data, remaining)
+    logging.info('Representations: {0}'.format(representations))
+
+    # check the similarities once, rather than on every evaluation of the model
+    # (transitions built from sequences always retrieve one of their remaining items, so are not checked)
+    if config.get('input', 'table') != 'matrices':
+        validate_transitions(all_data, remaining, representations)
+
     # print summary statistics to the log
     logging.info('Number of participants: {0})'.format(
         all_data['id'].nunique())
             )
 
-    # create a baseline model
-    # each option will be given an equal probability
-    baseline = _create_baseline_data(all_data)
-   
+    current_sims = {rep: all_data[f'{rep}_similarity'].values for rep in representations}
+    subs_sims = {rep: remaining[rep] for rep in representations}
+
+    # optionally, store the similarities as float32 (evaluated by the compact engine), and share a single
+    # copy of them with every worker process
+    compact = config.get('compact', False)
+    if compact:
+        current_sims, subs_sims = compact_sims(current_sims), compact_sims(subs_sims)
+        if engine == 'segment':
+            engine = 'compact'
+
+    # evaluate the baseline model (equal probability of transitioning to each product)
+    n_remaining = baseline_items(all_data, remaining)
+    baselines = {
+        condition: run_baseline(n_remaining, blocks[condition])
+        for condition in conditions
+    }
+
+    # search over subsets of the representations for each condition, fitting each model once
+    # e.g. cooc: episodic (i.e. co-occurrence), w2v: semantic (i.e. word2vec), hier: hierarchy
+    # when warm starting, each model starts from the best fit of the smaller models nested within it
+    # (every strategy fits smaller models first)
+    warm_start = config.get('warm_start', False)
+
+    searches = {
+        condition: ModelSearch(
+            None, representations, strategy=config.get('search', 'exhaustive'),
+            max_size=config.get('max_size'), margin=config.get('search_margin', 10.), by_size=warm_start,
+        )
+        for condition in conditions
+    }
+
+    # the diagnostics of each new fit are written to a structured log
+    fit_log = RecordLogger(config['fit_log'], FIT_LOG_COLUMNS) if config.get('fit_log') else None
+    if fit_log is not None:
+        fit_log.create_if_not_exists()
+
+    # only participants that are new or have changed since the last run are fitted; the stored fits of
+    # the others are merged in (each representation of each block is hashed once, for every model)
+    digests, block_digests = {}, {}
+    if store is not None:
+        for condition in conditions:
+            block_digests[condition] = log_block_changes(
+                store, condition, representations, current_sims, subs_sims, blocks[condition], digests)
+
+    # the export is opened before fitting, so an unusable output directory is reported straight away
+    export = StrengthsExport(config['strengths_output'], all_data.shape[0]) if config.get('export_strengths') else None
+
+    with worker_pool(jobs, current_sims, subs_sims, share=compact) as pool:
+
+        run_searches(
+            searches, blocks, current_sims, subs_sims, pool=pool, jobs=jobs, store=store, fit_log=fit_log,
+            warm_start=warm_start, multi_start=config.get('multi_start'), engine=engine,
+            engine_args=config.get('engine_args'), digests=digests, cold_check=config.get('warm_start_check', 5),
+        )
+
+        # every fit of each participant is now stored, so their data can be recorded as fitted
+        for condition, condition_digests in block_digests.items():
+            store.update_blocks(condition, condition_digests)
+
+        # the log retrieval strength of every transition under each fitted model, and under the baseline model
+        if export is not None:
+            export_conditions(
+                export, current_sims, subs_sims, n_remaining, all_data.index.values, blocks, searches, pool=pool,
+                jobs=jobs, engine=engine, engine_args=config.get('engine_args'),
+            )
+
+        # held-out likelihoods, leaving out one list of each participant at a time
+        if config.get('cv'):
+            cross_validate_conditions(
+                current_sims, subs_sims, n_remaining, all_data['listnum'].values, blocks, searches,
+                output=config.get('cv_results'), pool=pool, jobs=jobs, multi_start=config.get('multi_start'),
+                engine=engine, engine_args=config.get('engine_args'),
+            )
+
+        # bootstrap confidence intervals for the comparison statistics of every fitted model
+        if (config.get('bootstrap') or {}).get('method'):
+            bootstrap_conditions(
+                config['bootstrap'], current_sims, subs_sims, n_remaining, blocks, searches, baselines, pool=pool,
+                jobs=jobs, multi_start=config.get('multi_start'), engine=engine, engine_args=config.get('engine_args'),
+            )
+
+    if store is not None:
+        store.close()
+
     all_results = []
 
-    # fit the baseline model (equal probability of transitioning to each product)
-    baseline_df = _run_model(baseline, ['dummy'])
-    baseline_df['k'] = 0
-    all_results.append(baseline_df)
-
-    # loop over each model comparison and fit the model
-    # cooc: episodic (i.e. co-occurrence)
-    # w2v: semantic (i.e. word2vec)
-    # hier: hierarchy
-    for model_feats in [
-                        ['cooc'], 
-                        ['w2v'], 
-                        ['hier'],
-                        ['cooc', 'w2v'],
-                        ['cooc', 'hier'],
-                        ['w2v', 'hier'],
-                        ['cooc', 'w2v', 'hier']
-                        ]:
-
-        logging.info(f'Fitting model for {model_feats}')
-
-        results_df = _run_model(all_data, model_feats)
-        all_results.append(results_df)
-       
-    model_results = pd.concat(all_results)
-   
-    # calclate model comparison statistics
-    model_fw = _model_comparison_summary(model_results, baseline_df)
-    model_fw = model_fw.replace('nan (nan)', np.NaN)
-    model_fw = model_fw.sort_values(['k', 'bic_improvement'])
-   
-    # show the model summary
-    logging.info('*** FINAL MODEL COMPARISON ***')
-    logging.info(model_fw[['bic_improvement', 'cooc', 'w2v', 'hier']].iloc[1:])
-   
-    # print a LaTeX friendly version for the paper
-    print(model_fw[['bic_improvement', 'cooc', 'w2v', 'hier']].iloc[1:].to_latex(na_rep=" ", float_format="%.3f"))
-   
+    for condition in conditions:
+
+        searches[condition].log_summary()
+
+        model_results = pd.concat([baselines[condition]] + list(searches[condition].fitted.values()))
+        model_results['condition'] = condition
+        all_results.append(model_results)
+
+        if warm_start:
+            log_warm_start_savings(model_results)
+
+        # calclate model comparison statistics
+        model_fw = comparison_table(model_results, baselines[condition], representations)
+
+        # show the model summary
+        logging.info('*** FINAL MODEL COMPARISON ({0}) ***'.format(condition))
+        logging.info(model_fw[['bic_improvement'] + representations].iloc[1:])
+
+        # print a LaTeX friendly version for the paper
+        if len(conditions) > 1:
+            print('% condition: {0}'.format(condition))
+        print(model_fw[['bic_improvement'] + representations].iloc[1:].to_latex(na_rep=" ", float_format="%.3f"))
+
+    log_hot_spots(pd.concat(all_results))
+
+    # the workers have finished, so their peak memory is included
+    main_rss, worker_rss = peak_rss()
+    if main_rss is not None:
+        logging.info('Peak RSS: {0:.1f} MB{1}'.format(
+            main_rss, ' (largest worker: {0:.1f} MB)'.format(worker_rss) if jobs > 1 else ''))
+
 
 if __name__ == '__main__':
    
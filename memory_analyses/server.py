@@ -0,0 +1,275 @@
+"""A local fitting service, which keeps the transitions loaded and the fitting workers running between requests"""
+
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pandas as pd
+
+from memory_analyses.data.blocks import CONDITIONS, condition_blocks
+from memory_analyses.data.shared import compact_sims
+from memory_analyses.data.transitions import baseline_items, load_transitions, validate_transitions
+from memory_analyses.models.baseline import run_baseline
+from memory_analyses.models.comparison import comparison_table
+from memory_analyses.models.fitting import FIT_LOG_COLUMNS, run_models, run_searches, worker_pool
+from memory_analyses.models.search import ModelSearch, discover_representations
+from memory_analyses.utilities.logging import RecordLogger
+from memory_analyses.utilities.store import FitResultStore
+
+def _frame_to_json(df):
+    """Convert a DataFrame (including its index) to JSON-compatible records, with missing values as null"""
+
+    return json.loads(df.reset_index().to_json(orient='records'))
+
+class FitService(object):
+    """
+    Fit and compare models on transitions that are loaded once. The similarities of every representation
+    are held by a pool of worker processes, which is started once and reused by every request
+
+    Arguments:
+        config (dict): The fitting configuration (see config/retrieval.py). The representations, condition
+            and optimiser settings are defaults that each request can override
+    """
+
+    def __init__(self, config):
+        super(FitService, self).__init__()
+        self.config = config
+        self.jobs = config.get('jobs', 1)
+
+        self.all_data, self.remaining = load_transitions(config)
+
+        # every representation is kept, so that requests can fit any subset of them
+        self.representations = discover_representations(self.all_data, self.remaining)
+        if config.get('input', 'table') != 'matrices':
+            validate_transitions(self.all_data, self.remaining, self.representations)
+
+        self.current_sims = {rep: self.all_data[f'{rep}_similarity'].values for rep in self.representations}
+        self.subs_sims = {rep: self.remaining[rep] for rep in self.representations}
+
+        # optionally, float32 similarities shared with the workers (see retrieval_model.main)
+        if config.get('compact', False):
+            self.current_sims, self.subs_sims = compact_sims(self.current_sims), compact_sims(self.subs_sims)
+
+        self.blocks = {}
+        self.baselines = {}
+
+        # the digests of the data of each block, for the fit store
+        self.digests = {}
+
+        self.store = FitResultStore(config['fit_store']) if config.get('fit_store') else None
+
+        self.fit_log = RecordLogger(config['fit_log'], FIT_LOG_COLUMNS) if config.get('fit_log') else None
+        if self.fit_log is not None:
+            self.fit_log.create_if_not_exists()
+
+        self._pool_context = worker_pool(
+            self.jobs, self.current_sims, self.subs_sims, share=config.get('compact', False))
+        self.pool = self._pool_context.__enter__()
+
+        logging.info('Loaded {0} transitions with representations {1}'.format(
+            self.all_data.shape[0], self.representations))
+
+    def close(self):
+        """Stop the workers and close the fit store"""
+
+        self._pool_context.__exit__(None, None, None)
+
+        if self.store is not None:
+            self.store.close()
+
+    def _condition(self, condition):
+        """The participant blocks and baseline results of a condition (grouped on first use)"""
+
+        if condition not in CONDITIONS:
+            raise ValueError('Unknown condition {0}, expected one of {1}'.format(condition, CONDITIONS))
+
+        if condition not in self.blocks:
+            self.blocks[condition] = condition_blocks(
+                self.all_data['id'].values, self.all_data['listnum'].values, condition)
+            self.baselines[condition] = run_baseline(
+                baseline_items(self.all_data, self.remaining), self.blocks[condition])
+
+        return self.blocks[condition], self.baselines[condition]
+
+    def _representations(self, request):
+        """The representations of a request (by default, those of the configuration), where 'discover' is every representation"""
+
+        representations = request.get('representations') or self.config.get('representations', ['cooc', 'w2v', 'hier'])
+        if representations == 'discover':
+            representations = self.representations
+        representations = list(representations)
+
+        unknown = [rep for rep in representations if rep not in self.representations]
+        if len(unknown) > 0:
+            raise ValueError('Unknown representations {0}, expected some of {1}'.format(unknown, self.representations))
+
+        return representations
+
+    def _fit_settings(self, request):
+        """The optimiser and engine settings of a request, defaulting to those of the configuration"""
+
+        default_engine = 'compact' if self.config.get('compact', False) else 'segment'
+
+        return {
+            key: request.get(key, self.config.get(key, default))
+            for key, default in (('multi_start', None), ('engine', default_engine), ('engine_args', None))
+        }
+
+    def fit(self, request):
+        """
+        Fit a single model to every participant of a condition
+
+        Arguments:
+            request (dict): The condition and representations, and optionally multi_start, engine and engine_args
+
+        Returns:
+            (dict): The fit of each participant (as from fitting.run_model)
+        """
+
+        condition = request.get('condition', self.config.get('condition') or 'all')
+        blocks, _ = self._condition(condition)
+        representations = self._representations(request)
+
+        results_df = run_models(
+            self.current_sims, self.subs_sims, [(representations, blocks, None)], pool=self.pool, jobs=self.jobs,
+            store=self.store, digests=self.digests, **self._fit_settings(request)
+        )[0]
+
+        return {'condition': condition, 'representations': representations, 'results': _frame_to_json(results_df)}
+
+    def compare(self, request):
+        """
+        Search over subsets of representations for one or more conditions, as the fit command does
+
+        Arguments:
+            request (dict): The conditions (or condition) and representations, and optionally search, max_size,
+                search_margin, warm_start, multi_start, engine and engine_args
+
+        Returns:
+            (dict): For each condition, the model comparison statistics of each model (as from
+                comparison_table) and the LaTeX table printed by the fit command
+        """
+
+        conditions = request.get('conditions') or [request.get('condition', self.config.get('condition') or 'all')]
+        representations = self._representations(request)
+        warm_start = request.get('warm_start', self.config.get('warm_start', False))
+
+        blocks = {condition: self._condition(condition)[0] for condition in conditions}
+
+        searches = {
+            condition: ModelSearch(
+                None, representations, strategy=request.get('search', self.config.get('search', 'exhaustive')),
+                max_size=request.get('max_size', self.config.get('max_size')),
+                margin=request.get('search_margin', self.config.get('search_margin', 10.)), by_size=warm_start,
+            )
+            for condition in conditions
+        }
+
+        run_searches(
+            searches, blocks, self.current_sims, self.subs_sims, pool=self.pool, jobs=self.jobs, store=self.store,
+            fit_log=self.fit_log, warm_start=warm_start, digests=self.digests, **self._fit_settings(request)
+        )
+
+        response = {}
+        for condition in conditions:
+
+            baseline_df = self.baselines[condition]
+            model_results = pd.concat([baseline_df] + list(searches[condition].fitted.values()))
+
+            model_fw = comparison_table(model_results, baseline_df, representations)
+
+            response[condition] = {
+                'summary': _frame_to_json(model_fw),
+                'latex': model_fw[['bic_improvement'] + representations].iloc[1:].to_latex(na_rep=" ", float_format="%.3f"),
+            }
+
+        return response
+
+    def status(self):
+        """Describe the loaded data"""
+
+        return {
+            'transitions': int(self.all_data.shape[0]),
+            'representations': self.representations,
+            'conditions': sorted(self.blocks),
+            'jobs': self.jobs,
+        }
+
+def _handler(service):
+    """Create a request handler for the service: GET /status, and POST /fit, /compare and /shutdown with a JSON body"""
+
+    class FitRequestHandler(BaseHTTPRequestHandler):
+
+        def _respond(self, status, body):
+            content = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def _handle(self, route):
+            """Respond to a request by calling route, or with a JSON error if it fails"""
+
+            try:
+                route()
+
+            except (ValueError, KeyError, TypeError) as error:
+                # a request that the service cannot fit (e.g. unknown representations)
+                self._respond(400, {'error': str(error)})
+
+            except Exception as error:
+                # a failure of the service itself, which is logged in full but leaves it serving
+                logging.exception('Failed to respond to {0} {1}'.format(self.command, self.path))
+                self._respond(500, {'error': '{0}: {1}'.format(type(error).__name__, error)})
+
+        def _get(self):
+            if self.path == '/status':
+                self._respond(200, service.status())
+            else:
+                self._respond(404, {'error': 'Unknown endpoint {0}'.format(self.path)})
+
+        def _post(self):
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8')) if length > 0 else {}
+
+            if self.path == '/fit':
+                self._respond(200, service.fit(request))
+            elif self.path == '/compare':
+                self._respond(200, service.compare(request))
+            elif self.path == '/shutdown':
+                self._respond(200, {'status': 'shutting down'})
+                self.server.stopping = True
+            else:
+                self._respond(404, {'error': 'Unknown endpoint {0}'.format(self.path)})
+
+        def do_GET(self):
+            self._handle(self._get)
+
+        def do_POST(self):
+            self._handle(self._post)
+
+        def log_message(self, format, *args):
+            logging.info('%s - %s', self.address_string(), format % args)
+
+    return FitRequestHandler
+
+def main(config):
+    """Main entrypoint to script"""
+
+    service = FitService(config)
+
+    # only listen on the local machine
+    server = HTTPServer(('127.0.0.1', config.get('serve_port', 8765)), _handler(service))
+    server.stopping = False
+
+    logging.info('Serving fits on http://127.0.0.1:{0}'.format(server.server_address[1]))
+
+    try:
+        while not server.stopping:
+            server.handle_request()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,53 @@
+"""Simulate retrieval sequences from the SAM retrieval model with known attention weights, e.g. for parameter recovery"""
+
+import os
+import json
+import logging
+
+import numpy as np
+
+from memory_analyses.data.sequences import build_transitions, load_similarity_matrices
+from memory_analyses.data.synthetic import random_similarity_matrices, simulate_sequences
+from memory_analyses.data.transitions import write_transition_table
+
+def _makedirs(path):
+    """Create the directory of a file, if it does not exist"""
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+def main(config):
+    """Main entrypoint to script"""
+
+    weights = config['weights']
+
+    if config.get('similarity_matrices'):
+        matrices = load_similarity_matrices(config['similarity_matrices'])
+
+    else:
+        # random matrices are saved, so that the simulated sequences can be fitted from them
+        matrices = random_similarity_matrices(config['n_items'], list(weights), seed=config.get('seed', 0))
+        paths = {rep: os.path.join(config['matrices_dir'], '{0}.npy'.format(rep)) for rep in matrices}
+        for rep, matrix in matrices.items():
+            _makedirs(paths[rep])
+            np.save(paths[rep], matrix)
+        logging.info('Saved random similarity matrices: {0}'.format(json.dumps(paths)))
+
+    sequences = simulate_sequences(
+        matrices, weights, n_participants=config['n_participants'], n_lists=config['n_lists'],
+        list_length=config['list_length'], seed=config.get('seed', 0),
+    )
+
+    _makedirs(config['sequences'])
+    sequences.to_csv(config['sequences'], index=False)
+    logging.info('Simulated {0} retrievals with weights {1}, written to {2}'.format(
+        sequences.shape[0], json.dumps(weights), config['sequences']))
+
+    if config.get('transition_table'):
+        table, remaining = build_transitions(sequences, matrices)
+        table = table.drop(columns=['current_item', 'retrieved_item'])
+
+        _makedirs(config['transition_table'])
+        write_transition_table(config['transition_table'], table, remaining)
+        logging.info('Wrote {0} transitions to {1}'.format(table.shape[0], config['transition_table']))
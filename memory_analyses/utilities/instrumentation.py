@@ -0,0 +1,80 @@
+"""Timings and evaluation counts for model fits"""
+
+import sys
+import time
+import contextlib
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+# the timed phases of a fit, and the objective evaluations that are counted
+PHASES = ('fit', 'prepare', 'optimise', 'refine', 'objective', 'gradient', 'batch')
+COUNTS = ('objective', 'gradient', 'batch', 'batch_points')
+
+class FitInstrumentation(object):
+    """
+    Record the time spent in each phase of a model fit, and the number of objective evaluations.
+    Phases may be nested (e.g. objective evaluations happen within the optimise phase)
+    """
+
+    def __init__(self):
+        super(FitInstrumentation, self).__init__()
+        self.reset()
+
+    def reset(self):
+        """Clear the timings and counts, before a new fit"""
+
+        self.timings = {phase: 0. for phase in PHASES}
+        self.counts = {count: 0 for count in COUNTS}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time a phase of the fit (the time is added to any earlier time for the same phase)"""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.) + time.perf_counter() - start
+
+    def count(self, name, n=1):
+        """Count n evaluations"""
+
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def record(self):
+        """
+        Get the timings and counts of the last fit
+
+        Returns:
+            (dict): The seconds spent in each phase (time_<phase>) and the number of each evaluation (n_<count>)
+        """
+
+        record = {'time_' + phase: seconds for phase, seconds in self.timings.items()}
+        record.update({'n_' + count: n for count, n in self.counts.items()})
+
+        return record
+
+def peak_rss():
+    """
+    The peak resident set size of this process, and of the largest of its child processes that have
+    finished (e.g. the fitting workers, once their pool has closed)
+
+    Returns:
+        (float): The peak RSS of this process in MB (None where this is unavailable)
+        (float): The peak RSS of the largest finished child process in MB (None where this is unavailable)
+    """
+
+    if resource is None:
+        return None, None
+
+    # ru_maxrss is in bytes on macOS, and KB elsewhere
+    scale = 1024. ** 2 if sys.platform == 'darwin' else 1024.
+
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    )
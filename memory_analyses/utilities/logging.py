@@ -51,3 +51,27 @@ class ResultsLogger(object):
         """Write a row of results to the results log"""
        
         self._write_row_to_csv([datetime, analysis, model_name, model, parameter, environment, results, artifacts])
+
+class RecordLogger(ResultsLogger):
+    """
+    Log structured records (e.g. the diagnostics of each model fit) to a CSV on disk, with one
+    column per field
+
+    Arguments:
+        filepath (str): The CSV to append records to
+        columns (list): The fields of each record
+    """
+    def __init__(self, filepath, columns):
+        super(RecordLogger, self).__init__(filepath)
+        self.columns = list(columns)
+
+    def create_if_not_exists(self):
+        """Create a logging file"""
+
+        if not os.path.isfile(self.filepath):
+            self._write_row_to_csv(self.columns)
+
+    def add(self, record):
+        """Write a record (a dict of field values) to the log. Missing fields are left blank"""
+
+        self._write_row_to_csv([record.get(col, '') for col in self.columns])
@@ -53,3 +53,74 @@ def mean_confidence_interval(data, confidence=0.95):
     h = se * t.ppf((1 + confidence) / 2., n-1)
    
     return h
+
+class QuantileSketch(object):
+    """
+    Approximate the quantiles of a stream of values in bounded memory. Values are kept in levels, and
+    whenever a level is full it is compacted: its values are sorted and every other value is moved up
+    to the next level, where each value counts twice as much
+
+    Arguments:
+        capacity (int): The number of values kept at each level before compacting (larger is more accurate,
+            and the quantiles are exact until capacity values have been seen)
+        seed (int): Random seed for choosing which values are kept when compacting
+    """
+
+    def __init__(self, capacity=256, seed=0):
+        super(QuantileSketch, self).__init__()
+        self.capacity = capacity
+        self.random_state = np.random.RandomState(seed)
+        self.levels = [np.empty(0)]
+        self.count = 0
+
+    def update(self, values):
+        """Add values to the sketch"""
+
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+
+        self.count += values.shape[0]
+        self.levels[0] = np.concatenate([self.levels[0], values])
+
+        level = 0
+        while level < len(self.levels):
+
+            if self.levels[level].shape[0] > self.capacity:
+
+                items = np.sort(self.levels[level])
+                n_even = items.shape[0] - items.shape[0] % 2
+
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+
+                self.levels[level + 1] = np.concatenate([
+                    self.levels[level + 1], items[:n_even][self.random_state.randint(2)::2]])
+                self.levels[level] = items[n_even:]
+
+            level += 1
+
+    def quantile(self, q):
+        """
+        Estimate quantiles of the values seen so far
+
+        Arguments:
+            q (float or list): The quantiles [0, 1]
+
+        Returns:
+            (np.ndarray): The estimated quantiles (NaN if no values have been seen)
+        """
+
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+
+        items = np.concatenate(self.levels)
+        if items.shape[0] == 0:
+            return np.full(q.shape, np.nan)
+
+        weights = np.concatenate([np.full(values.shape[0], 2. ** level) for level, values in enumerate(self.levels)])
+
+        order = np.argsort(items, kind='stable')
+        cumulative = np.cumsum(weights[order])
+
+        positions = np.searchsorted(cumulative, q * cumulative[-1], side='left')
+
+        return items[order][np.minimum(positions, items.shape[0] - 1)]
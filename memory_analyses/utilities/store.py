@@ -0,0 +1,186 @@
+"""A persistent store of model fit results, so that interrupted runs can be resumed"""
+
+import json
+import sqlite3
+import hashlib
+import datetime
+
+import numpy as np
+
+def data_digest(arrays):
+    """
+    Hash the data that a model is fitted to
+
+    Arguments:
+        arrays (list): The arrays of data the model is fitted to
+
+    Returns:
+        (str): A hex digest of the arrays
+    """
+
+    digest = hashlib.sha1()
+
+    for values in arrays:
+        values = np.ascontiguousarray(values)
+        digest.update('{0}{1}'.format(values.dtype.str, values.shape).encode())
+        digest.update(values.view(np.uint8))
+
+    return digest.hexdigest()
+
+def fit_key(digest, params):
+    """
+    Create a key identifying a model fit from the data it was fitted to and its settings
+
+    Arguments:
+        digest (str): A digest of the data the model is fitted to (see data_digest)
+        params (dict): Any settings that affect the fit (e.g. representations and optimiser arguments)
+
+    Returns:
+        (str): A hex digest identifying the fit
+    """
+
+    key = hashlib.sha1(digest.encode())
+    key.update(json.dumps(params, sort_keys=True, default=str).encode())
+
+    return key.hexdigest()
+
+class FitResultStore(object):
+    """
+    Store the results of model fits in a SQLite database on disk, keyed by fit_key.
+    Each result is committed as soon as it is added, so a crashed run loses at most the fits in progress
+
+    Arguments:
+        filepath (str): Path to the database (created if it does not exist)
+    """
+
+    def __init__(self, filepath):
+        super(FitResultStore, self).__init__()
+        self.filepath = filepath
+        self.connection = sqlite3.connect(filepath)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS fits ('
+            'key TEXT PRIMARY KEY, participant TEXT, model TEXT, loss REAL, weights TEXT, '
+            'converged INTEGER, nrows INTEGER, created TEXT, nit INTEGER, nfev INTEGER)'
+        )
+
+        # the digest of each participant's data in the last completed run of each condition (see update_blocks)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS blocks ('
+            'condition TEXT, participant TEXT, digest TEXT, updated TEXT, PRIMARY KEY (condition, participant))'
+        )
+
+        # stores created before the optimiser counts were recorded
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(fits)')]
+        for col in ['nit', 'nfev']:
+            if col not in columns:
+                self.connection.execute('ALTER TABLE fits ADD COLUMN {0} INTEGER'.format(col))
+
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM fits').fetchone()[0]
+
+    def add(self, key, participant, model, loss, weights, converged, nrows, nit=None, nfev=None):
+        """Add the result of a single fit to the store"""
+
+        self.connection.execute(
+            'INSERT OR REPLACE INTO fits '
+            '(key, participant, model, loss, weights, converged, nrows, created, nit, nfev) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                key,
+                str(participant),
+                model,
+                float(loss),
+                json.dumps([float(w) for w in weights]),
+                int(bool(converged)),
+                int(nrows),
+                datetime.datetime.now().isoformat(),
+                None if nit is None else int(nit),
+                None if nfev is None else int(nfev),
+            )
+        )
+        self.connection.commit()
+
+    def get_many(self, keys, batch_size=500):
+        """
+        Look up the results of several fits
+
+        Arguments:
+            keys (list): The keys to look up
+            batch_size (int): How many keys to query at once
+
+        Returns:
+            (dict): (loss, weights, converged, nrows, nit, nfev) for each key that is in the store
+        """
+
+        keys = list(keys)
+        results = {}
+
+        for i in range(0, len(keys), batch_size):
+            batch = keys[i:i + batch_size]
+            rows = self.connection.execute(
+                'SELECT key, loss, weights, converged, nrows, nit, nfev FROM fits WHERE key IN ({0})'.format(
+                    ', '.join('?' * len(batch))),
+                batch,
+            )
+
+            # note that SQLite stores a nan loss as NULL
+            for key, loss, weights, converged, nrows, nit, nfev in rows:
+                results[key] = (
+                    np.nan if loss is None else loss, np.array(json.loads(weights)), bool(converged), nrows,
+                    nit, nfev,
+                )
+
+        return results
+
+    def compare_blocks(self, condition, digests):
+        """
+        Compare the digest of each participant's data for a condition with those recorded by the last run
+
+        Arguments:
+            condition (str): The condition the participants are grouped by
+            digests (dict): The digest of each participant's data
+
+        Returns:
+            (list): The participants that are new since the last run
+            (list): The participants whose data has changed
+            (list): The participants whose data is unchanged
+        """
+
+        previous = dict(self.connection.execute(
+            'SELECT participant, digest FROM blocks WHERE condition = ?', (condition,)))
+
+        new, changed, unchanged = [], [], []
+        for participant, digest in digests.items():
+            participant = str(participant)
+            if participant not in previous:
+                new.append(participant)
+            elif previous[participant] != digest:
+                changed.append(participant)
+            else:
+                unchanged.append(participant)
+
+        return new, changed, unchanged
+
+    def update_blocks(self, condition, digests):
+        """
+        Record the digest of each participant's data for a condition. This should only be called once
+        every fit of the participants has been added, so that an interrupted run is not recorded
+
+        Arguments:
+            condition (str): The condition the participants are grouped by
+            digests (dict): The digest of each participant's data
+        """
+
+        now = datetime.datetime.now().isoformat()
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO blocks (condition, participant, digest, updated) VALUES (?, ?, ?, ?)',
+            [(condition, str(participant), digest, now) for participant, digest in digests.items()],
+        )
+        self.connection.commit()
+
+    def close(self):
+        """Close the connection to the database"""
+
+        self.connection.close()
@@ -0,0 +1,95 @@
+"""Small transition tables, and the comparison tables that the original analysis printed for them"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from memory_analyses import simulate
+from memory_analyses.data.synthetic import generate_transition_table
+
+REPRESENTATIONS = ['cooc', 'w2v', 'hier']
+
+# the BIC improvement and mean weights (with their 95% confidence intervals) that the original analysis
+# (before any of the engine, data or fitting changes) printed for each condition of the generated table
+# (see transition_config), in the order of its comparison table
+BASELINE = {
+    'all': [
+        ("['w2v']", -0.3791080561013017, None, '0.636 (0.96)', None),
+        ("['cooc']", 1.868673091983225, '1.277 (0.775)', None, None),
+        ("['hier']", 3.0423618422519767, None, None, '0.983 (1.211)'),
+        ("['cooc', 'w2v']", 1.7396494037324657, '1.339 (0.743)', '0.711 (0.975)', None),
+        ("['cooc', 'hier']", 5.312486042955555, '1.504 (1.129)', None, '1.062 (1.268)'),
+        ("['w2v', 'hier']", 5.571213962163924, None, '1.951 (2.638)', '1.471 (2.041)'),
+        ("['cooc', 'w2v', 'hier']", 8.920143044642531, '1.564 (1.008)', '2.732 (4.321)', '1.857 (2.751)'),
+    ],
+    'collapse': [
+        ("['w2v']", -1.2929015552670426, None, '0.666 (1.346)', None),
+        ("['hier']", -0.8008724059848985, None, None, '0.572 (1.066)'),
+        ("['cooc']", 1.020722190577613, '1.084 (1.047)', None, None),
+        ("['w2v', 'hier']", -1.2223939736069838, None, '0.927 (1.703)', '0.715 (1.389)'),
+        ("['cooc', 'w2v']", 0.11198624387915368, '1.163 (1.101)', '0.75 (1.485)', None),
+        ("['cooc', 'hier']", 0.8766008925656696, '1.285 (1.193)', None, '0.698 (1.241)'),
+        ("['cooc', 'w2v', 'hier']", 1.8600492983137231, '1.553 (1.586)', '1.235 (2.323)', '0.989 (1.981)'),
+    ],
+    'first': [
+        ("['cooc']", -0.7058463703948558, '1.481 (1.496)', None, None),
+        ("['w2v']", -0.48886063152486287, None, '0.921 (2.517)', None),
+        ("['hier']", 2.885265396209611, None, None, '1.178 (2.855)'),
+        ("['cooc', 'w2v']", -0.9674219340399306, '1.522 (1.378)', '0.934 (2.559)', None),
+        ("['cooc', 'hier']", 3.3123199629719062, '1.942 (2.701)', None, '1.298 (3.132)'),
+        ("['w2v', 'hier']", 7.086130762273308, None, '3.126 (6.878)', '1.933 (5.217)'),
+        ("['cooc', 'w2v', 'hier']", 9.264247814294878, '1.908 (2.364)', '4.662 (11.424)', '2.658 (7.402)'),
+    ],
+}
+
+# the same for the transition table of the simulated sequences (see simulated_config), for the all condition
+SIMULATED_BASELINE = [
+    ("['cooc']", 1.782555811468993, '1.327 (0.638)', None, None),
+    ("['hier']", 3.6772124092125935, None, None, '1.315 (0.906)'),
+    ("['w2v']", 7.523505405196305, None, '1.852 (0.74)', None),
+    ("['cooc', 'hier']", 5.103356392784509, '1.383 (0.469)', None, '1.405 (1.041)'),
+    ("['cooc', 'w2v']", 9.661343874644222, '1.415 (0.758)', '1.987 (0.667)', None),
+    ("['w2v', 'hier']", 11.448402204011819, None, '1.977 (0.899)', '1.398 (1.572)'),
+    ("['cooc', 'w2v', 'hier']", 13.825462176046411, '1.552 (0.897)', '2.241 (1.264)', '1.58 (1.91)'),
+]
+
+def baseline_latex(records):
+    """The LaTeX comparison table that retrieval_model.main prints for the records of a condition (see BASELINE)"""
+
+    table = pd.DataFrame(records, columns=['model', 'bic_improvement'] + REPRESENTATIONS).set_index('model')
+    table = table.where(table.notna(), np.nan)
+
+    return table.to_latex(na_rep=" ", float_format="%.3f")
+
+@pytest.fixture
+def transition_config(tmp_path):
+    """A config for retrieval_model.main, fitting a small generated transition table (see BASELINE)"""
+
+    path = str(tmp_path / 'transition_probs.csv')
+    table, _ = generate_transition_table(
+        n_participants=4, n_lists=2, list_length=8, representations=REPRESENTATIONS, seed=0)
+    table.to_csv(path, index=False)
+
+    return {'transition_table': path, 'condition': 'all', 'fit_store': None, 'fit_log': None}
+
+@pytest.fixture
+def simulated_config(tmp_path):
+    """
+    A config for retrieval_model.main, fitting sequences simulated from random similarity matrices (see
+    SIMULATED_BASELINE). The transition table of the sequences is also written, for the table input
+    """
+
+    matrices_dir = str(tmp_path / 'representations')
+    sequences, transition_table = str(tmp_path / 'sequences.csv'), str(tmp_path / 'transition_probs.csv')
+
+    simulate.main({
+        'similarity_matrices': None, 'n_items': 30, 'matrices_dir': matrices_dir,
+        'weights': {'cooc': 0.5, 'w2v': 2., 'hier': 1.}, 'n_participants': 4, 'n_lists': 2, 'list_length': 8,
+        'seed': 0, 'sequences': sequences, 'transition_table': transition_table,
+    })
+
+    return {
+        'transition_table': transition_table, 'condition': 'all', 'fit_store': None, 'fit_log': None,
+        'sequences': sequences,
+        'similarity_matrices': {rep: '{0}/{1}.npy'.format(matrices_dir, rep) for rep in REPRESENTATIONS},
+    }
@@ -0,0 +1,34 @@
+"""Tests for the closed-form baseline model"""
+
+import numpy as np
+import pytest
+
+from conftest import BASELINE, baseline_latex
+from memory_analyses import retrieval_model
+from memory_analyses.data.blocks import condition_blocks
+from memory_analyses.data.ragged import RaggedArray
+from memory_analyses.data.transitions import baseline_items, load_transitions
+from memory_analyses.models.baseline import run_baseline
+from memory_analyses.models.fitting import build_model
+
+@pytest.mark.parametrize('condition', ['all', 'collapse', 'first'])
+def test_baseline_matches_fitted_dummy_model(transition_config, condition):
+    all_data, remaining = load_transitions(transition_config)
+    blocks = condition_blocks(all_data['id'].values, all_data['listnum'].values, condition)
+    n_remaining = baseline_items(all_data, remaining)
+
+    results = run_baseline(n_remaining, blocks)
+
+    # the original analysis fitted a model with a single dummy similarity of 1 for every item
+    offsets = np.concatenate([[0], np.cumsum(n_remaining)])
+    dummy = RaggedArray(np.ones(offsets[-1]), offsets)
+    model = build_model(1)
+    for (_, start, stop), loss in zip(blocks, results['loss']):
+        expected, _, _ = model.fit([np.ones(stop - start)], [dummy.slice(start, stop)])
+        assert loss == pytest.approx(expected)
+
+@pytest.mark.parametrize('condition', ['collapse', 'first'])
+def test_conditions_match_baseline(transition_config, capsys, condition):
+    retrieval_model.main(dict(transition_config, condition=condition))
+
+    assert capsys.readouterr().out == baseline_latex(BASELINE[condition]) + '\n'
@@ -0,0 +1,27 @@
+"""Tests for bootstrap confidence intervals of the model comparison"""
+
+import pandas as pd
+import pytest
+
+from conftest import BASELINE, REPRESENTATIONS, baseline_latex
+from memory_analyses import retrieval_model
+
+@pytest.mark.parametrize('method', ['participants', 'transitions'])
+def test_bootstrap_estimates_match_baseline(transition_config, tmp_path, capsys, method):
+    output = str(tmp_path / 'bootstrap_results.csv')
+    bootstrap = {'method': method, 'n_resamples': 8, 'confidence': 0.95, 'seed': 0, 'output': output}
+    retrieval_model.main(dict(transition_config, bootstrap=bootstrap, jobs=2))
+
+    # bootstrapping leaves the comparison table unchanged
+    assert capsys.readouterr().out == baseline_latex(BASELINE['all']) + '\n'
+
+    # the estimate of each statistic is the original analysis's
+    intervals = pd.read_csv(output).set_index(['model', 'statistic'])
+    assert (intervals['lower'] <= intervals['median']).all() and (intervals['median'] <= intervals['upper']).all()
+    assert (intervals['n_resamples'] == 8).all()
+
+    for model, bic_improvement, *weights in BASELINE['all']:
+        assert intervals.loc[(model, 'bic_improvement'), 'estimate'] == pytest.approx(bic_improvement)
+        for rep, weight in zip(REPRESENTATIONS, weights):
+            if weight is not None:
+                assert round(intervals.loc[(model, rep), 'estimate'], 3) == float(weight.split()[0])
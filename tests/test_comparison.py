@@ -0,0 +1,76 @@
+"""Tests for the model comparison statistics"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import BASELINE, REPRESENTATIONS, baseline_latex
+from memory_analyses.data.blocks import condition_blocks
+from memory_analyses.data.transitions import baseline_items, load_transitions
+from memory_analyses.models.baseline import run_baseline
+from memory_analyses.models.comparison import comparison_summary, comparison_table
+from memory_analyses.models.fitting import run_models
+from memory_analyses.utilities.stats import aic, bic, mean_confidence_interval
+
+def _model_results(config, condition):
+    all_data, remaining = load_transitions(config)
+    blocks = condition_blocks(all_data['id'].values, all_data['listnum'].values, condition)
+
+    current_sims = {rep: all_data[f'{rep}_similarity'].values for rep in REPRESENTATIONS}
+    models = [list(model) for k in range(1, 4) for model in itertools.combinations(REPRESENTATIONS, k)]
+    fitted = run_models(current_sims, remaining, [(model, blocks, None) for model in models])
+
+    baseline_df = run_baseline(baseline_items(all_data, remaining), blocks)
+
+    return pd.concat([baseline_df] + fitted), baseline_df
+
+def _original_summary(model_results, baseline_df):
+    """The statistics of each model as the original analysis calculated them, one group at a time"""
+
+    baseline_ll = -baseline_df['loss'].sum()
+    baseline_n = baseline_df['nrows'].sum()
+
+    records = {}
+    for model, group in model_results.groupby('model'):
+        ll, n, k = -group['loss'].sum(), group['nrows'].sum(), group['k'].max()
+        records[model] = {'k': k, 'loss': ll, 'aic': aic(ll, n, k), 'bic': bic(ll, n, k)}
+        for rep in REPRESENTATIONS:
+            records[model][rep] = group[rep].mean()
+            records[model][rep + '_ci'] = mean_confidence_interval(group[rep])
+
+    summary = pd.DataFrame.from_dict(records, orient='index')
+    summary['bic_improvement'] = (bic(baseline_ll, baseline_n, 0) - summary['bic']) / summary['bic'] * 100
+
+    return summary
+
+@pytest.mark.parametrize('condition', ['all', 'collapse', 'first'])
+def test_comparison_table_matches_baseline(transition_config, condition):
+    model_results, baseline_df = _model_results(transition_config, condition)
+
+    model_fw = comparison_table(model_results, baseline_df, REPRESENTATIONS)
+    latex = model_fw[['bic_improvement'] + REPRESENTATIONS].iloc[1:].to_latex(na_rep=" ", float_format="%.3f")
+
+    assert latex == baseline_latex(BASELINE[condition])
+
+def test_grouped_summary_matches_original_summary(transition_config):
+    model_results, baseline_df = _model_results(transition_config, 'all')
+
+    # a participant without a weight leaves the mean of the others, but no confidence interval
+    model_results = model_results.reset_index(drop=True)
+    model_results.loc[model_results.index[-1], 'hier'] = np.nan
+
+    summary = comparison_summary(model_results, baseline_df, REPRESENTATIONS)
+    expected = _original_summary(model_results, baseline_df).reindex(summary.index)
+
+    # the default representations are those named by the models
+    pd.testing.assert_frame_equal(summary, comparison_summary(model_results, baseline_df))
+
+    for column in expected.columns:
+        np.testing.assert_allclose(
+            summary[column].values.astype(float), expected[column].values.astype(float), equal_nan=True,
+            err_msg=column)
+
+    assert np.isnan(summary.loc["['cooc', 'w2v', 'hier']", 'hier_ci'])
+    assert not np.isnan(summary.loc["['cooc', 'w2v', 'hier']", 'hier'])
@@ -0,0 +1,41 @@
+"""Tests for leave-one-list-out cross-validation"""
+
+import ast
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import BASELINE, baseline_latex
+from memory_analyses import retrieval_model
+from memory_analyses.data.transitions import baseline_items, load_transitions
+from memory_analyses.models.fitting import build_model
+
+def test_cross_validation_matches_baseline(transition_config, tmp_path, capsys):
+    output = str(tmp_path / 'cv_results.csv')
+    retrieval_model.main(dict(transition_config, condition='collapse', cv=True, cv_results=output, jobs=2))
+
+    # cross-validation leaves the comparison table unchanged
+    assert capsys.readouterr().out == baseline_latex(BASELINE['collapse']) + '\n'
+
+    # every model is fitted to one list of each participant, and scored on the other
+    folds = pd.read_csv(output)
+    assert folds.shape[0] == len(BASELINE['collapse']) * 4 * 2
+
+    all_data, remaining = load_transitions(transition_config)
+    all_data = all_data.reset_index(drop=True)
+    n_remaining = baseline_items(all_data, remaining)
+
+    for _, fold in folds.iterrows():
+        rows = np.flatnonzero((all_data['id'] == fold['participant']) & (all_data['listnum'] == fold['held_out_list']))
+        representations = ast.literal_eval(fold['model'])
+
+        held_out_loss = build_model(len(representations)).score(
+            [all_data[f'{rep}_similarity'].values[rows] for rep in representations],
+            [remaining[rep].take(rows) for rep in representations],
+            fold[representations].values.astype(float),
+        )
+
+        assert fold['held_out_nrows'] == rows.shape[0]
+        assert fold['held_out_loss'] == pytest.approx(held_out_loss)
+        assert fold['baseline_held_out_loss'] == pytest.approx(np.log(n_remaining[rows]).sum())
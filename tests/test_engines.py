@@ -0,0 +1,112 @@
+"""Tests for the retrieval strength engines"""
+
+import numpy as np
+import pytest
+
+from memory_analyses.data.ragged import RaggedArray
+from memory_analyses.models.engines import _segment_reduce, get_engine
+from memory_analyses.models.fitting import build_model
+
+def _similarities():
+    """Three transitions, where the first and last have no remaining items"""
+
+    offsets = np.array([0, 0, 3, 3])
+    current = [np.array([0., 0.5, 0.5]), np.array([0., 0.2, 0.2])]
+    remaining = [RaggedArray(np.array([0.5, 0.3, 0.9]), offsets), RaggedArray(np.array([0.2, 0.4, 0.8]), offsets)]
+
+    return current, remaining
+
+def test_segment_reduce_empty_rows():
+    x = np.array([1., 2., 3., 4.])
+    offsets = np.array([0, 0, 2, 4, 4])
+
+    np.testing.assert_array_equal(_segment_reduce(np.add, x, offsets), [0., 3., 7., 0.])
+    np.testing.assert_array_equal(_segment_reduce(np.maximum, x, offsets, -np.inf), [-np.inf, 2., 4., -np.inf])
+
+@pytest.mark.parametrize('engine', ['segment', 'logspace', 'compact'])
+def test_empty_rows_match_loop_engine(engine):
+    current, remaining = _similarities()
+    weights = np.array([1., 2.])
+
+    loop = get_engine('loop')
+    expected = loop.retrieval_strengths(loop.prepare(current, remaining), weights)
+
+    engine = get_engine(engine)
+    data = engine.prepare(current, remaining)
+
+    np.testing.assert_allclose(engine.retrieval_strengths(data, weights), expected, rtol=1e-6)
+    np.testing.assert_allclose(engine.batch_retrieval_strengths(data, weights[None])[:, 0], expected, rtol=1e-6)
+    _, gradient = engine.retrieval_strengths_and_gradient(data, weights)
+
+    np.testing.assert_array_equal(gradient[[0, 2]], 0.)
+
+def test_approximate_prepare_is_independent_of_chunk_size():
+    random_state = np.random.RandomState(0)
+    lengths = random_state.randint(0, 300, size=20)
+    lengths[[0, 5]] = 0
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    current = [random_state.rand(20) for _ in range(2)]
+    remaining = [RaggedArray(random_state.rand(offsets[-1]).astype(np.float32), offsets) for _ in range(2)]
+    weights = np.array([1., 2.])
+
+    prepared = [
+        get_engine('topk', top_k=10, tail_samples=20, chunk_size=chunk_size).prepare(current, remaining)
+        for chunk_size in (1, 100, 1 << 20)
+    ]
+
+    engine = get_engine('topk')
+    for data in prepared[1:]:
+        np.testing.assert_array_equal(data.offsets, prepared[0].offsets)
+        np.testing.assert_array_equal(data.remaining, prepared[0].remaining)
+        np.testing.assert_array_equal(data.multiplier, prepared[0].multiplier)
+        np.testing.assert_array_equal(data.tail_max, prepared[0].tail_max)
+        np.testing.assert_array_equal(
+            engine.retrieval_strengths(data, weights), engine.retrieval_strengths(prepared[0], weights))
+
+    # the kept items of each approximated transition are its top_k for some probe, plus its tail sample
+    data = prepared[0]
+    approximated = ~data.exact
+    assert (np.diff(data.offsets)[approximated] <= 2 * 10 + 20).all()
+    kept = np.bincount(data.row_ids, weights=~data.sampled, minlength=len(data))
+    np.testing.assert_array_equal((kept + data.n_tail)[approximated], lengths[approximated])
+
+def _large_similarities(power, n=30, seed=0):
+    """Transitions with many remaining items (the first is the retrieved item), most of them barely similar"""
+
+    random_state = np.random.RandomState(seed)
+    offsets = np.concatenate([[0], np.cumsum(random_state.randint(100, 2000, size=n))])
+    current = [random_state.rand(n) * 0.5 + 0.5 for _ in range(2)]
+    remaining = [RaggedArray(random_state.rand(offsets[-1]) ** power, offsets) for _ in range(2)]
+
+    for sims, probe in zip(current, remaining):
+        probe.values[offsets[:-1]] = sims
+
+    return current, remaining
+
+@pytest.mark.parametrize('weights', [[1., 1.], [5., 2.], [20., 10.], [0., 3.]])
+def test_approximate_error_bound_covers_exact_error(weights):
+    current, remaining = _large_similarities(3)
+    weights = np.array(weights)
+
+    engine, exact = get_engine('topk', top_k=50, tail_samples=50), get_engine('segment')
+    data = engine.prepare(current, remaining)
+
+    error = np.abs(
+        np.log(engine.retrieval_strengths(data, weights))
+        - np.log(exact.retrieval_strengths(exact.prepare(current, remaining), weights))
+    )
+
+    assert (~data.exact).any()
+    assert (error <= engine.error_bound(data, weights) + 1e-12).all()
+
+def test_approximate_fit_is_within_max_error():
+    current, remaining = _large_similarities(20)
+    model = build_model(2, engine='topk', engine_args={'top_k': 50, 'tail_samples': 50, 'max_error': 0.01})
+    loss, weights, _ = model.fit(current, remaining)
+
+    # every approximated transition is within max_error at the final weights, so the loss is too
+    assert model.approximation_report['approximated'] > 0
+    assert model.approximation_report['max_bound'] <= 0.01
+    assert model.approximation_report['max_error'] <= 0.01
+    exact_loss = build_model(2).score(current, remaining, weights)
+    assert abs(loss - exact_loss) <= 0.01 * len(current[0])
@@ -0,0 +1,20 @@
+"""Tests for fitting the models of each condition"""
+
+import pytest
+
+from conftest import BASELINE, baseline_latex
+from memory_analyses import retrieval_model
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_jobs_match_baseline(transition_config, capsys, jobs):
+    retrieval_model.main(dict(transition_config, jobs=jobs))
+
+    assert capsys.readouterr().out == baseline_latex(BASELINE['all']) + '\n'
+
+def test_conditions_in_one_run_match_baseline(transition_config, capsys):
+    conditions = ['first', 'all', 'collapse']
+    retrieval_model.main(dict(transition_config, conditions=conditions, jobs=2))
+
+    # each condition's table is printed as when it is run on its own
+    assert capsys.readouterr().out == ''.join(
+        '% condition: {0}\n{1}\n'.format(condition, baseline_latex(BASELINE[condition])) for condition in conditions)
@@ -0,0 +1,37 @@
+"""Tests for choosing the optimiser's starting points"""
+
+import numpy as np
+
+from memory_analyses.models.optimise import ScipyMinimiser
+
+GRID = (0., 0.5, 1., 2., 5.)
+
+def _minimiser(**kwargs):
+    return ScipyMinimiser({'bounds': None}, grid=GRID, **kwargs)
+
+def test_candidates_small_grid_is_complete():
+    candidates = _minimiser().candidates(np.zeros(3))
+
+    # x0 is a grid point, so every candidate is one of the 5 ** 3 grid points
+    assert candidates.shape == (len(GRID) ** 3, 3)
+
+def test_candidates_large_grid_is_sampled():
+    k = 10
+    candidates = _minimiser(max_grid=4096).candidates(np.full(k, 0.25))
+
+    assert candidates.shape[1] == k
+    assert candidates.shape[0] <= 4096 + 1
+    assert any((candidates == 0.25).all(axis=1))
+
+    # the sampled points are on the grid, and each parameter takes every grid value
+    grid_points = candidates[~(candidates == 0.25).all(axis=1)]
+    assert np.isin(grid_points, GRID).all()
+    for column in grid_points.T:
+        np.testing.assert_array_equal(np.unique(column), GRID)
+
+def test_candidates_large_grid_is_seeded():
+    k = 10
+    first = _minimiser(seed=1).candidates(np.zeros(k))
+
+    np.testing.assert_array_equal(first, _minimiser(seed=1).candidates(np.zeros(k)))
+    assert not np.array_equal(first, _minimiser(seed=2).candidates(np.zeros(k)))
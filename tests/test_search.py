@@ -0,0 +1,31 @@
+"""Tests for choosing the representations to compare"""
+
+import pandas as pd
+import pytest
+
+from memory_analyses.models.search import resolve_representations
+
+def _table():
+    columns = ['id', 'listnum', 'cooc_similarity', 'w2v_similarity', 'hier_similarity', 'extra_similarity']
+    table = pd.DataFrame(columns=columns)
+
+    # the order of the remaining similarities follows the rem_* columns of the data
+    remaining = {'extra': None, 'hier': None, 'w2v': None, 'cooc': None}
+
+    return table, remaining
+
+def test_given_representations_keep_their_order():
+    table, remaining = _table()
+
+    assert resolve_representations(['cooc', 'w2v', 'hier'], table, remaining) == ['cooc', 'w2v', 'hier']
+
+def test_discover_uses_every_representation_in_the_data():
+    table, remaining = _table()
+
+    assert resolve_representations('discover', table, remaining) == ['extra', 'hier', 'w2v', 'cooc']
+
+def test_missing_representations_raise():
+    table, remaining = _table()
+
+    with pytest.raises(ValueError):
+        resolve_representations(['cooc', 'glove'], table, remaining)
@@ -0,0 +1,10 @@
+"""Tests for fitting raw retrieval sequences with memory-mapped similarity matrices"""
+
+from conftest import SIMULATED_BASELINE, baseline_latex
+from memory_analyses import retrieval_model
+
+def test_matrices_input_matches_baseline(simulated_config, capsys):
+    retrieval_model.main(dict(simulated_config, input='matrices'))
+
+    # the original analysis was run on the transition table of the same sequences
+    assert capsys.readouterr().out == baseline_latex(SIMULATED_BASELINE) + '\n'
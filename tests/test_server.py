@@ -0,0 +1,48 @@
+"""Tests for the local fitting service"""
+
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import HTTPServer
+
+import pytest
+
+from conftest import BASELINE, baseline_latex
+from memory_analyses.server import FitService, _handler
+
+@pytest.fixture
+def server(transition_config):
+    service = FitService(dict(transition_config, jobs=2))
+    server = HTTPServer(('127.0.0.1', 0), _handler(service))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield 'http://127.0.0.1:{0}'.format(server.server_address[1])
+
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+def _post(url, body):
+    request = urllib.request.Request(
+        url, data=json.dumps(body).encode('utf-8'), headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+def test_served_comparison_matches_baseline(server):
+    response = _post(server + '/compare', {'conditions': ['all', 'collapse', 'first']})
+
+    for condition in ('all', 'collapse', 'first'):
+        assert response[condition]['latex'] == baseline_latex(BASELINE[condition])
+
+    # a second request is answered by the same workers, with the same table
+    response = _post(server + '/compare', {'condition': 'collapse'})
+    assert response['collapse']['latex'] == baseline_latex(BASELINE['collapse'])
+
+def test_unknown_representation_is_a_bad_request(server):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        _post(server + '/fit', {'representations': ['cooc', 'glove']})
+
+    assert error.value.code == 400
+    assert 'glove' in json.loads(error.value.read().decode('utf-8'))['error']
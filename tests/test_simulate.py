@@ -0,0 +1,23 @@
+"""Tests for simulating retrieval sequences"""
+
+import numpy as np
+import pandas as pd
+
+from conftest import REPRESENTATIONS, SIMULATED_BASELINE, baseline_latex
+from memory_analyses import retrieval_model
+from memory_analyses.data.transitions import read_transition_table
+
+def test_simulated_table_matches_baseline(simulated_config, capsys):
+    retrieval_model.main(simulated_config)
+
+    assert capsys.readouterr().out == baseline_latex(SIMULATED_BASELINE) + '\n'
+
+def test_simulated_table_cache_matches_csv(simulated_config):
+    # the cache is written with the table rather than parsed from it
+    table, remaining = read_transition_table(simulated_config['transition_table'])
+    parsed, parsed_remaining = read_transition_table(simulated_config['transition_table'], cache=False)
+
+    pd.testing.assert_frame_equal(table, parsed)
+    for rep in REPRESENTATIONS:
+        np.testing.assert_array_equal(remaining[rep].values, parsed_remaining[rep].values)
+        np.testing.assert_array_equal(remaining[rep].offsets, parsed_remaining[rep].offsets)
@@ -0,0 +1,66 @@
+"""Tests for storing fit results and the participant blocks of each run"""
+
+import pandas as pd
+import pytest
+
+from memory_analyses import retrieval_model
+from memory_analyses.data.synthetic import generate_transition_table
+from memory_analyses.models.fitting import _model_params, build_model
+from memory_analyses.utilities.store import FitResultStore, fit_key
+
+def test_compare_blocks_does_not_record(tmp_path):
+    store = FitResultStore(str(tmp_path / 'fits.sqlite'))
+
+    assert store.compare_blocks('all', {'a': '1', 'b': '2'}) == (['a', 'b'], [], [])
+    assert store.compare_blocks('all', {'a': '1', 'b': '2'}) == (['a', 'b'], [], [])
+
+    store.update_blocks('all', {'a': '1', 'b': '2'})
+    assert store.compare_blocks('all', {'a': '1', 'b': '3', 'c': '4'}) == (['c'], ['b'], ['a'])
+    assert store.compare_blocks('first', {'a': '1'}) == (['a'], [], [])
+
+def test_fit_key_covers_every_setting():
+    def key(**kwargs):
+        return fit_key('digest', _model_params(build_model(2, **kwargs), ['cooc', 'w2v']))
+
+    assert key() == key(engine_args={})
+    assert key(engine='topk') == key(engine='topk', engine_args={'top_k': 100, 'chunk_size': 10})
+
+    # default engine settings, and multi-start settings, are part of the key even when not given explicitly
+    keys = [
+        key(), key(engine='logspace'), key(engine='topk'), key(engine='topk', engine_args={'max_error': 0.1}),
+        key(multi_start={'n_starts': 3}), key(multi_start={'n_starts': 3, 'seed': 1}),
+    ]
+    assert len(set(keys)) == len(keys)
+
+def _config(tmp_path):
+    path = str(tmp_path / 'transition_probs.csv')
+    table, _ = generate_transition_table(n_participants=3, n_lists=1, list_length=6, representations=['cooc', 'w2v'])
+    table.to_csv(path, index=False)
+
+    return {
+        'transition_table': path, 'condition': 'all', 'representations': ['cooc', 'w2v'], 'cache': False,
+        'fit_store': str(tmp_path / 'fits.sqlite'), 'fit_log': None,
+    }
+
+def _blocks(config):
+    store = FitResultStore(config['fit_store'])
+    blocks = pd.read_sql('SELECT * FROM blocks', store.connection)
+    store.close()
+
+    return blocks
+
+def test_blocks_are_recorded_after_their_fits(tmp_path, monkeypatch):
+    config = _config(tmp_path)
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    # an interrupted run does not record its participants, so the next run still fits them
+    with monkeypatch.context() as patch:
+        patch.setattr(retrieval_model, 'run_searches', interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            retrieval_model.main(dict(config))
+    assert _blocks(config).shape[0] == 0
+
+    retrieval_model.main(dict(config))
+    assert _blocks(config).shape[0] == 3
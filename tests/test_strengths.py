@@ -0,0 +1,74 @@
+"""Tests for exporting per-transition retrieval strengths"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from memory_analyses.data.ragged import RaggedArray
+from memory_analyses.data.strengths import StrengthsExport, read_strengths
+from memory_analyses.models.export import export_strengths
+
+def _export(directory, n_rows, columns):
+    export = StrengthsExport(directory, n_rows)
+    for name, values in columns.items():
+        export.write(name, np.arange(len(values)), values)
+    export.close()
+
+def test_existing_directory_is_not_removed(tmp_path):
+    directory = tmp_path / 'strengths'
+    directory.mkdir()
+    (directory / 'notes.txt').write_text('keep me')
+
+    with pytest.raises(ValueError):
+        StrengthsExport(str(directory), 3)
+
+    assert os.listdir(str(directory)) == ['notes.txt']
+
+def test_empty_directory_is_used(tmp_path):
+    directory = tmp_path / 'strengths'
+    directory.mkdir()
+
+    _export(str(directory), 3, {'baseline': [1., 2., 3.]})
+
+    np.testing.assert_array_equal(read_strengths(str(directory))['baseline'], [1., 2., 3.])
+
+def test_columns_are_extended(tmp_path):
+    directory = str(tmp_path / 'strengths')
+    _export(directory, 2, {'baseline': [1., 2.]})
+
+    StrengthsExport(directory, 4).close()
+
+    np.testing.assert_array_equal(read_strengths(directory)['baseline'], [1., 2., np.nan, np.nan])
+
+def test_shrinking_removes_only_the_export_columns(tmp_path):
+    directory = str(tmp_path / 'strengths')
+    _export(directory, 4, {'baseline': [1., 2., 3., 4.], 'all:cooc': [5., 6., 7., 8.]})
+    with open(os.path.join(directory, 'notes.txt'), 'w') as fp:
+        fp.write('keep me')
+
+    _export(directory, 2, {'all:w2v': [9., 10.]})
+
+    assert sorted(os.listdir(directory)) == ['col0.f8', 'meta.json', 'notes.txt']
+    strengths = read_strengths(directory)
+    assert list(strengths) == ['all:w2v']
+    np.testing.assert_array_equal(strengths['all:w2v'], [9., 10.])
+
+def test_rewritten_columns_do_not_keep_stale_rows(tmp_path):
+    directory = str(tmp_path / 'strengths')
+    _export(directory, 4, {'all:cooc': [1., 2., 3., 4.]})
+
+    # two participants of two transitions each, where only the first has a fit in this run
+    offsets = np.array([0, 2, 4, 6, 8])
+    current_sims = {'cooc': np.array([0.5, 0.2, 0.4, 0.1])}
+    subs_sims = {'cooc': RaggedArray(np.array([0.5, 0.1, 0.2, 0.3, 0.4, 0.6, 0.1, 0.2]), offsets)}
+    fitted = {('cooc',): pd.DataFrame({'cooc': [1., np.nan]})}
+
+    export = StrengthsExport(directory, 4)
+    export_strengths(export, 'all', current_sims, subs_sims, np.arange(4), [('a', 0, 2), ('b', 2, 4)], fitted)
+    export.close()
+
+    strengths = read_strengths(directory)['all:cooc']
+    assert np.isfinite(strengths[:2]).all()
+    assert np.isnan(strengths[2:]).all()
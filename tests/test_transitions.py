@@ -0,0 +1,60 @@
+"""Tests for loading transition tables"""
+
+import numpy as np
+import pandas as pd
+
+from memory_analyses.data.transitions import BASELINE_ITEMS, baseline_items, count_baseline_items, read_transition_table
+
+# numpy pads its printed arrays, so the rem_* strings have runs of spaces
+PADDED = ['[0.         0.04097352 0.5]', '[0.3 0.2]', '[0.38367755\n 0.99720994]']
+
+def _write_table(path):
+    pd.DataFrame({
+        'id': ['S000', 'S000', 'S001'],
+        'listnum': [1, 1, 1],
+        'hier_similarity': [0.5, 0.3, 0.38367755],
+        'rem_hier': PADDED,
+    }).to_csv(path, index=False)
+
+def test_count_baseline_items_counts_single_spaces():
+    counts = count_baseline_items(pd.Series(PADDED))
+
+    # the baseline has always split rem_hier on single spaces, which also counts the padding
+    np.testing.assert_array_equal(counts, [len(x.split(' ')) for x in PADDED])
+    np.testing.assert_array_equal(counts, [11, 2, 2])
+
+def test_baseline_items_differ_from_parsed_lengths(tmp_path):
+    path = str(tmp_path / 'transitions.csv')
+    _write_table(path)
+
+    # the first read parses the CSV, and the second reads the cache
+    for _ in range(2):
+        table, remaining = read_transition_table(path)
+
+        np.testing.assert_array_equal(remaining['hier'].lengths, [3, 2, 2])
+        np.testing.assert_array_equal(table[BASELINE_ITEMS].values, [11, 2, 2])
+        np.testing.assert_array_equal(baseline_items(table, remaining), [11, 2, 2])
+
+def test_baseline_items_without_rem_hier():
+    table = pd.DataFrame({'id': ['S000']})
+    remaining = {'cooc': type('Remaining', (), {'lengths': np.array([4])})()}
+
+    np.testing.assert_array_equal(baseline_items(table, remaining), [4])
+
+def test_appended_rows_match_a_fresh_parse(tmp_path):
+    path = str(tmp_path / 'transitions.csv')
+    _write_table(path)
+    read_transition_table(path)
+
+    # a longer participant id widens the cached id column, which is rewritten rather than appended to
+    pd.DataFrame({
+        'id': ['S0002'], 'listnum': [2], 'hier_similarity': [0.1], 'rem_hier': ['[0.1 0.2 0.3]'],
+    }).to_csv(path, index=False, header=False, mode='a')
+
+    table, remaining = read_transition_table(path)
+    parsed, parsed_remaining = read_transition_table(path, cache=False)
+
+    pd.testing.assert_frame_equal(table, parsed)
+    np.testing.assert_array_equal(remaining['hier'].values, parsed_remaining['hier'].values)
+    np.testing.assert_array_equal(remaining['hier'].offsets, parsed_remaining['hier'].offsets)
+    np.testing.assert_array_equal(remaining['hier'].digests, parsed_remaining['hier'].digests)